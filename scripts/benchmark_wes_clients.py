@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Compare the per-call cost of the bravado and direct WES clients of
+wfinterop (the 'workflow-service' client library uses the direct
+client) with that of the workflow-service library's own client,
+against a minimal local WES server, which runs in a separate process
+so that the CPU time reported is the client's alone.
+
+Usage:
+    python scripts/benchmark_wes_clients.py [--calls 2000]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+from wfinterop.util import response_handler
+from wfinterop.wes.client import DirectWESClient
+from wfinterop.wes.client import _build_wes_client
+from wfinterop.wes.client import _init_http_client
+
+
+class _WESHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # otherwise keep-alive responses stall on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        run_id = self.path.split('/')[-2]
+        body = json.dumps({'run_id': run_id,
+                           'state': 'RUNNING'}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _LibraryClient(object):
+    """
+    The workflow-service library's client, called as a WES API client.
+    """
+    def __init__(self, opts):
+        from wes_client.util import WESClient
+        self.client = WESClient(service=opts)
+
+    def GetRunStatus(self, run_id):
+        return self.client.get_run_status(run_id)
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _serve(port_queue):
+    server = _Server(('127.0.0.1', 0), _WESHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def _cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+
+def benchmark(client, calls):
+    """
+    Return the wall-clock and CPU seconds per GetRunStatus call.
+    """
+    response_handler(client.GetRunStatus(run_id='warm-up'))
+    wall, cpu = time.time(), _cpu_time()
+    for i in range(calls):
+        response_handler(client.GetRunStatus(run_id='run-{}'.format(i)))
+    return ((time.time() - wall) / calls, (_cpu_time() - cpu) / calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(port_queue,))
+    server.daemon = True
+    server.start()
+    opts = {'auth': {'Authorization': ''},
+            'proto': 'http',
+            'host': '127.0.0.1:{}'.format(port_queue.get())}
+
+    clients = [
+        ('bravado', _build_wes_client('benchmark', opts,
+                                      _init_http_client(opts=opts), None)),
+        ('direct', DirectWESClient(opts)),
+        ('wes-service lib', _LibraryClient(opts))
+    ]
+    print('{:<18}{:>14}{:>14}'.format('client', 'wall ms/call',
+                                      'cpu ms/call'))
+    try:
+        for name, client in clients:
+            wall, cpu = benchmark(client, args.calls)
+            print('{:<18}{:>14.3f}{:>14.3f}'.format(name, wall * 1000,
+                                                    cpu * 1000))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
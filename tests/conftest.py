@@ -12,6 +12,51 @@ logger = logging.getLogger(__name__)
 mock_start_time = dt.datetime.now()
 
 
+@pytest.fixture(autouse=True)
+def clear_client_cache():
+    # API clients are cached per process; don't share them across tests
+    from wfinterop.wes.client import invalidate_wes_client
+    from wfinterop.trs.client import invalidate_trs_client
+    invalidate_wes_client()
+    invalidate_trs_client()
+    yield
+    invalidate_wes_client()
+    invalidate_trs_client()
+
+
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    # failures recorded for mock endpoints shouldn't leak across tests
+    from wfinterop.resilience import reset_circuits
+    reset_circuits()
+    yield
+    reset_circuits()
+
+
+@pytest.fixture(autouse=True)
+def clear_service_cache():
+    from wfinterop.response_cache import service_cache
+    service_cache.invalidate()
+    yield
+    service_cache.join()
+    service_cache.invalidate()
+
+
+@pytest.fixture(autouse=True)
+def mock_blob_dir(tmpdir, monkeypatch):
+    # keep cached attachments out of the package directory
+    blob_dir = tmpdir.join('blobs')
+    monkeypatch.setattr('wfinterop.blobs.blob_dir', str(blob_dir))
+    yield blob_dir
+
+
+@pytest.fixture(autouse=True)
+def mock_trs_cache_dir(tmpdir, monkeypatch):
+    cache_dir = tmpdir.join('trs_cache')
+    monkeypatch.setattr('wfinterop.trs.cache.cache_dir', str(cache_dir))
+    yield cache_dir
+
+
 @pytest.fixture()
 def mock_queue_config():
     mock_queue_config = {
@@ -83,14 +128,6 @@ def mock_orchestratorconfig(tmpdir,
     yield mock_config_file
 
 
-@pytest.fixture()
-def mock_client_lib(request):
-    mock_wes_client = mock.Mock(name='mock WESClient')
-    with mock.patch('wes_client.util.WESClient', 
-                    autospec=True, spec_set=True):
-        yield mock_wes_client
-
-
 @pytest.fixture()
 def mock_trs_client():
     mock_api_client = mock.Mock(name='mock SwaggerClient')
@@ -153,4 +190,21 @@ def mock_queue_log(request):
                      'elapsed_time': 0,
                      'wes_id': 'mock_wes'}
     }
-    yield mock_queue_log
\ No newline at end of file
+    yield mock_queue_log
+
+@pytest.fixture(params=['json', 'sqlite'])
+def mock_submission_store(request, tmpdir, monkeypatch):
+    # an empty submission queue, stored either as JSON or in SQLite
+    mock_queue_file = tmpdir.join('submission_queue.json')
+    mock_queue_file.write('{}')
+    mock_db_file = tmpdir.join('submission_queue.db')
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_queue_file))
+    monkeypatch.setattr('wfinterop.queue.submission_db',
+                        str(mock_db_file))
+    monkeypatch.setattr('wfinterop.queue.archive_dir',
+                        str(tmpdir.join('submission_archive')))
+    if request.param == 'sqlite':
+        from wfinterop.queue import migrate_queue
+        migrate_queue()
+    yield request.param
@@ -0,0 +1,93 @@
+import hashlib
+import os
+
+import mock
+
+from wfinterop.blobs import BlobStore
+from wfinterop.blobs import get_blob_store
+
+
+def test_put_bytes_dedup(mock_blob_dir):
+    # GIVEN a blob store
+    store = get_blob_store()
+
+    # WHEN the same content is stored twice
+    test_digest = store.put_bytes(b'mock content')
+    test_digest_2 = store.put_bytes(u'mock content')
+
+    # THEN it is stored once, under its SHA-256 digest
+    assert test_digest == hashlib.sha256(b'mock content').hexdigest()
+    assert test_digest_2 == test_digest
+    with open(store.blob_path(test_digest), 'rb') as f:
+        assert f.read() == b'mock content'
+    assert len(mock_blob_dir.listdir(lambda p: p.isdir())) == 1
+
+
+def test_put_file_unchanged(tmpdir, mock_blob_dir):
+    # GIVEN a file that has been stored
+    mock_file = tmpdir.join('mock.txt')
+    mock_file.write_binary(b'mock content')
+    store = BlobStore(str(mock_blob_dir))
+    test_digest = store.put_file(str(mock_file))
+
+    # WHEN it is stored again, by a new store using the same directory
+    new_store = BlobStore(str(mock_blob_dir))
+    with mock.patch.object(new_store, 'put_chunks') as mock_put:
+        test_digest_2 = new_store.resolve('file://' + str(mock_file))
+
+    # THEN it isn't read or hashed again
+    assert test_digest_2 == test_digest
+    mock_put.assert_not_called()
+
+
+def test_put_file_changed(tmpdir, mock_blob_dir):
+    # GIVEN a file that changed since it was stored
+    mock_file = tmpdir.join('mock.txt')
+    mock_file.write_binary(b'mock content')
+    store = get_blob_store()
+    test_digest = store.put_file(str(mock_file))
+    mock_file.write_binary(b'new mock content')
+    os.utime(str(mock_file), (0, 0))
+
+    # WHEN it is stored again
+    test_digest_2 = store.put_file(str(mock_file))
+
+    # THEN the new content is stored
+    assert test_digest_2 != test_digest
+    assert test_digest_2 == hashlib.sha256(b'new mock content').hexdigest()
+
+
+def test_put_url(mock_blob_dir, monkeypatch):
+    # GIVEN a remote attachment
+    mock_session = mock.Mock(name='mock Session')
+    mock_session.get.return_value.iter_content.return_value = [b'mock ',
+                                                               b'content']
+    monkeypatch.setattr('wfinterop.blobs.get_session',
+                        lambda opts: mock_session)
+    store = get_blob_store()
+
+    # WHEN it is resolved twice
+    test_digest = store.resolve('https://mock.org/mock.cwl')
+    test_digest_2 = store.resolve('https://mock.org/mock.cwl')
+
+    # THEN it is downloaded once
+    assert test_digest == test_digest_2
+    assert mock_session.get.call_count == 1
+    with open(store.blob_path(test_digest), 'rb') as f:
+        assert f.read() == b'mock content'
+
+
+def test_put_url_content(mock_blob_dir, monkeypatch):
+    # GIVEN remote content that is already known
+    mock_session = mock.Mock(name='mock Session')
+    monkeypatch.setattr('wfinterop.blobs.get_session',
+                        lambda opts: mock_session)
+    store = get_blob_store()
+    store.put_url('https://mock.org/mock.cwl', content='mock content')
+
+    # WHEN the URL is resolved
+    test_digest = store.resolve('https://mock.org/mock.cwl')
+
+    # THEN it isn't downloaded
+    assert test_digest == hashlib.sha256(b'mock content').hexdigest()
+    mock_session.get.assert_not_called()
@@ -1,8 +1,11 @@
 import logging
 import mock
+import os
 import pytest
 import yaml
 
+import wfinterop.config
+
 from wfinterop.config import queue_config
 from wfinterop.config import trs_config
 from wfinterop.config import wes_config
@@ -10,6 +13,11 @@ from wfinterop.config import add_queue
 from wfinterop.config import add_toolregistry
 from wfinterop.config import add_workflowservice
 from wfinterop.config import set_yaml
+from wfinterop.config import modify_yaml
+from wfinterop.config import add_wes_opt
+from wfinterop.config import add_from_manifest
+from wfinterop.config import transaction
+from wfinterop.config import shard_config
 from wfinterop.config import show
 
 logging.basicConfig(level=logging.DEBUG)
@@ -28,6 +36,41 @@ def test_queue_config(mock_orchestratorconfig, mock_queue_config, monkeypatch):
     assert(test_config == mock_queue_config)
 
 
+def test_queue_config_cache(mock_orchestratorconfig, 
+                            mock_queue_config, 
+                            monkeypatch):
+    # GIVEN an orchestrator config file that has been loaded once
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    queue_config()['mock_queue_1']['wes_opts'].append('mutated')
+
+    # WHEN the configuration is requested again
+    mock_loads = []
+    monkeypatch.setattr('wfinterop.config.get_yaml', 
+                        lambda x: mock_loads.append(x))
+    test_config = queue_config()
+
+    # THEN the file is not parsed again and callers' changes to
+    # earlier copies are not visible
+    assert(mock_loads == [])
+    assert(test_config == mock_queue_config)
+
+
+def test_queue_config_invalidation(mock_orchestratorconfig, monkeypatch):
+    # GIVEN an orchestrator config file that has been loaded once
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    queue_config()
+
+    # WHEN the file is changed by another process
+    mock_config = {'queues': {}, 'toolregistries': {},
+                   'workflowservices': {}}
+    mock_orchestratorconfig.write(yaml.dump(mock_config))
+
+    # THEN the new configuration is loaded
+    assert(queue_config() == {})
+
+
 def test_trs_config(mock_orchestratorconfig, mock_trs_config, monkeypatch):
     # GIVEN an orchestrator config file exists
     monkeypatch.setattr('wfinterop.config.config_path', 
@@ -155,3 +198,226 @@ def test_set_yaml(mock_orchestratorconfig, monkeypatch):
     assert('mock_section' in test_config)
     assert('mock_service' in test_config['mock_section'])
     assert(test_config['mock_section']['mock_service'] == {})
+
+
+def test_modify_yaml(mock_orchestratorconfig, monkeypatch):
+    # GIVEN an orchestrator config file exists
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+
+    # WHEN the config for a service is modified in place
+    modify_yaml(
+        section='toolregistries',
+        service='mock_trs',
+        change=lambda current: dict(current, host='mock_host')
+    )
+
+    # THEN the change is applied to the stored config and saved
+    with open(str(mock_orchestratorconfig), 'r') as f:
+        test_config = yaml.load(f)['toolregistries']
+
+    assert(test_config['mock_trs']['host'] == 'mock_host')
+    assert(test_config['mock_trs']['proto'] == 'https')
+
+
+def test_add_wes_opt(mock_orchestratorconfig, monkeypatch):
+    # GIVEN an orchestrator config file exists
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+
+    # WHEN a WES endpoint is added to the options of several queues
+    add_wes_opt(['mock_queue_1', 'mock_queue_2'], 'mock_wes',
+                make_default=True)
+
+    # THEN each queue config lists the WES endpoint as its default
+    with open(str(mock_orchestratorconfig), 'r') as f:
+        test_config = yaml.load(f)['queues']
+
+    for queue_id in ['mock_queue_1', 'mock_queue_2']:
+        assert(test_config[queue_id]['wes_opts'] == ['local', 'mock_wes'])
+        assert(test_config[queue_id]['wes_default'] == 'mock_wes')
+
+
+def test_transaction(mock_orchestratorconfig, monkeypatch):
+    # GIVEN an orchestrator config file exists
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    mock_saves = []
+    monkeypatch.setattr('wfinterop.config.save_yaml', 
+                        lambda x, y: mock_saves.append(y))
+
+    # WHEN many edits are made inside a transaction
+    with transaction():
+        for i in range(100):
+            add_queue(queue_id='mock_queue_{}'.format(i),
+                      wf_type='CWL',
+                      wf_id='mock_wf')
+        add_wes_opt(['mock_queue_{}'.format(i) for i in range(100)],
+                    'mock_wes')
+        # reads inside the transaction see pending edits
+        assert(queue_config()['mock_queue_99']['wes_opts'] == 
+               ['local', 'mock_wes'])
+
+    # THEN they are saved in a single write
+    assert(len(mock_saves) == 1)
+    assert(len(mock_saves[0]['queues']) == 100)
+
+
+def test_transaction_rollback(mock_orchestratorconfig, monkeypatch):
+    # GIVEN an orchestrator config file exists
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+
+    # WHEN a transaction fails part-way
+    with pytest.raises(KeyError):
+        with transaction():
+            add_queue(queue_id='mock_queue', wf_type='CWL', wf_id='mock_wf')
+            add_wes_opt('missing_queue', 'mock_wes')
+
+    # THEN none of its edits are saved
+    assert('mock_queue' not in queue_config())
+
+
+def test_add_from_manifest(mock_orchestratorconfig, tmpdir, monkeypatch):
+    # GIVEN an orchestrator config file and a testbed manifest
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    mock_manifest = {
+        'toolregistries': {'mock_trs_2': {'host': 'trs_host'}},
+        'workflowservices': {'mock_wes_2': {'host': 'wes_host',
+                                            'proto': 'http'}},
+        'queues': {'mock_queue_3': {'wf_type': 'CWL',
+                                    'wf_id': 'mock_wf',
+                                    'trs_id': 'mock_trs_2',
+                                    'wes_opts': ['mock_wes_2']}}
+    }
+    mock_manifest_file = tmpdir.join('manifest.yaml')
+    mock_manifest_file.write(yaml.dump(mock_manifest))
+
+    # WHEN the manifest is registered
+    test_counts = add_from_manifest(str(mock_manifest_file))
+
+    # THEN every entry is added to the config
+    assert(test_counts == {'queues': 1,
+                           'toolregistries': 1,
+                           'workflowservices': 1})
+    assert(trs_config()['mock_trs_2']['host'] == 'trs_host')
+    assert(wes_config()['mock_wes_2']['proto'] == 'http')
+    assert(queue_config()['mock_queue_3']['wes_opts'] == ['mock_wes_2'])
+    assert('mock_queue_1' in queue_config())
+
+
+@pytest.fixture()
+def mock_sharded_config(mock_orchestratorconfig, tmpdir, monkeypatch):
+    monkeypatch.setattr('wfinterop.config.config_path',
+                        str(mock_orchestratorconfig))
+    monkeypatch.setattr('wfinterop.config.config_dir',
+                        str(tmpdir.join('config.d')))
+    yield shard_config()
+
+
+def test_shard_config(mock_sharded_config,
+                      mock_queue_config,
+                      mock_trs_config,
+                      mock_wes_config):
+    # GIVEN a config file that has been converted to the sharded layout
+    # WHEN the configuration is loaded
+    # THEN every entry is kept, in its own file
+    assert(mock_sharded_config == {'queues': len(mock_queue_config),
+                                   'toolregistries': len(mock_trs_config),
+                                   'workflowservices': len(mock_wes_config)})
+    assert(queue_config() == mock_queue_config)
+    assert(trs_config() == mock_trs_config)
+    assert(wes_config() == mock_wes_config)
+
+
+def test_shard_config_interrupted(mock_orchestratorconfig,
+                                  mock_queue_config,
+                                  tmpdir,
+                                  monkeypatch):
+    # GIVEN a config directory left without an index by a conversion
+    # that was interrupted
+    monkeypatch.setattr('wfinterop.config.config_path',
+                        str(mock_orchestratorconfig))
+    monkeypatch.setattr('wfinterop.config.config_dir',
+                        str(tmpdir.join('config.d')))
+    tmpdir.join('config.d', 'queues', 'mock_queue_1.yaml').ensure()
+
+    # WHEN the configuration is loaded, and converted again
+    test_config = queue_config()['mock_queue_1']
+    shard_config()
+
+    # THEN the config file is used until the conversion completes
+    assert(test_config == mock_queue_config['mock_queue_1'])
+    assert(tmpdir.join('config.d', 'index.yaml').check())
+    assert(queue_config() == mock_queue_config)
+    assert([path.basename for path in tmpdir.listdir()
+            if path.basename.startswith('.config.d')] == [])
+
+
+def test_sharded_config_lookup(mock_sharded_config, 
+                               mock_queue_config, 
+                               monkeypatch):
+    # GIVEN a sharded config
+    mock_loads = []
+    get_yaml = wfinterop.config.get_yaml
+    def mock_get_yaml(path):
+        mock_loads.append(os.path.basename(path))
+        return get_yaml(path)
+    monkeypatch.setattr('wfinterop.config.get_yaml', mock_get_yaml)
+
+    # WHEN one queue entry is looked up
+    test_config = queue_config()['mock_queue_1']
+
+    # THEN only the index and that entry are parsed
+    assert(test_config == mock_queue_config['mock_queue_1'])
+    assert(sorted(mock_loads) == ['index.yaml', 'mock_queue_1.yaml'])
+
+
+def test_sharded_config_add_queue(mock_sharded_config, tmpdir):
+    # GIVEN a sharded config
+    # WHEN a new queue is added
+    add_queue(queue_id='mock_queue/3',
+              wf_type='CWL',
+              wf_id='mock_wf')
+
+    # THEN the queue gets its own file and is listed in the index
+    assert(tmpdir.join('config.d', 'queues', 
+                       'mock_queue%2F3.yaml').check())
+    assert(queue_config()['mock_queue/3']['workflow_id'] == 'mock_wf')
+    assert('mock_queue_1' in queue_config())
+
+
+def test_sharded_config_transaction_rollback(mock_sharded_config):
+    # GIVEN a sharded config
+    # WHEN a transaction fails after adding a queue
+    with pytest.raises(RuntimeError):
+        with transaction():
+            add_queue(queue_id='mock_queue_3',
+                      wf_type='CWL',
+                      wf_id='mock_wf')
+            assert('mock_queue_3' in queue_config())
+            raise RuntimeError()
+
+    # THEN the queue is not added
+    assert('mock_queue_3' not in queue_config())
+
+
+def test_show_sharded(mock_orchestratorconfig, 
+                      tmpdir, 
+                      monkeypatch, 
+                      capsys):
+    # GIVEN the output of show for a config file
+    monkeypatch.setattr('wfinterop.config.config_path',
+                        str(mock_orchestratorconfig))
+    monkeypatch.setattr('wfinterop.config.config_dir',
+                        str(tmpdir.join('config.d')))
+    show()
+    mock_output = capsys.readouterr().out
+
+    # WHEN the config is sharded and shown again
+    shard_config()
+    show()
+
+    # THEN the output is the same
+    assert(capsys.readouterr().out == mock_output)
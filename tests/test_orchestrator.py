@@ -1,10 +1,13 @@
+import copy
 import mock
 import pytest
+import time
 import datetime as dt
 
 from bravado.requests_client import RequestsClient
 from bravado.client import SwaggerClient, ResourceDecorator
 from bravado.testing.response_mocks import BravadoResponseMock
+from requests.exceptions import ConnectionError
 
 from wfinterop.wes.wrapper import WES
 from wfinterop.orchestrator import run_job
@@ -13,6 +16,16 @@ from wfinterop.orchestrator import run_queue
 from wfinterop.orchestrator import run_all
 from wfinterop.orchestrator import monitor_queue
 from wfinterop.orchestrator import monitor
+from wfinterop.orchestrator import PollScheduler
+from wfinterop.orchestrator import warm_up
+from wfinterop.orchestrator import queue_ready
+from wfinterop.queue import create_submissions
+from wfinterop.queue import get_submissions
+from wfinterop.queue import get_submission_bundle
+from wfinterop.queue import update_submission
+from wfinterop.blobs import get_blob_store
+from wfinterop.resilience import CircuitOpenError
+from wfinterop.__main__ import main
 
 
 def test_run_job(mock_queue_config, mock_submission, mock_wes, monkeypatch):
@@ -24,8 +37,8 @@ def test_run_job(mock_queue_config, mock_submission, mock_wes, monkeypatch):
                         lambda **kwargs: None)
     monkeypatch.setattr('wfinterop.orchestrator.WES', 
                         lambda wes_id: mock_wes)
-    monkeypatch.setattr('wfinterop.orchestrator.update_submission', 
-                        lambda w,x,y,z: None)
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: None)
 
     mock_request = {'workflow_url': None,
                     'workflow_params': mock_submission['mock_sub']['data'],
@@ -47,8 +60,8 @@ def test_run_submission(mock_submission,
                         monkeypatch):
     monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
                         lambda x,y: mock_submission['mock_sub'])
-    monkeypatch.setattr('wfinterop.orchestrator.update_submission', 
-                        lambda w,x,y,z: None)
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: None)
 
     mock_run_log = {'run_id': 'mock_run',
                     'start_time': '',
@@ -68,6 +81,12 @@ def test_run_queue(mock_queue_config, mock_submission, monkeypatch):
                         lambda: mock_queue_config)
     monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
                         lambda x,status: ['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.claim_submissions', 
+                        lambda x,y: y)
+    monkeypatch.setattr('wfinterop.orchestrator.release_stale_claims', 
+                        lambda **kwargs: [])
+    monkeypatch.setattr('wfinterop.orchestrator.renew_claim', 
+                        lambda x,y: True)
     monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
                         lambda x,y: mock_submission['mock_sub'])
     mock_run_log = {'run_id': '',
@@ -75,7 +94,9 @@ def test_run_queue(mock_queue_config, mock_submission, monkeypatch):
                     'type': '',
                     'status': 'QUEUED'}
     monkeypatch.setattr('wfinterop.orchestrator.run_submission', 
-                        lambda x,y,z: mock_run_log)
+                        lambda x,y,z,batch: mock_run_log)
+    monkeypatch.setattr('wfinterop.orchestrator.update_claimed_submissions', 
+                        lambda x,y: [])
 
     test_queue_log = run_queue(queue_id='mock_queue_1', 
                                wes_id='local')
@@ -90,6 +111,156 @@ def test_run_queue(mock_queue_config, mock_submission, monkeypatch):
                 for key in log_fields])
 
 
+def test_run_queue_endpoint_down(mock_submission, monkeypatch):
+    # GIVEN a queue with submissions for a WES endpoint that is down
+    # and one that is up
+    mock_bundles = {'mock_sub_1': dict(mock_submission['mock_sub'], 
+                                       wes_id='mock_wes_down'),
+                    'mock_sub_2': dict(mock_submission['mock_sub'], 
+                                       wes_id='mock_wes')}
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
+                        lambda x,status: ['mock_sub_1', 'mock_sub_2'])
+    monkeypatch.setattr('wfinterop.orchestrator.claim_submissions', 
+                        lambda x,y: sorted(y))
+    monkeypatch.setattr('wfinterop.orchestrator.release_stale_claims', 
+                        lambda **kwargs: [])
+    monkeypatch.setattr('wfinterop.orchestrator.renew_claim', 
+                        lambda x,y: True)
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
+                        lambda x,y: mock_bundles[y])
+    def mock_run_submission(queue_id, sub_id, wes_id, batch):
+        if wes_id == 'mock_wes_down':
+            raise CircuitOpenError()
+        batch[sub_id] = {'status': 'SUBMITTED'}
+        return {'run_id': 'mock_run', 'status': 'QUEUED'}
+    monkeypatch.setattr('wfinterop.orchestrator.run_submission', 
+                        mock_run_submission)
+    mock_writes = []
+    monkeypatch.setattr('wfinterop.orchestrator.update_claimed_submissions', 
+                        lambda x,y: mock_writes.append((x, y)))
+
+    # WHEN the queue is run
+    test_queue_log = run_queue(queue_id='mock_queue_1')
+
+    # THEN the submission for the healthy endpoint is run, and the
+    # other is left in the queue
+    assert list(test_queue_log) == ['mock_sub_2']
+    assert mock_writes == [
+        ('mock_queue_1', {'mock_sub_2': {'status': 'SUBMITTED'}}),
+        ('mock_queue_1', {'mock_sub_1': {'status': 'RECEIVED'}})]
+
+
+
+def test_run_queue_status_down(mock_queue_config, mock_submission, mock_wes,
+                               monkeypatch):
+    # GIVEN a WES endpoint that creates a run, then fails to report
+    # its status
+    monkeypatch.setattr('wfinterop.orchestrator.queue_config', 
+                        lambda: mock_queue_config)
+    monkeypatch.setattr('wfinterop.orchestrator.fetch_queue_workflow', 
+                        lambda x: mock_queue_config[x])
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
+                        lambda x,status: ['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.claim_submissions', 
+                        lambda x,y: sorted(y))
+    monkeypatch.setattr('wfinterop.orchestrator.release_stale_claims', 
+                        lambda **kwargs: [])
+    monkeypatch.setattr('wfinterop.orchestrator.renew_claim', 
+                        lambda x,y: True)
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
+                        lambda x,y: mock_submission['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.WES', 
+                        lambda wes_id: mock_wes)
+    mock_wes.run_workflow.return_value = {'run_id': 'mock_run'}
+    mock_wes.get_run_status.side_effect = ConnectionError()
+    mock_writes = []
+    monkeypatch.setattr('wfinterop.orchestrator.update_claimed_submissions', 
+                        lambda x,y: mock_writes.append(y))
+
+    # WHEN the queue is run
+    test_queue_log = run_queue(queue_id='mock_queue_1')
+
+    # THEN the run is recorded as submitted, for the monitor to check
+    test_fields = mock_writes[0]['mock_sub']
+    assert test_fields['status'] == 'SUBMITTED'
+    assert test_fields['run_log']['run_id'] == 'mock_run'
+    assert test_fields['run_log']['status'] == 'UNKNOWN'
+    assert test_queue_log['mock_sub']['run_id'] == 'mock_run'
+
+
+
+def test_run_queue_bulk_submitted(mock_orchestratorconfig, mock_queue_config,
+                                  mock_submission_store, tmpdir,
+                                  monkeypatch):
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    mock_wf_config = dict(
+        mock_queue_config['mock_queue_1'],
+        workflow_url='file://tests/testdata/md5sum.cwl',
+        workflow_attachments=['file://tests/testdata/md5sum.input'])
+    monkeypatch.setattr('wfinterop.orchestrator.queue_config', 
+                        lambda: {'mock_queue_1': mock_wf_config})
+    mock_session = mock.Mock(name='mock Session')
+    test_bodies = []
+
+    def mock_post(url, data, headers):
+        test_bodies.append(b''.join(iter(lambda: data.read(8192), b'')))
+        mock_response = mock.Mock(status_code=200)
+        mock_response.json.return_value = {'run_id': 'mock_run'}
+        return mock_response
+    mock_session.post.side_effect = mock_post
+    mock_session.request.return_value.json.return_value = {
+        'run_id': 'mock_run', 'state': 'QUEUED'}
+    monkeypatch.setattr('wfinterop.wes.client.get_session', 
+                        lambda opts: mock_session)
+    # GIVEN a job queued from a parameters file with the CLI
+    mock_params = tmpdir.join('params.jsonl')
+    mock_params.write('{"input_file": {"class": "File", '
+                      '"path": "md5sum.input"}}\n')
+    main(['submit', 'mock_queue_1', str(mock_params),
+          '--wes-id', 'mock_wes'])
+
+    # WHEN the queue is run
+    test_queue_log = run_queue(queue_id='mock_queue_1')
+
+    # THEN the job's parameters are sent to WES as a JSON string
+    assert [run_log['run_id'] for run_log in test_queue_log.values()] == [
+        'mock_run']
+    assert (b'name="workflow_params"\r\n\r\n{"input_file": '
+            in test_bodies[0])
+
+
+def test_run_queue_claim_lost(mock_submission_store, monkeypatch):
+    # GIVEN two claimed submissions, one of which is released and
+    # claimed by another worker while the other is run
+    test_ids = create_submissions('mock_queue_1', ['mock_1', 'mock_2'],
+                                  wes_id='mock_wes')
+    test_runs = []
+    def mock_run_submission(queue_id, sub_id, wes_id, batch):
+        test_runs.append(sub_id)
+        for test_id in test_ids:
+            if test_id != sub_id:
+                update_submission(queue_id, test_id, 'claimed_by',
+                                  'mock_worker')
+        batch[sub_id] = {'status': 'SUBMITTED',
+                         'run_log': {'run_id': 'mock_run'}}
+        return batch[sub_id]['run_log']
+    monkeypatch.setattr('wfinterop.orchestrator.run_submission', 
+                        mock_run_submission)
+
+    # WHEN the queue is run
+    run_queue(queue_id='mock_queue_1')
+
+    # THEN only the submission still claimed is run and saved, and the
+    # other worker's claim is left alone
+    test_lost = [test_id for test_id in test_ids
+                 if test_id not in test_runs]
+    assert len(test_runs) == 1
+    assert get_submissions('mock_queue_1', status='SUBMITTED') == test_runs
+    assert get_submission_bundle('mock_queue_1', test_lost[0])[
+        'claimed_by'] == 'mock_worker'
+
+
 def test_run_all(mock_queue_config, monkeypatch):
     monkeypatch.setattr('wfinterop.orchestrator.queue_config', 
                         lambda: mock_queue_config)
@@ -123,6 +294,66 @@ def test_run_all(mock_queue_config, monkeypatch):
     assert test_orchestrator_log == mock_orchestrator_log
 
 
+
+def test_warm_up(mock_queue_config, tmpdir, monkeypatch):
+    monkeypatch.setattr('wfinterop.orchestrator._queue_status', {})
+    monkeypatch.setattr('wfinterop.orchestrator.queue_config', 
+                        lambda: mock_queue_config)
+    mock_attachment = tmpdir.join('tool.cwl')
+    mock_attachment.write('mock tool')
+    # GIVEN one queue whose workflow can be fetched, and one whose
+    # registry is down
+    mock_fetched = dict(mock_queue_config['mock_queue_1'],
+                        workflow_url='mock_wf_url',
+                        workflow_attachments=['file://' + str(
+                            mock_attachment)])
+
+    def mock_fetch(queue_id):
+        if queue_id == 'mock_queue_2':
+            raise ConnectionError('registry down')
+        return mock_fetched
+    monkeypatch.setattr('wfinterop.orchestrator.fetch_queue_workflow', 
+                        mock_fetch)
+    mock_wes_ids = []
+    monkeypatch.setattr('wfinterop.orchestrator.WES', 
+                        lambda wes_id: mock_wes_ids.append(wes_id))
+
+    # WHEN the queues are warmed up
+    test_statuses = warm_up()
+
+    # THEN each queue's readiness is reported, with the attachments
+    # of the ready queue cached and its WES clients built
+    assert test_statuses['mock_queue_1']['ready']
+    assert test_statuses['mock_queue_1']['attachments'] == 1
+    assert not test_statuses['mock_queue_2']['ready']
+    assert test_statuses['mock_queue_2']['error'] == 'registry down'
+    assert queue_ready('mock_queue_1')
+    assert not queue_ready('mock_queue_2')
+    assert mock_wes_ids == ['local']
+    assert (str(mock_attachment) in
+            get_blob_store()._load_index()['files'])
+
+
+def test_run_all_warm(mock_queue_config, monkeypatch):
+    mock_queue_status = {}
+    monkeypatch.setattr('wfinterop.orchestrator._queue_status', 
+                        mock_queue_status)
+    monkeypatch.setattr('wfinterop.orchestrator.queue_config', 
+                        lambda: mock_queue_config)
+    # GIVEN two queues, one of which fails to warm up
+    monkeypatch.setattr(
+        'wfinterop.orchestrator._warm_up_queue',
+        lambda queue_id, refresh: mock_queue_status.setdefault(
+            queue_id, {'ready': queue_id == 'mock_queue_1'}))
+    monkeypatch.setattr('wfinterop.orchestrator.run_queue', 
+                        lambda x: {'mock_sub': {}})
+
+    # WHEN all queues are run after warming up
+    test_orchestrator_log = run_all(warm=True)
+
+    # THEN only the ready queue is run
+    assert test_orchestrator_log == {'mock_queue_1': {'mock_sub': {}}}
+
 def test_monitor_queue(mock_submission, mock_queue_log, mock_wes, monkeypatch):
     monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
                         lambda **kwargs: ['mock_sub'])
@@ -134,8 +365,8 @@ def test_monitor_queue(mock_submission, mock_queue_log, mock_wes, monkeypatch):
                         lambda x: 0)
     monkeypatch.setattr('wfinterop.orchestrator.ctime2datetime', 
                         lambda x: dt.datetime.now())
-    monkeypatch.setattr('wfinterop.orchestrator.update_submission', 
-                        lambda w,x,y,z: None)
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: None)
     
     mock_wes.get_run_status.return_value = {'run_id': 'mock_run', 
                                             'state': 'RUNNING'}
@@ -146,5 +377,247 @@ def test_monitor_queue(mock_submission, mock_queue_log, mock_wes, monkeypatch):
     assert test_queue_log == mock_queue_log
 
 
+def test_monitor_queue_single_write(mock_submission, mock_wes, monkeypatch):
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
+                        lambda **kwargs: ['mock_sub_1', 'mock_sub_2'])
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
+                        lambda x,y: mock_submission['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.WES', 
+                        lambda wes_id: mock_wes)
+    monkeypatch.setattr('wfinterop.orchestrator.convert_timedelta', 
+                        lambda x: 0)
+    monkeypatch.setattr('wfinterop.orchestrator.ctime2datetime', 
+                        lambda x: dt.datetime.now())
+    mock_writes = []
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: mock_writes.append(x))
 
+    mock_wes.get_run_status.return_value = {'run_id': 'mock_run', 
+                                            'state': 'RUNNING'}
+
+    monitor_queue('mock_queue_1')
+
+    assert len(mock_writes) == 1
+    assert sorted(mock_writes[0]['mock_queue_1']) == ['mock_sub_1',
+                                                      'mock_sub_2']
+
+
+def test_monitor_queue_concurrent(mock_submission, 
+                                  mock_wes_config, 
+                                  monkeypatch):
+    # GIVEN many running submissions on a WES endpoint that allows
+    # at most two concurrent connections
+    mock_sub_ids = ['mock_sub_{}'.format(i) for i in range(8)]
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
+                        lambda **kwargs: mock_sub_ids)
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
+                        lambda x,y: copy.deepcopy(mock_submission['mock_sub']))
+    monkeypatch.setattr('wfinterop.orchestrator.wes_config', 
+                        lambda: {'mock_wes': dict(mock_wes_config['mock_wes'],
+                                                  max_connections=2)})
+    monkeypatch.setattr('wfinterop.orchestrator.convert_timedelta', 
+                        lambda x: 0)
+    monkeypatch.setattr('wfinterop.orchestrator.ctime2datetime', 
+                        lambda x: dt.datetime.now())
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: None)
+    mock_active = []
+    mock_peak = []
+    def mock_get_run_status(run_id):
+        mock_active.append(run_id)
+        mock_peak.append(len(mock_active))
+        time.sleep(0.05)
+        mock_active.pop()
+        return {'run_id': run_id, 'state': 'RUNNING'}
+    mock_wes = mock.Mock(name='mock WES')
+    mock_wes.get_run_status.side_effect = mock_get_run_status
+    monkeypatch.setattr('wfinterop.orchestrator.WES', 
+                        lambda wes_id: mock_wes)
+
+    # WHEN the queue is monitored
+    test_queue_log = monitor_queue('mock_queue_1')
+
+    # THEN statuses are requested concurrently, within the endpoint's cap
+    assert sorted(test_queue_log) == mock_sub_ids
+    assert all(log['status'] == 'RUNNING' 
+               for log in test_queue_log.values())
+    assert max(mock_peak) == 2
+
+
+def test_monitor_queue_bulk(mock_submission, monkeypatch):
+    # GIVEN running submissions, one of which is missing from the
+    # paginated run listing of its WES endpoint
+    mock_sub_ids = ['mock_sub_1', 'mock_sub_2', 'mock_sub_3']
+    mock_bundles = {}
+    for sub_id in mock_sub_ids:
+        mock_bundles[sub_id] = copy.deepcopy(mock_submission['mock_sub'])
+        mock_bundles[sub_id]['run_log']['run_id'] = sub_id + '_run'
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
+                        lambda **kwargs: mock_sub_ids)
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
+                        lambda x,y: mock_bundles[y])
+    monkeypatch.setattr('wfinterop.orchestrator.convert_timedelta', 
+                        lambda x: 0)
+    monkeypatch.setattr('wfinterop.orchestrator.ctime2datetime', 
+                        lambda x: dt.datetime.now())
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: None)
+    mock_wes = mock.Mock(name='mock WES')
+    mock_wes.iter_runs.return_value = iter([
+        {'run_id': 'mock_other_run', 'state': 'RUNNING'},
+        {'run_id': 'mock_sub_1_run', 'state': 'COMPLETE'},
+        {'run_id': 'mock_sub_2_run', 'state': 'RUNNING'}
+    ])
+    mock_wes.get_run_status.return_value = {'run_id': 'mock_sub_3_run',
+                                            'state': 'EXECUTOR_ERROR'}
+    monkeypatch.setattr('wfinterop.orchestrator.WES', 
+                        lambda wes_id: mock_wes)
+    monkeypatch.setattr('wfinterop.orchestrator.queue_config', 
+                        lambda: {'mock_queue_1': {'target_queue': None}})
+
+    # WHEN the queue is monitored in bulk mode
+    test_queue_log = monitor_queue('mock_queue_1', bulk=True)
+
+    # THEN states come from the listing, and only the missing run
+    # is polled individually
+    assert test_queue_log['mock_sub_1']['status'] == 'COMPLETE'
+    assert test_queue_log['mock_sub_2']['status'] == 'RUNNING'
+    assert test_queue_log['mock_sub_3']['status'] == 'EXECUTOR_ERROR'
+    mock_wes.iter_runs.assert_called_once()
+    mock_wes.get_run_status.assert_called_once_with('mock_sub_3_run')
+
+
+def test_poll_scheduler_backoff():
+    # GIVEN a scheduler and a newly submitted run
+    scheduler = PollScheduler(min_interval=1, max_interval=5, backoff=2)
+    mock_run_log = {'status': 'QUEUED'}
+    scheduler.update('mock_queue_1', 'mock_sub', 'mock_wes', 
+                     mock_run_log, now=0)
+
+    # WHEN the run keeps the same state, then changes state
+    test_due = [scheduler.pop_due('mock_queue_1', now=0.5)]
+    for now in [1, 3, 7, 12]:
+        test_due.append(scheduler.pop_due('mock_queue_1', now=now))
+        scheduler.update('mock_queue_1', 'mock_sub', 'mock_wes', 
+                         mock_run_log, now=now)
+    mock_run_log['status'] = 'RUNNING'
+    scheduler.update('mock_queue_1', 'mock_sub', 'mock_wes', 
+                     mock_run_log, now=12)
+
+    # THEN polls back off up to the maximum interval, and tighten 
+    # again after a state change
+    assert test_due == [set()] + [{'mock_sub'}] * 4
+    assert scheduler.pop_due('mock_queue_1', now=12.5) == set()
+    assert scheduler.pop_due('mock_queue_1', now=13) == {'mock_sub'}
+
+
+def test_poll_scheduler_expected_runtime():
+    # GIVEN a scheduler that has seen a run of a queue complete in
+    # ten minutes
+    scheduler = PollScheduler(min_interval=1, max_interval=300)
+    scheduler.update('mock_queue_1', 'mock_sub_1', 'mock_wes', 
+                     {'status': 'COMPLETE', 'elapsed_time': '0h:10m:0s'},
+                     now=0)
+
+    # WHEN another run of the queue has been running for 590 seconds
+    mock_start = dt.datetime.fromtimestamp(10000).ctime()
+    scheduler.update('mock_queue_1', 'mock_sub_2', 'mock_wes', 
+                     {'status': 'RUNNING', 'start_time': mock_start},
+                     now=10590)
+    for now in [10591, 10593]:
+        scheduler.pop_due('mock_queue_1', now=now)
+        scheduler.update('mock_queue_1', 'mock_sub_2', 'mock_wes', 
+                         {'status': 'RUNNING', 'start_time': mock_start},
+                         now=now)
+
+    # THEN it is polled more often as it nears the expected runtime
+    assert scheduler.expected_runtime('mock_queue_1', 'mock_wes') == 600
+    assert scheduler.pop_due('mock_queue_1', now=10596.4) == set()
+    assert scheduler.pop_due('mock_queue_1', now=10596.5) == {'mock_sub_2'}
+
+
+def test_monitor_queue_scheduler(mock_submission, mock_wes, monkeypatch):
+    # GIVEN a running submission that has just been polled
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
+                        lambda **kwargs: ['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
+                        lambda x,y: mock_submission['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.WES', 
+                        lambda wes_id: mock_wes)
+    monkeypatch.setattr('wfinterop.orchestrator.convert_timedelta', 
+                        lambda x: 0)
+    monkeypatch.setattr('wfinterop.orchestrator.ctime2datetime', 
+                        lambda x: dt.datetime.now())
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: None)
+    mock_wes.get_run_status.return_value = {'run_id': 'mock_run', 
+                                            'state': 'RUNNING'}
+    scheduler = PollScheduler(min_interval=60)
+    monitor_queue('mock_queue_1', scheduler=scheduler)
+
+    # WHEN the queue is monitored again before the run is due
+    test_queue_log = monitor_queue('mock_queue_1', scheduler=scheduler)
+
+    # THEN the run is not polled again
+    assert mock_wes.get_run_status.call_count == 1
+    assert test_queue_log['mock_sub']['status'] == 'RUNNING'
+
+
+def test_monitor_queue_scheduler_loads(mock_submission, mock_wes,
+                                       monkeypatch):
+    # GIVEN a running and a finished submission, both already reported
+    mock_submission['mock_sub_done'] = {
+        'status': 'COMPLETE',
+        'wes_id': 'mock_wes',
+        'run_log': {'run_id': 'mock_run_done', 'status': 'COMPLETE'}
+    }
+    mock_loads = []
+    def mock_bundle(queue_id, sub_id):
+        mock_loads.append(sub_id)
+        return mock_submission[sub_id]
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
+                        lambda **kwargs: ['mock_sub', 'mock_sub_done'])
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
+                        mock_bundle)
+    monkeypatch.setattr('wfinterop.orchestrator.WES', 
+                        lambda wes_id: mock_wes)
+    monkeypatch.setattr('wfinterop.orchestrator.convert_timedelta', 
+                        lambda x: 0)
+    monkeypatch.setattr('wfinterop.orchestrator.ctime2datetime', 
+                        lambda x: dt.datetime.now())
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: None)
+    mock_wes.get_run_status.return_value = {'run_id': 'mock_run', 
+                                            'state': 'RUNNING'}
+    scheduler = PollScheduler(min_interval=60)
+    monitor_queue('mock_queue_1', scheduler=scheduler)
+
+    # WHEN the queue is monitored again before the run is due
+    test_queue_log = monitor_queue('mock_queue_1', scheduler=scheduler)
+
+    # THEN neither submission is loaded again, but both are reported
+    assert sorted(mock_loads) == ['mock_sub', 'mock_sub_done']
+    assert test_queue_log['mock_sub']['status'] == 'RUNNING'
+    assert test_queue_log['mock_sub_done']['status'] == 'COMPLETE'
+
+
+def test_monitor_queue_endpoint_down(mock_submission, monkeypatch):
+    # GIVEN a running submission on a WES endpoint that is down
+    monkeypatch.setattr('wfinterop.orchestrator.get_submissions', 
+                        lambda **kwargs: ['mock_sub'])
+    monkeypatch.setattr('wfinterop.orchestrator.get_submission_bundle', 
+                        lambda x,y: mock_submission['mock_sub'])
+    mock_wes = mock.Mock(name='mock WES')
+    mock_wes.get_run_status.side_effect = ConnectionError()
+    monkeypatch.setattr('wfinterop.orchestrator.WES', 
+                        lambda wes_id: mock_wes)
+    mock_writes = []
+    monkeypatch.setattr('wfinterop.orchestrator.update_submissions', 
+                        lambda x: mock_writes.append(x))
+
+    # WHEN the queue is monitored
+    test_queue_log = monitor_queue('mock_queue_1')
 
+    # THEN the submission keeps its last known status
+    assert test_queue_log['mock_sub']['status'] == ''
+    assert mock_writes == [{'mock_queue_1': {}}]
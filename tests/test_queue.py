@@ -0,0 +1,365 @@
+import json
+import logging
+import threading
+import multiprocessing
+import datetime as dt
+import pytest
+
+from wfinterop.queue import create_submission
+from wfinterop.queue import create_submissions
+from wfinterop.queue import get_submissions
+from wfinterop.queue import get_submission_bundle
+from wfinterop.queue import update_submission
+from wfinterop.queue import update_submissions
+from wfinterop.queue import claim_submissions
+from wfinterop.queue import release_stale_claims
+from wfinterop.queue import update_claimed_submissions
+from wfinterop.queue import migrate_queue
+from wfinterop.queue import archive_submissions
+from wfinterop.queue import iter_archived_submissions
+from wfinterop.queue import new_submission_ids
+from wfinterop.queue import submission_time
+from wfinterop.queue import SQLiteSubmissionStore
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+def test_create_submission(mock_submission_store):
+    # GIVEN an empty submission queue
+
+    # WHEN a job request is submitted to an evaluation queue
+    test_id = create_submission(queue_id='mock_queue',
+                                submission_data='mock_json_url',
+                                wes_id='mock_wes')
+
+    # THEN the submission is stored with status RECEIVED
+    test_bundle = get_submission_bundle('mock_queue', test_id)
+    assert test_bundle == {'status': 'RECEIVED',
+                           'data': 'mock_json_url',
+                           'wes_id': 'mock_wes'}
+
+
+def test_create_submissions(mock_submission_store):
+    # GIVEN an empty submission queue
+
+    # WHEN a stream of parameter documents is submitted in bulk
+    mock_params = ({'input': i} for i in range(2500))
+    test_ids = create_submissions(queue_id='mock_queue',
+                                  submission_data=mock_params,
+                                  wes_id='mock_wes')
+
+    # THEN one submission is created per document, in input order
+    assert len(set(test_ids)) == 2500
+    assert sorted(get_submissions('mock_queue', status='RECEIVED')) == \
+        test_ids
+    assert get_submission_bundle('mock_queue', test_ids[42]) == {
+        'status': 'RECEIVED',
+        'data': {'input': 42},
+        'wes_id': 'mock_wes'}
+
+
+def test_create_submission_duplicate(mock_submission_store, monkeypatch):
+    # GIVEN a submission in the queue
+    test_id = create_submission('mock_queue', 'mock_json_url')
+
+    # WHEN a new submission is assigned the same ID
+    monkeypatch.setattr('wfinterop.queue.new_submission_ids',
+                        lambda: [test_id])
+
+    # THEN it is rejected instead of overwriting the existing one
+    with pytest.raises(ValueError):
+        create_submission('mock_queue', 'other_json_url')
+    assert get_submission_bundle('mock_queue', test_id)['data'] == \
+        'mock_json_url'
+
+
+def test_new_submission_ids():
+    # WHEN many IDs are allocated from several threads at once
+    test_ids = []
+
+    def allocate():
+        for _ in range(10):
+            test_ids.extend(new_submission_ids(500))
+    workers = [threading.Thread(target=allocate) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # THEN every ID is unique
+    assert len(set(test_ids)) == 20000
+
+    # AND IDs from a single allocation sort in creation order
+    test_batch = new_submission_ids(1000)
+    assert test_batch == sorted(test_batch)
+    assert test_batch[0] > max(test_ids)
+
+
+def test_submission_time():
+    test_id = new_submission_ids()[0]
+
+    test_time = submission_time(test_id)
+
+    assert abs(test_time - dt.datetime.utcnow()) < dt.timedelta(minutes=1)
+    assert submission_time('181018093015123456') is None
+
+
+def test_get_submissions(mock_submission_store):
+    # GIVEN a queue with submissions in different states
+    received_id = create_submission('mock_queue', 'mock_json_1')
+    submitted_id = create_submission('mock_queue', 'mock_json_2')
+    update_submission('mock_queue', submitted_id, 'status', 'SUBMITTED')
+
+    # WHEN submissions are filtered by status
+    # THEN only those with a matching status are returned
+    assert get_submissions('mock_queue', status='RECEIVED') == [received_id]
+    assert (get_submissions('mock_queue', exclude_status='RECEIVED')
+            == [submitted_id])
+    assert get_submissions('other_queue') == []
+
+
+def test_update_submission(mock_submission_store):
+    # GIVEN a submission in the queue
+    test_id = create_submission('mock_queue', 'mock_json_url', 'mock_wes')
+
+    # WHEN a field of the submission is updated
+    update_submission('mock_queue', test_id, 'run_log', {'run_id': 'foo'})
+
+    # THEN the new value is stored with the submission
+    test_bundle = get_submission_bundle('mock_queue', test_id)
+    assert test_bundle['run_log'] == {'run_id': 'foo'}
+    assert test_bundle['status'] == 'RECEIVED'
+
+
+def test_update_submissions(mock_submission_store):
+    # GIVEN several submissions across two queues
+    id_1 = create_submission('mock_queue_1', 'mock_json_1')
+    id_2 = create_submission('mock_queue_2', 'mock_json_2')
+
+    # WHEN multiple fields of each are updated in one batch
+    update_submissions({
+        'mock_queue_1': {id_1: {'status': 'SUBMITTED',
+                                'run_log': {'run_id': 'foo'}}},
+        'mock_queue_2': {id_2: {'status': 'SUBMITTED',
+                                'run_log': {'run_id': 'bar'}}}
+    })
+
+    # THEN every field of every submission is updated
+    for queue_id, sub_id, run_id in [('mock_queue_1', id_1, 'foo'),
+                                     ('mock_queue_2', id_2, 'bar')]:
+        test_bundle = get_submission_bundle(queue_id, sub_id)
+        assert test_bundle['status'] == 'SUBMITTED'
+        assert test_bundle['run_log'] == {'run_id': run_id}
+    assert get_submissions('mock_queue_1', status='SUBMITTED') == [id_1]
+
+
+def test_update_submissions_expected(mock_submission_store):
+    # GIVEN a submission that has changed since it was last read
+    test_id = create_submission('mock_queue', 'mock_json_url')
+    update_submission('mock_queue', test_id, 'status', 'SUBMITTED')
+
+    # WHEN it is updated on condition of its old status
+    test_conflicts = update_submissions(
+        {'mock_queue': {test_id: {'status': 'CANCELED'}}},
+        expected={'mock_queue': {test_id: {'status': 'RECEIVED'}}})
+
+    # THEN the update is reported as a conflict and not applied
+    assert test_conflicts == [('mock_queue', test_id)]
+    assert get_submission_bundle('mock_queue', test_id)['status'] == \
+        'SUBMITTED'
+
+
+def test_claim_submissions(mock_submission_store):
+    # GIVEN received submissions in a queue
+    test_ids = create_submissions('mock_queue', ['mock_1', 'mock_2'])
+
+    # WHEN two workers try to claim the same submissions
+    test_first = claim_submissions('mock_queue', test_ids)
+    test_second = claim_submissions('mock_queue', test_ids)
+
+    # THEN each submission is claimed only once
+    assert test_first == test_ids
+    assert test_second == []
+    assert get_submission_bundle('mock_queue', test_ids[0])['claimed_by']
+
+
+def test_create_submission_claimed(mock_submission_store):
+    # GIVEN an empty submission queue
+
+    # WHEN a job request is submitted to be run right away
+    test_id = create_submission(queue_id='mock_queue',
+                                submission_data='mock_json',
+                                claim=True)
+
+    # THEN it is claimed by this worker, so it isn't run from the queue
+    assert get_submissions('mock_queue', status='RECEIVED') == []
+    assert get_submissions('mock_queue', status='CLAIMED') == [test_id]
+
+
+def test_update_claimed_submissions(mock_submission_store):
+    # GIVEN a submission claimed by this worker, and one whose claim
+    # was taken over by another worker
+    test_ids = create_submissions('mock_queue', ['mock_1', 'mock_2'])
+    claim_submissions('mock_queue', test_ids)
+    update_submission('mock_queue', test_ids[1], 'claimed_by',
+                      'mock_worker')
+
+    # WHEN both are updated on condition of the claim
+    test_lost = update_claimed_submissions(
+        'mock_queue', {test_id: {'status': 'SUBMITTED'}
+                       for test_id in test_ids})
+
+    # THEN only the submission still claimed by this worker is updated
+    assert test_lost == test_ids[1:]
+    assert get_submissions('mock_queue', status='SUBMITTED') == test_ids[:1]
+
+
+def test_release_stale_claims(mock_submission_store):
+    # GIVEN a submission claimed by a worker that died, and one just
+    # claimed
+    test_ids = create_submissions('mock_queue', ['mock_1', 'mock_2'])
+    claim_submissions('mock_queue', test_ids[:1])
+    update_submission('mock_queue', test_ids[0], 'claimed_at',
+                      '2018-10-18T09:30:15Z')
+    claim_submissions('mock_queue', test_ids[1:])
+
+    # WHEN stale claims are released
+    test_released = release_stale_claims(max_age=dt.timedelta(hours=1))
+
+    # THEN only the old claim is handed back to the queue
+    assert test_released == [('mock_queue', test_ids[0])]
+    assert get_submissions('mock_queue', status='RECEIVED') == test_ids[:1]
+    assert get_submissions('mock_queue', status='CLAIMED') == test_ids[1:]
+
+
+def _create_many(queue_id):
+    for i in range(25):
+        create_submission(queue_id, 'mock_json_{}'.format(i))
+
+
+def test_concurrent_writers(mock_submission_store):
+    # GIVEN several processes writing to the same submission queue
+    workers = [multiprocessing.Process(target=_create_many,
+                                       args=('mock_queue',))
+               for _ in range(4)]
+
+    # WHEN they all create submissions at the same time
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # THEN no submission is lost
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert len(get_submissions('mock_queue')) == 100
+
+
+def test_archive_submissions(mock_submission_store):
+    # GIVEN a queue with finished, failed and in-flight submissions
+    complete_id = create_submission('mock_queue', 'mock_json_1')
+    failed_id = create_submission('mock_queue', 'mock_json_2')
+    running_id = create_submission('mock_queue', 'mock_json_3')
+    update_submissions({'mock_queue': {
+        complete_id: {'status': 'COMPLETE',
+                      'run_log': {'status': 'COMPLETE'}},
+        failed_id: {'status': 'SUBMITTED',
+                    'run_log': {'status': 'EXECUTOR_ERROR'}},
+        running_id: {'status': 'SUBMITTED',
+                     'run_log': {'status': 'RUNNING'}}}})
+
+    # WHEN submissions younger than the maximum age are archived
+    assert archive_submissions(max_age=dt.timedelta(days=1)) == \
+        {'mock_queue': 0}
+
+    # THEN nothing is moved
+    assert len(get_submissions('mock_queue', status=['SUBMITTED',
+                                                     'COMPLETE'])) == 3
+
+    # WHEN all terminal submissions are archived
+    test_archived = archive_submissions(max_age=dt.timedelta(0))
+
+    # THEN only the in-flight submission is left in the live store
+    assert test_archived == {'mock_queue': 2}
+    assert get_submissions('mock_queue', status=['SUBMITTED',
+                                                 'COMPLETE']) == [running_id]
+
+    # AND the archived submissions can still be read
+    assert sorted(id for id, _ in iter_archived_submissions('mock_queue')) \
+        == sorted([complete_id, failed_id])
+    test_bundle = get_submission_bundle('mock_queue', failed_id,
+                                        include_archive=True)
+    assert test_bundle['run_log'] == {'status': 'EXECUTOR_ERROR'}
+    with pytest.raises(KeyError):
+        get_submission_bundle('mock_queue', failed_id)
+
+    # AND archiving again appends nothing
+    assert archive_submissions(max_age=dt.timedelta(0)) == \
+        {'mock_queue': 0}
+
+
+def test_migrate_queue(tmpdir):
+    # GIVEN an existing JSON submission queue
+    mock_queue = {'mock_queue': {
+        'mock_sub': {'status': 'SUBMITTED',
+                     'data': 'mock_json_url',
+                     'wes_id': 'mock_wes',
+                     'run_log': {'run_id': 'foo'}}}}
+    mock_queue_file = tmpdir.join('submission_queue.json')
+    mock_queue_file.write(json.dumps(mock_queue))
+    mock_db_file = str(tmpdir.join('submission_queue.db'))
+
+    # WHEN the queue is migrated twice
+    test_copied = migrate_queue(str(mock_queue_file), mock_db_file)
+    test_recopied = migrate_queue(str(mock_queue_file), mock_db_file)
+
+    # THEN every submission is copied to the database exactly once
+    assert test_copied == 1
+    assert test_recopied == 0
+    test_store = SQLiteSubmissionStore(mock_db_file)
+    assert (test_store.get('mock_queue', 'mock_sub')
+            == mock_queue['mock_queue']['mock_sub'])
+    assert test_store.ids('mock_queue', ['SUBMITTED']) == ['mock_sub']
+
+
+def test_json_store_cache(tmpdir, monkeypatch):
+    # GIVEN a JSON submission queue that has been read once
+    mock_queue_file = tmpdir.join('submission_queue.json')
+    mock_queue_file.write(json.dumps({'mock_queue': {
+        'mock_sub': {'status': 'RECEIVED', 'data': '', 'wes_id': None}}}))
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_queue_file))
+    monkeypatch.setattr('wfinterop.queue.submission_db',
+                        str(tmpdir.join('submission_queue.db')))
+    assert get_submissions('mock_queue') == ['mock_sub']
+
+    # WHEN the queue is read and written again in the same process
+    mock_loads = []
+    monkeypatch.setattr('wfinterop.queue.get_json',
+                        lambda x: mock_loads.append(x))
+    update_submission('mock_queue', 'mock_sub', 'status', 'SUBMITTED')
+    test_bundle = get_submission_bundle('mock_queue', 'mock_sub')
+    test_bundle['status'] = 'mutated by caller'
+
+    # THEN the file is not parsed again, and callers cannot modify
+    # the cached copy
+    assert mock_loads == []
+    assert get_submissions('mock_queue', status='SUBMITTED') == ['mock_sub']
+
+
+def test_json_store_cache_invalidation(tmpdir, monkeypatch):
+    # GIVEN a JSON submission queue that has been read once
+    mock_queue_file = tmpdir.join('submission_queue.json')
+    mock_queue_file.write('{}')
+    monkeypatch.setattr('wfinterop.queue.submission_queue',
+                        str(mock_queue_file))
+    monkeypatch.setattr('wfinterop.queue.submission_db',
+                        str(tmpdir.join('submission_queue.db')))
+    assert get_submissions('mock_queue') == []
+
+    # WHEN another process replaces the file
+    mock_queue_file.write(json.dumps({'mock_queue': {
+        'mock_sub': {'status': 'RECEIVED', 'data': '', 'wes_id': None}}}))
+
+    # THEN the next read picks up the new contents
+    assert get_submissions('mock_queue') == ['mock_sub']
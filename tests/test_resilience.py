@@ -0,0 +1,133 @@
+import logging
+import mock
+import pytest
+
+import requests
+from requests.exceptions import ConnectionError, ReadTimeout
+from requests.exceptions import HTTPError as RequestsHTTPError
+from bravado.exception import HTTPServiceUnavailable, HTTPNotFound
+
+from wfinterop.resilience import is_transient
+from wfinterop.resilience import CircuitBreaker
+from wfinterop.resilience import CircuitOpenError
+from wfinterop.resilience import circuit_states
+from wfinterop.wes.client import WESAdapter
+from wfinterop.wes.wrapper import WES
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture()
+def mock_sleep(monkeypatch):
+    mock_sleeps = []
+    monkeypatch.setattr('wfinterop.resilience.time.sleep', 
+                        lambda x: mock_sleeps.append(x))
+    yield mock_sleeps
+
+
+def test_is_transient():
+    mock_response = mock.Mock(status_code=503)
+    assert is_transient(ConnectionError())
+    assert is_transient(ReadTimeout())
+    assert is_transient(CircuitOpenError())
+    assert is_transient(HTTPServiceUnavailable(mock_response))
+    mock_response.status_code = 404
+    assert not is_transient(HTTPNotFound(mock_response))
+    assert not is_transient(ValueError())
+
+
+def test_circuit_breaker_retry(mock_sleep):
+    # GIVEN a call that fails twice with a transient error
+    breaker = CircuitBreaker('wes:mock_wes', failure_threshold=5)
+    mock_call = mock.Mock(side_effect=[ConnectionError(), 
+                                       ConnectionError(), 
+                                       'mock_result'])
+
+    # WHEN it is made with retries
+    test_result = breaker.call(mock_call, retries=3)
+
+    # THEN it is retried after jittered, growing delays
+    assert test_result == 'mock_result'
+    assert mock_call.call_count == 3
+    assert len(mock_sleep) == 2
+    assert 0 <= mock_sleep[0] <= 0.5 and 0 <= mock_sleep[1] <= 1
+    assert breaker.state == 'closed'
+
+
+def test_circuit_breaker_no_retry(mock_sleep):
+    # GIVEN a call that fails with an error that isn't transient
+    breaker = CircuitBreaker('wes:mock_wes')
+    mock_call = mock.Mock(side_effect=ValueError())
+
+    # WHEN it is made with retries
+    # THEN it is not retried
+    with pytest.raises(ValueError):
+        breaker.call(mock_call, retries=3)
+    assert mock_call.call_count == 1
+    assert breaker.failures == 0
+
+
+def test_circuit_breaker_open(mock_sleep, monkeypatch):
+    # GIVEN an endpoint that keeps failing
+    breaker = CircuitBreaker('wes:mock_wes', failure_threshold=2, 
+                             reset_timeout=30)
+    mock_call = mock.Mock(side_effect=ConnectionError())
+    monkeypatch.setattr('wfinterop.resilience.time.time', lambda: 1000)
+    with pytest.raises(ConnectionError):
+        breaker.call(mock_call, retries=5)
+
+    # WHEN it is called again, before and after the reset timeout
+    with pytest.raises(CircuitOpenError):
+        breaker.call(mock_call)
+    monkeypatch.setattr('wfinterop.resilience.time.time', lambda: 1030)
+    mock_call.side_effect = None
+    mock_call.return_value = 'mock_result'
+    test_result = breaker.call(mock_call)
+
+    # THEN the circuit opens after repeated failures, skipping calls 
+    # until a trial call succeeds
+    assert mock_call.call_count == 3
+    assert test_result == 'mock_result'
+    assert breaker.state == 'closed'
+
+
+def test_wes_retries_idempotent(mock_sleep):
+    # GIVEN a WES endpoint that fails once
+    mock_api_client = mock.Mock(name='mock WESAdapter')
+    mock_api_client.GetRunStatus.side_effect = [ConnectionError(), 
+                                                {'state': 'RUNNING'}]
+    mock_api_client.RunWorkflow.side_effect = ConnectionError()
+    wes_instance = WES(wes_id='mock_wes', api_client=mock_api_client)
+
+    # WHEN runs are checked and started
+    test_status = wes_instance.get_run_status('mock_run')
+    with pytest.raises(ConnectionError):
+        wes_instance.run_workflow({})
+
+    # THEN only the idempotent call is retried
+    assert test_status == {'state': 'RUNNING'}
+    assert mock_api_client.GetRunStatus.call_count == 2
+    assert mock_api_client.RunWorkflow.call_count == 1
+    assert circuit_states()['wes:mock_wes']['failures'] == 1
+
+
+def test_wes_adapter_unavailable(mock_sleep, mock_wes_config, monkeypatch):
+    # GIVEN the default WES client for an endpoint returning 503s
+    mock_response = requests.Response()
+    mock_response.status_code = 503
+    mock_response._content = b'{"msg": "unavailable"}'
+    mock_session = mock.Mock(name='mock Session')
+    mock_session.request.return_value = mock_response
+    monkeypatch.setattr('wfinterop.wes.client.get_session', 
+                        lambda opts: mock_session)
+    wes_adapter = WESAdapter(mock_wes_config['mock_wes'])
+    wes_instance = WES(wes_id='mock_wes', api_client=wes_adapter)
+
+    # WHEN a run's status is checked
+    with pytest.raises(RequestsHTTPError):
+        wes_instance.get_run_status('mock_run')
+
+    # THEN the call is retried and counted as a failure of the endpoint
+    assert mock_session.request.call_count == 4
+    assert circuit_states()['wes:mock_wes']['failures'] == 4
@@ -0,0 +1,101 @@
+import logging
+import mock
+import pytest
+
+from bravado.testing.response_mocks import BravadoResponseMock
+from requests.exceptions import ConnectionError
+
+from wfinterop.response_cache import TTLCache
+from wfinterop.wes.wrapper import WES
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture()
+def mock_clock():
+    yield [1000]
+
+
+@pytest.fixture()
+def mock_cache(mock_clock):
+    yield TTLCache(clock=lambda: mock_clock[0])
+
+
+def test_ttl_cache_fresh(mock_cache, mock_clock):
+    # GIVEN a response that has just been cached
+    mock_fetch = mock.Mock(side_effect=['mock_info_1', 'mock_info_2'])
+    mock_cache.get('mock_key', mock_fetch, ttl=60)
+
+    # WHEN it is requested again within its TTL
+    mock_clock[0] += 59
+    test_value = mock_cache.get('mock_key', mock_fetch, ttl=60)
+
+    # THEN the cached response is returned without fetching it
+    assert test_value == 'mock_info_1'
+    assert mock_fetch.call_count == 1
+
+
+def test_ttl_cache_stale_while_revalidate(mock_cache, mock_clock):
+    # GIVEN a cached response past its TTL
+    mock_fetch = mock.Mock(side_effect=['mock_info_1', 'mock_info_2'])
+    mock_cache.get('mock_key', mock_fetch, ttl=60, stale_ttl=600)
+    mock_clock[0] += 61
+
+    # WHEN it is requested
+    test_value = mock_cache.get('mock_key', mock_fetch, ttl=60, 
+                                stale_ttl=600)
+    mock_cache.join()
+
+    # THEN the stale response is returned, and replaced in the background
+    assert test_value == 'mock_info_1'
+    assert mock_cache.get('mock_key', mock_fetch, ttl=60) == 'mock_info_2'
+    assert mock_fetch.call_count == 2
+
+
+def test_ttl_cache_revalidate_failure(mock_cache, mock_clock):
+    # GIVEN a cached response past its TTL, for a service that is down
+    mock_fetch = mock.Mock(side_effect=['mock_info_1', 
+                                        ConnectionError()])
+    mock_cache.get('mock_key', mock_fetch, ttl=60, stale_ttl=600)
+    mock_clock[0] += 61
+
+    # WHEN it is requested
+    mock_cache.get('mock_key', mock_fetch, ttl=60, stale_ttl=600)
+    mock_cache.join()
+
+    # THEN the stale response is kept
+    assert mock_cache.get('mock_key', mock_fetch, ttl=60, 
+                          stale_ttl=600) == 'mock_info_1'
+
+
+def test_ttl_cache_expired(mock_cache, mock_clock):
+    # GIVEN a cached response past its TTL and stale period
+    mock_fetch = mock.Mock(side_effect=['mock_info_1', 'mock_info_2'])
+    mock_cache.get('mock_key', mock_fetch, ttl=60, stale_ttl=600)
+    mock_clock[0] += 661
+
+    # WHEN it is requested
+    test_value = mock_cache.get('mock_key', mock_fetch, ttl=60, 
+                                stale_ttl=600)
+
+    # THEN a new response is fetched before returning
+    assert test_value == 'mock_info_2'
+
+
+def test_wes_service_info_cached():
+    # GIVEN a WES endpoint
+    mock_api_client = mock.Mock(name='mock WESAdapter')
+    mock_api_client.GetServiceInfo.return_value.response = (
+        BravadoResponseMock(result={'workflow_type_versions': {}}))
+    wes_instance = WES(wes_id='mock_wes', api_client=mock_api_client)
+
+    # WHEN its service info is requested repeatedly, and then refreshed
+    for _ in range(3):
+        test_info = WES(wes_id='mock_wes', 
+                        api_client=mock_api_client).get_service_info()
+    wes_instance.get_service_info(refresh=True)
+
+    # THEN the endpoint is only called for the first and forced requests
+    assert test_info == {'workflow_type_versions': {}}
+    assert mock_api_client.GetServiceInfo.call_count == 2
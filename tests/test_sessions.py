@@ -0,0 +1,86 @@
+import logging
+import mock
+import pytest
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from wfinterop.sessions import get_session
+from wfinterop.sessions import pool_stats
+from wfinterop.sessions import close_sessions
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture()
+def mock_sessions():
+    close_sessions()
+    yield
+    close_sessions()
+
+
+def test_get_session(mock_sessions, mock_wes_config, mock_trs_config):
+    # GIVEN config entries for two services on different hosts
+    mock_wes_opts = mock_wes_config['mock_wes']
+    mock_trs_opts = dict(mock_trs_config['mock_trs'], host='0.0.0.0:8443')
+
+    # WHEN sessions are requested for each service
+    test_session = get_session(mock_wes_opts)
+
+    # THEN each host gets one shared session
+    assert(get_session(dict(mock_wes_opts)) is test_session)
+    assert(get_session(mock_trs_opts) is not test_session)
+
+
+def test_get_session_pool_opts(mock_sessions, mock_wes_config):
+    # GIVEN a session opened with the default pool options
+    mock_opts = dict(mock_wes_config['mock_wes'])
+    test_session = get_session(mock_opts)
+
+    # WHEN the pool options of the service change
+    mock_opts.update({'max_connections': 2, 'timeout': 5})
+    test_new_session = get_session(mock_opts)
+
+    # THEN a new session is opened with those options
+    assert(test_new_session is not test_session)
+    assert(test_new_session.max_connections == 2)
+    assert(test_new_session.timeout == 5)
+    assert(test_new_session.get_adapter('https://x')._pool_maxsize == 2)
+
+
+def test_get_session_unset_opts(mock_sessions, mock_wes_config):
+    # GIVEN a session opened with a service's pool options
+    mock_opts = dict(mock_wes_config['mock_wes'], max_connections=50,
+                     timeout=5)
+    test_session = get_session(mock_opts)
+
+    # WHEN the session for the host is looked up without any options
+    # (e.g., to download an attachment)
+    test_lookup = get_session({'proto': mock_opts['proto'],
+                               'host': mock_opts['host']})
+
+    # THEN the configured session is used, and kept open
+    assert(test_lookup is test_session)
+    assert(test_session.max_connections == 50)
+    assert(test_session.timeout == 5)
+
+
+def test_session_timeout_and_stats(mock_sessions, mock_wes_config):
+    # GIVEN a session with a default timeout
+    mock_opts = dict(mock_wes_config['mock_wes'], timeout=5)
+    test_session = get_session(mock_opts)
+
+    # WHEN a request is made without a timeout
+    mock_response = Response()
+    mock_response.status_code = 200
+    with mock.patch.object(HTTPAdapter, 'send',
+                           return_value=mock_response) as mock_send:
+        test_session.get('https://{}/ga4gh/wes/v1/runs'.format(
+            mock_opts['host']))
+
+    # THEN the default timeout is used and the request is counted
+    assert(mock_send.call_args[1]['timeout'] == 5)
+    test_stats = pool_stats()['https://{}'.format(mock_opts['host'])]
+    assert(test_stats['requests'] == 1)
+    assert(test_stats['max_connections'] == 10)
@@ -0,0 +1,91 @@
+import logging
+import mock
+import pytest
+import threading
+import time
+
+from bravado.testing.response_mocks import BravadoResponseMock
+
+from wfinterop.throttle import TokenBucket
+from wfinterop.throttle import Throttle
+from wfinterop.throttle import get_throttle
+from wfinterop.throttle import throttle_stats
+from wfinterop.wes.wrapper import WES
+
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture()
+def mock_throttles(monkeypatch):
+    monkeypatch.setattr('wfinterop.throttle._throttles', {})
+
+
+def test_token_bucket():
+    # GIVEN a token bucket allowing bursts of two requests
+    bucket = TokenBucket(rate=20, burst=2)
+
+    # WHEN three requests are made at once
+    test_waits = [bucket.acquire() for _ in range(3)]
+
+    # THEN only the third waits for a token
+    assert test_waits[:2] == [0, 0]
+    assert 0 < test_waits[2] <= 0.05
+
+
+def test_throttle_max_in_flight():
+    # GIVEN an endpoint allowing two calls in flight
+    throttle = Throttle('wes:mock_wes', max_in_flight=2)
+
+    # WHEN four threads call it at once
+    def mock_call():
+        with throttle:
+            time.sleep(0.05)
+    threads = [threading.Thread(target=mock_call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # THEN at most two calls are made at a time, and the others wait
+    test_stats = throttle.stats()
+    assert test_stats['calls'] == 4
+    assert test_stats['in_flight'] == 0
+    assert test_stats['peak_in_flight'] == 2
+    assert test_stats['in_flight_delayed_calls'] == 2
+    assert test_stats['in_flight_delay'] > 0
+
+
+def test_get_throttle(mock_throttles):
+    # GIVEN the throttle for an endpoint
+    test_throttle = get_throttle('wes', 'mock_wes', {'rate_limit': 5})
+
+    # WHEN it is requested again, and after its limits change
+    # THEN it is shared until the limits change
+    assert get_throttle('wes', 'mock_wes', 
+                        {'rate_limit': 5}) is test_throttle
+    assert get_throttle('trs', 'mock_wes', 
+                        {'rate_limit': 5}) is not test_throttle
+    assert get_throttle('wes', 'mock_wes', 
+                        {'rate_limit': 1}) is not test_throttle
+
+
+def test_wes_throttled(mock_throttles, mock_wes_config, monkeypatch):
+    # GIVEN a WES endpoint with a rate limit
+    monkeypatch.setattr('wfinterop.wes.wrapper.wes_config', 
+                        lambda: {'mock_wes': dict(mock_wes_config['mock_wes'],
+                                                  rate_limit=20, burst=1)})
+    mock_api_client = mock.Mock(name='mock WESAdapter')
+    mock_api_client.GetRunStatus.return_value.response = (
+        BravadoResponseMock(result={}))
+
+    # WHEN it is called repeatedly
+    wes_instance = WES(wes_id='mock_wes', api_client=mock_api_client)
+    for _ in range(3):
+        wes_instance.get_run_status('mock_run')
+
+    # THEN calls after the first are delayed, and the delays are recorded
+    test_stats = throttle_stats()['wes:mock_wes']
+    assert test_stats['calls'] == 3
+    assert test_stats['rate_delayed_calls'] == 2
+    assert test_stats['rate_delay'] > 0.05
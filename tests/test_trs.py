@@ -1,13 +1,23 @@
+import io
+import zipfile
+
 import mock
 import pytest
 
 from bravado.requests_client import RequestsClient
 from bravado.client import SwaggerClient, ResourceDecorator
+from bravado.config import RequestConfig
+from bravado.exception import HTTPNotModified
+from bravado.response import BravadoResponseMetadata
 from bravado.testing.response_mocks import BravadoResponseMock
+from bravado.testing.response_mocks import IncomingResponseMock
+from requests.exceptions import ConnectionError
 
 from wfinterop.trs.client import _get_trs_opts
 from wfinterop.trs.client import _init_http_client
 from wfinterop.trs.client import load_trs_client
+from wfinterop.trs.client import invalidate_trs_client
+from wfinterop.trs.cache import TRSOfflineError
 from wfinterop.trs.wrapper import TRS
 
 
@@ -38,6 +48,24 @@ def test_load_trs_client_from_spec(mock_trs_config, monkeypatch):
     assert isinstance(test_trs_client, ResourceDecorator)
 
 
+def test_load_trs_client_cached(mock_trs_config, monkeypatch):
+    # GIVEN a TRS client that has been loaded once for a service
+    mock_opts = dict(mock_trs_config['mock_trs'])
+    monkeypatch.setattr('wfinterop.trs.client._get_trs_opts', 
+                        lambda x: mock_opts)
+    test_trs_client = load_trs_client(service_id='mock_trs')
+
+    # WHEN the client is loaded again
+    # THEN the same client is returned until the config changes or
+    # the cache is invalidated
+    assert load_trs_client(service_id='mock_trs') is test_trs_client
+    mock_opts['host'] = '0.0.0.0:8081'
+    test_new_client = load_trs_client(service_id='mock_trs')
+    assert test_new_client is not test_trs_client
+    invalidate_trs_client('mock_trs')
+    assert load_trs_client(service_id='mock_trs') is not test_new_client
+
+
 class TestTRS:
     """
     Tests methods for the :class:`TRS` class, which serve as the main
@@ -173,4 +201,151 @@ class TestTRS:
         )
 
         assert isinstance(test_workflow_files, list) 
-        assert test_workflow_files == mock_workflow_files
\ No newline at end of file
+        assert test_workflow_files == mock_workflow_files
+
+class TestTRSCache:
+    """
+    Tests caching of TRS responses on disk by the :class:`TRS` class.
+    """
+    @pytest.fixture()
+    def mock_operator(self, mock_trs_client):
+        operator = mock_trs_client.toolsIdVersionsVersionIdTypeFilesGet
+        mock_metadata = BravadoResponseMetadata(
+            incoming_response=IncomingResponseMock(
+                status_code=200, headers={'ETag': '"v1"'}),
+            swagger_result=None,
+            start_time=0,
+            request_end_time=0,
+            handled_exception_info=None,
+            request_config=RequestConfig({}, False))
+        operator.return_value.response = BravadoResponseMock(
+            result=[{'path': 'mock.cwl', 'file_type': 'PRIMARY_DESCRIPTOR'}],
+            metadata=mock_metadata)
+        yield operator
+
+    def get_files(self, mock_trs_client):
+        trs_instance = TRS(trs_id='mock_trs', api_client=mock_trs_client)
+        return trs_instance.get_workflow_files(id='mock_wf',
+                                               version_id='test',
+                                               type='CWL')
+
+    def test_revalidate(self, mock_trs_client, mock_operator):
+        # GIVEN a cached response with an ETag
+        test_files = self.get_files(mock_trs_client)
+
+        # WHEN it is requested again and hasn't changed
+        mock_operator.return_value.response = mock.Mock(
+            side_effect=HTTPNotModified(mock.Mock(status_code=304)))
+        test_files_2 = self.get_files(mock_trs_client)
+
+        # THEN it is revalidated with a conditional request
+        assert (mock_operator.call_args[1]['_request_options'] ==
+                {'headers': {'If-None-Match': '"v1"'}})
+        assert test_files_2 == test_files
+
+    def test_max_age(self, mock_trs_client, mock_operator, monkeypatch):
+        # GIVEN a TRS endpoint whose responses stay fresh for a while
+        monkeypatch.setattr('wfinterop.trs.cache.default_max_age', 60)
+        test_files = self.get_files(mock_trs_client)
+
+        # WHEN a cached response is requested again
+        test_files_2 = self.get_files(mock_trs_client)
+
+        # THEN it is served without calling the endpoint
+        assert mock_operator.call_count == 1
+        assert test_files_2 == test_files
+
+    def test_offline(self, mock_trs_client, mock_operator, monkeypatch):
+        # GIVEN one cached response, in offline mode
+        test_files = self.get_files(mock_trs_client)
+        monkeypatch.setattr('wfinterop.trs.cache.offline', True)
+
+        # WHEN responses are requested
+        test_files_2 = self.get_files(mock_trs_client)
+        trs_instance = TRS(trs_id='mock_trs', api_client=mock_trs_client)
+
+        # THEN only the cached one is available, without calling the
+        # endpoint
+        assert test_files_2 == test_files
+        with pytest.raises(TRSOfflineError):
+            trs_instance.get_workflow_tests(id='mock_wf',
+                                            version_id='test',
+                                            type='CWL')
+        assert mock_operator.call_count == 1
+
+    def test_endpoint_down(self, mock_trs_client, mock_operator,
+                           monkeypatch):
+        # GIVEN a cached response from an endpoint that has gone down
+        monkeypatch.setattr('wfinterop.resilience.default_max_retries', 0)
+        monkeypatch.setattr('wfinterop.trs.wrapper.default_max_retries', 0)
+        test_files = self.get_files(mock_trs_client)
+        mock_operator.return_value.response = mock.Mock(
+            side_effect=ConnectionError())
+
+        # WHEN it is requested again
+        test_files_2 = self.get_files(mock_trs_client)
+
+        # THEN the cached response is served
+        assert test_files_2 == test_files
+
+
+def _mock_zip(files):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as f:
+        for name, content in files.items():
+            f.writestr(name, content)
+    return archive.getvalue()
+
+
+class TestTRSBundle:
+    """
+    Tests downloading all files of a workflow version as one zip
+    archive with :meth:`TRS.get_workflow_bundle`.
+    """
+    @pytest.fixture()
+    def mock_session(self, mock_trs_config, monkeypatch):
+        monkeypatch.setattr('wfinterop.trs.wrapper.trs_config',
+                            lambda: mock_trs_config)
+        mock_session = mock.Mock(name='mock Session')
+        monkeypatch.setattr('wfinterop.trs.wrapper.get_session',
+                            lambda opts: mock_session)
+        yield mock_session
+
+    def test_get_workflow_bundle(self, mock_trs_client, mock_session,
+                                 tmpdir):
+        # GIVEN a TRS endpoint returning a zipped workflow
+        mock_archive = _mock_zip({'main.cwl': 'main',
+                                  'tools/tool.cwl': 'tool'})
+        mock_session.get.return_value.iter_content.return_value = [
+            mock_archive[:10], mock_archive[10:]]
+        trs_instance = TRS(trs_id='mock_trs', api_client=mock_trs_client)
+
+        # WHEN the workflow's bundle is fetched
+        test_dest = tmpdir.join('mock_wf')
+        test_names = trs_instance.get_workflow_bundle(id='mock_wf',
+                                                      version_id='test',
+                                                      type='CWL',
+                                                      dest=str(test_dest))
+
+        # THEN all files are unpacked from a single request
+        mock_session.get.assert_called_once_with(
+            'https://0.0.0.0:8080/api/ga4gh/v2/tools/'
+            '%23workflow%2Fmock_wf/versions/test/CWL/files',
+            headers=mock.ANY, params={'format': 'zip'}, stream=True)
+        assert sorted(test_names) == ['main.cwl', 'tools/tool.cwl']
+        assert test_dest.join('tools', 'tool.cwl').read() == 'tool'
+
+    def test_get_workflow_bundle_unsafe(self, mock_trs_client,
+                                        mock_session, tmpdir):
+        # GIVEN a zipped workflow with a file outside its directory
+        mock_session.get.return_value.iter_content.return_value = [
+            _mock_zip({'../evil.cwl': 'evil'})]
+        trs_instance = TRS(trs_id='mock_trs', api_client=mock_trs_client)
+
+        # WHEN the workflow's bundle is fetched, THEN it is rejected
+        with pytest.raises(ValueError):
+            trs_instance.get_workflow_bundle(id='mock_wf',
+                                             version_id='test',
+                                             type='CWL',
+                                             dest=str(tmpdir.join('wf')))
+        assert not tmpdir.join('evil.cwl').exists()
@@ -1,8 +1,11 @@
 import logging
 import pytest
 import mock
+import threading
+import time
 import yaml
 
+from wfinterop.blobs import get_blob_store
 from wfinterop.trs2wes import fetch_queue_workflow
 
 logging.basicConfig(level=logging.DEBUG)
@@ -40,4 +43,131 @@ def test_fetch_queue_workflow(mock_orchestratorconfig,
     with open(str(mock_orchestratorconfig), 'r') as f:
         test_config = yaml.load(f)['queues']
 
-    assert(test_config['mock_queue_1'] == mock_config)
\ No newline at end of file
+    assert(test_config['mock_queue_1'] == mock_config)
+
+def test_fetch_queue_workflow_caches_attachments(mock_orchestratorconfig,
+                                                 mock_queue_config,
+                                                 mock_trs,
+                                                 monkeypatch):
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    monkeypatch.setattr('wfinterop.trs2wes.queue_config', 
+                        lambda: mock_queue_config)
+    monkeypatch.setattr('wfinterop.trs2wes.TRS', 
+                        lambda trs_id: mock_trs)
+    mock_trs.get_workflow_descriptor.return_value = {'url': 'mock_wf_url'}
+    mock_trs.get_workflow_files.return_value = [{'file_type': 'SECONDARY_DESCRIPTOR',
+                                                 'path': 'mock_path'}]
+    mock_trs.get_workflow_descriptor_relative.return_value = {
+        'url': 'https://mock.org/mock_path',
+        'descriptor': 'mock content'
+    }
+
+    fetch_queue_workflow('mock_queue_1')
+
+    test_digest = get_blob_store().put_url('https://mock.org/mock_path')
+    with open(get_blob_store().blob_path(test_digest)) as f:
+        assert f.read() == 'mock content'
+
+
+def test_fetch_queue_workflow_concurrent(mock_orchestratorconfig,
+                                         mock_queue_config,
+                                         mock_trs,
+                                         monkeypatch):
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    monkeypatch.setattr('wfinterop.trs2wes.queue_config', 
+                        lambda: mock_queue_config)
+    monkeypatch.setattr('wfinterop.trs2wes.TRS', 
+                        lambda trs_id: mock_trs)
+    mock_paths = ['tool_{}.cwl'.format(i) for i in range(8)]
+    mock_trs.get_workflow_descriptor.return_value = {'url': 'mock_wf_url'}
+    mock_trs.get_workflow_files.return_value = [
+        {'file_type': 'SECONDARY_DESCRIPTOR', 'path': path}
+        for path in mock_paths]
+    # GIVEN descriptor requests that take longer the earlier they're listed
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def mock_get_relative(relative_path, **kwargs):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        time.sleep(0.05 - 0.005 * mock_paths.index(relative_path))
+        with lock:
+            in_flight[0] -= 1
+        return {'url': 'mock_url/' + relative_path}
+    mock_trs.get_workflow_descriptor_relative.side_effect = mock_get_relative
+    monkeypatch.setattr('wfinterop.trs2wes.fetch_workers', 4)
+
+    # WHEN the queue's workflow is fetched
+    test_config = fetch_queue_workflow('mock_queue_1')
+
+    # THEN up to 4 requests are made at once, and attachments keep
+    # the order they're listed in
+    assert in_flight[1] == 4
+    assert (test_config['workflow_attachments'] ==
+            ['mock_url/' + path for path in mock_paths])
+
+
+def test_fetch_queue_workflow_bundle(mock_orchestratorconfig,
+                                     mock_queue_config,
+                                     mock_trs,
+                                     monkeypatch,
+                                     tmpdir):
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    monkeypatch.setattr('wfinterop.trs2wes.queue_config', 
+                        lambda: mock_queue_config)
+    monkeypatch.setattr('wfinterop.trs2wes.TRS', 
+                        lambda trs_id: mock_trs)
+    monkeypatch.setattr('wfinterop.trs2wes.workflow_dir', str(tmpdir))
+    # GIVEN a TRS endpoint that can return a workflow's files as a bundle
+    mock_trs.get_workflow_files.return_value = [
+        {'file_type': 'PRIMARY_DESCRIPTOR', 'path': 'main.cwl'},
+        {'file_type': 'SECONDARY_DESCRIPTOR', 'path': 'tools/tool.cwl'}]
+    mock_trs.get_workflow_bundle.return_value = ['main.cwl',
+                                                 'tools/tool.cwl']
+
+    # WHEN the queue's workflow is fetched
+    test_config = fetch_queue_workflow('mock_queue_1')
+
+    # THEN its descriptors are used from the unpacked bundle, without
+    # fetching them one by one
+    test_dir = tmpdir.join('mock_trs', 'mock_wf', 'develop', 'CWL')
+    assert (mock_trs.get_workflow_bundle.call_args[1]['dest']
+            == str(test_dir))
+    assert test_config['workflow_url'] == 'file://{}/main.cwl'.format(
+        test_dir)
+    assert test_config['workflow_attachments'] == [
+        'file://{}/tools/tool.cwl'.format(test_dir)]
+    assert not mock_trs.get_workflow_descriptor_relative.called
+
+
+def test_fetch_queue_workflow_bundle_fallback(mock_orchestratorconfig,
+                                              mock_queue_config,
+                                              mock_trs,
+                                              monkeypatch,
+                                              tmpdir):
+    monkeypatch.setattr('wfinterop.config.config_path', 
+                        str(mock_orchestratorconfig))
+    monkeypatch.setattr('wfinterop.trs2wes.queue_config', 
+                        lambda: mock_queue_config)
+    monkeypatch.setattr('wfinterop.trs2wes.TRS', 
+                        lambda trs_id: mock_trs)
+    monkeypatch.setattr('wfinterop.trs2wes.workflow_dir', str(tmpdir))
+    # GIVEN a bundle missing one of the listed files
+    mock_trs.get_workflow_files.return_value = [
+        {'file_type': 'PRIMARY_DESCRIPTOR', 'path': 'main.cwl'},
+        {'file_type': 'SECONDARY_DESCRIPTOR', 'path': 'tools/tool.cwl'}]
+    mock_trs.get_workflow_bundle.return_value = ['main.cwl']
+    mock_trs.get_workflow_descriptor.return_value = {'url': 'mock_wf_url'}
+    mock_trs.get_workflow_descriptor_relative.return_value = {
+        'url': 'mock_file_url'}
+
+    # WHEN the queue's workflow is fetched
+    test_config = fetch_queue_workflow('mock_queue_1')
+
+    # THEN its descriptors are fetched one by one
+    assert test_config['workflow_url'] == 'mock_wf_url'
+    assert test_config['workflow_attachments'] == ['mock_file_url']
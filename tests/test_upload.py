@@ -0,0 +1,91 @@
+import cgi
+import io
+
+import mock
+import pytest
+
+from wfinterop.blobs import get_blob_store
+from wfinterop.wes.upload import MultipartStream
+from wfinterop.wes.upload import post_run
+
+
+def _parse(body, content_type):
+    environ = {'REQUEST_METHOD': 'POST',
+               'CONTENT_TYPE': content_type,
+               'CONTENT_LENGTH': str(len(body))}
+    return cgi.FieldStorage(fp=io.BytesIO(body), environ=environ)
+
+
+@pytest.mark.parametrize('use_mmap', [False, True])
+def test_multipart_stream(tmpdir, use_mmap):
+    # GIVEN form parts with a field, a file on disk and in-memory content
+    mock_file = tmpdir.join('mock.txt')
+    mock_file.write_binary(b'x' * 100000)
+    mock_parts = [('workflow_url', 'mock.cwl'),
+                  ('workflow_attachment',
+                   ('mock.txt', open(str(mock_file), 'rb'))),
+                  ('workflow_attachment', ('inline.txt', b'inline'))]
+
+    # WHEN the body is read in chunks
+    test_stream = MultipartStream(mock_parts, chunk_size=4096,
+                                  use_mmap=use_mmap)
+    test_chunks = list(iter(lambda: test_stream.read(8192), b''))
+    test_stream.close()
+    test_body = b''.join(test_chunks)
+
+    # THEN no chunk is larger than the chunk size, the declared length
+    # is right, and the body parses as the same form
+    assert max(len(chunk) for chunk in test_chunks) <= 4096
+    assert len(test_body) == len(test_stream)
+    test_form = _parse(test_body, test_stream.content_type)
+    assert test_form.getfirst('workflow_url') == 'mock.cwl'
+    test_files = test_form['workflow_attachment']
+    assert [f.filename for f in test_files] == ['mock.txt', 'inline.txt']
+    assert test_files[0].value == b'x' * 100000
+    assert test_files[1].value == b'inline'
+    assert test_stream.stats()['bytes'] == len(test_body)
+
+
+def test_multipart_stream_file_offset(tmpdir):
+    # GIVEN an attachment that has already been partly read
+    mock_file = tmpdir.join('mock.txt')
+    mock_file.write_binary(b'headerbody')
+    mock_fileobj = open(str(mock_file), 'rb')
+    mock_fileobj.read(6)
+
+    # WHEN it is streamed from a memory map
+    test_stream = MultipartStream(
+        [('workflow_attachment', ('mock.txt', mock_fileobj))],
+        use_mmap=True)
+    test_body = test_stream.read() + test_stream.read() + test_stream.read()
+    test_stream.close()
+
+    # THEN only the rest of the file is sent
+    assert b'\r\n\r\nbody\r\n' in test_body
+    assert b'header' not in test_body
+
+
+def test_post_run_cached_attachment(monkeypatch):
+    # GIVEN a request with a remote attachment that has been cached
+    mock_request = {
+        'workflow_url': 'file://tests/testdata/md5sum.cwl',
+        'workflow_params': 'file://tests/testdata/md5sum.cwl.json',
+        'attachment': ['https://mock.org/tools/mock.cwl']
+    }
+    get_blob_store().put_url('https://mock.org/tools/mock.cwl',
+                             content='mock content')
+    mock_session = mock.Mock(name='mock Session')
+    test_bodies = []
+
+    def mock_post(url, data, headers):
+        test_bodies.append(b''.join(iter(lambda: data.read(8192), b'')))
+        return mock_session.post.return_value
+    mock_session.post.side_effect = mock_post
+
+    # WHEN the run is posted
+    post_run(mock_session, 'https://mock.org/runs', mock_request)
+
+    # THEN the attachment is read from the cache, named by its path
+    assert (b'filename="mock.cwl"\r\n\r\nmock content\r\n'
+            in test_bodies[0])
+    assert not mock_session.get.called
@@ -1,3 +1,4 @@
+import json
 import logging
 import pytest
 import yaml
@@ -47,6 +48,17 @@ def test_save_yaml(tmpdir):
     assert(mock_file.read() == mock_string)
 
 
+def test_save_json_atomic(tmpdir):
+    mock_file = tmpdir.join('mock.json')
+    mock_file.write('{}')
+
+    with pytest.raises(TypeError):
+        util.save_json(str(mock_file), {'section': object()})
+
+    assert(mock_file.read() == '{}')
+    assert(tmpdir.listdir() == [mock_file])
+
+
 def test_get_json(tmpdir):
     mock_string = """
     {
@@ -80,6 +92,45 @@ def test_save_json(tmpdir):
     assert(mock_file.read() == textwrap.dedent(mock_string))
 
 
+def test_iter_documents_jsonl(tmpdir):
+    mock_file = tmpdir.join('mock.jsonl')
+    mock_file.write('{"input": 1}\n\n{"input": 2}\n')
+
+    test_docs = list(util.iter_documents(str(mock_file)))
+
+    assert(test_docs == [{'input': 1}, {'input': 2}])
+
+
+
+def test_iter_workflow_params(tmpdir):
+    mock_file = tmpdir.join('mock.jsonl')
+    mock_file.write('{"input": 1}\n"file:///mock/params.json"\n')
+
+    test_params = list(util.iter_workflow_params(str(mock_file)))
+
+    assert(json.loads(test_params[0]) == {'input': 1})
+    assert(test_params[1] == 'file:///mock/params.json')
+
+def test_iter_documents_yaml(tmpdir):
+    mock_file = tmpdir.join('mock.yaml')
+    mock_file.write('input: 1\n---\n- input: 2\n- input: 3\n')
+
+    test_docs = list(util.iter_documents(str(mock_file)))
+
+    assert(test_docs == [{'input': 1}, {'input': 2}, {'input': 3}])
+
+
+def test_file_signature(tmpdir):
+    mock_file = tmpdir.join('mock.json')
+    mock_file.write('{}')
+
+    test_signature = util.file_signature(str(mock_file))
+    mock_file.write('{"section": {}}')
+
+    assert test_signature[1] == 2
+    assert util.file_signature(str(mock_file)) != test_signature
+
+
 def test_ctime2datetime():
     mock_string = 'Sun Jan 01 00:00:00 2000'
 
@@ -1,16 +1,18 @@
 import mock
 import pytest
-import inspect
 
 from bravado.requests_client import RequestsClient
 from bravado.client import SwaggerClient, ResourceDecorator
 from bravado.testing.response_mocks import BravadoResponseMock
+from requests.exceptions import HTTPError
 from wes_client.util import WESClient
 
 from wfinterop.wes.client import _get_wes_opts
 from wfinterop.wes.client import _init_http_client
 from wfinterop.wes.client import WESAdapter
+from wfinterop.wes.client import DirectWESClient
 from wfinterop.wes.client import load_wes_client
+from wfinterop.wes.client import invalidate_wes_client
 from wfinterop.wes.wrapper import WES
 
 
@@ -42,98 +44,106 @@ def test_load_wes_client_from_spec(mock_wes_config, monkeypatch):
     assert isinstance(test_wes_client, ResourceDecorator)
 
 
+def test_load_wes_client_cached(mock_wes_config, monkeypatch):
+    # GIVEN a WES client that has been loaded once for a service
+    mock_opts = dict(mock_wes_config['mock_wes'])
+    monkeypatch.setattr('wfinterop.wes.client._get_wes_opts', 
+                        lambda x: mock_opts)
+    test_wes_client = load_wes_client(service_id='mock_wes')
+
+    # WHEN the client is loaded again
+    # THEN the same client is returned until the config changes or
+    # the cache is invalidated
+    assert load_wes_client(service_id='mock_wes') is test_wes_client
+    mock_opts['host'] = '0.0.0.0:8081'
+    test_new_client = load_wes_client(service_id='mock_wes')
+    assert test_new_client is not test_wes_client
+    invalidate_wes_client('mock_wes')
+    assert load_wes_client(service_id='mock_wes') is not test_new_client
+
+
 class TestWESAdapter:
     """
-    Tests methods for the :class:`WESAdapter` class, which translate
-    methods from the workflow-service :class:`WESClient` class to match
-    the interface defined in the GA4GH WES API spec. The tests below 
-    check whether the adapter methods are calling adaptee class methods
-    with the correct signature.
+    Tests methods for the :class:`WESAdapter` class, which sends the
+    requests of the workflow-service :class:`WESClient` class with the
+    interface defined in the GA4GH WES API spec. The tests below check
+    whether the adapter methods send requests with the service's
+    settings to the correct path, over the shared session.
     """
-    def test_init(self, mock_wes_config):   
-        mock_client_lib = WESClient(mock_wes_config['mock_wes'])
-
-        test_wes_adapter = WESAdapter(wes_client=mock_client_lib)
-        
-        assert isinstance(test_wes_adapter, WESAdapter)
-        assert hasattr(test_wes_adapter, '_wes_client')
-        assert isinstance(test_wes_adapter._wes_client, WESClient)
+    @pytest.fixture()
+    def mock_session(self, monkeypatch):
+        mock_session = mock.Mock(name='mock Session')
+        mock_session.request.return_value.json.return_value = {'foo': 1}
+        mock_session.opts = []
+        def mock_get_session(opts):
+            mock_session.opts.append(opts)
+            return mock_session
+        monkeypatch.setattr('wfinterop.wes.client.get_session', 
+                            mock_get_session)
+        yield mock_session
+
+    def test_init(self, mock_session, mock_wes_config):   
+        # GIVEN a WES endpoint with its own connection pool options
+        mock_opts = dict(mock_wes_config['mock_wes'], max_connections=50,
+                         timeout=5)
+
+        # WHEN an adapter is created for it
+        test_wes_adapter = WESAdapter(mock_opts)
+
+        # THEN it uses the shared session with the service's options
+        assert isinstance(test_wes_adapter, DirectWESClient)
+        assert mock_session.opts == [mock_opts]
+        assert test_wes_adapter.headers == WESClient(mock_opts).auth
     
-    def test_GetServiceInfo(self, mock_client_lib):
-        mock_response = {}
-        mock_client_lib.get_service_info.return_value = mock_response
-
-        wes_adapter = WESAdapter(wes_client=mock_client_lib)
-        test_args = {arg: '' for arg in 
-                     inspect.getargspec(WESClient.get_service_info)[0][1:]}
-        test_response = wes_adapter.GetServiceInfo()
-
-        mock_client_lib.get_service_info.assert_called_once_with(**test_args)
-        assert test_response == mock_response
-
-    def test_ListRuns(self, mock_client_lib):
-        mock_response = {}
-        mock_client_lib.list_runs.return_value = mock_response
-
-        wes_adapter = WESAdapter(wes_client=mock_client_lib)
-        test_args = {arg: '' for arg in 
-                     inspect.getargspec(WESClient.list_runs)[0][1:]}
-        test_response = wes_adapter.ListRuns()
-
-        mock_client_lib.list_runs.assert_called_once_with(**test_args)
-        assert test_response == mock_response
-
-    def test_RunWorkflow(self, mock_client_lib):
-        mock_request = {'workflow_url': '',
-                        'workflow_params': '',
-                        'attachment': ''}
-        mock_response = {}
-        mock_client_lib.run.return_value = mock_response
-
-        wes_adapter = WESAdapter(wes_client=mock_client_lib)
-        test_args = {arg: '' for arg in 
-                     inspect.getargspec(WESClient.run)[0][1:]}
+    def test_RunWorkflow(self, mock_session, mock_wes_config):
+        mock_request = {
+            'workflow_url': 'file://tests/testdata/md5sum.cwl',
+            'workflow_params': 'file://tests/testdata/md5sum.cwl.json',
+            'attachment': ['file://tests/testdata/md5sum.input']
+        }
+        mock_session.post.return_value.json.return_value = {
+            'run_id': 'mock_run'}
+
+        wes_adapter = WESAdapter(mock_wes_config['mock_wes'])
         test_response = wes_adapter.RunWorkflow(mock_request)
 
-        mock_client_lib.run.assert_called_once_with(**test_args)
-        assert test_response == mock_response
-
-    def test_CancelRun(self, mock_client_lib):
-        mock_response = {}
-        mock_client_lib.cancel.return_value = mock_response
-
-        wes_adapter = WESAdapter(wes_client=mock_client_lib)
-        test_args = {arg: '' for arg in 
-                     inspect.getargspec(WESClient.cancel)[0][1:]}
-        test_response = wes_adapter.CancelRun(run_id='')
-
-        mock_client_lib.cancel.assert_called_once_with(**test_args)
-        assert test_response == mock_response
-
-    def test_GetRunStatus(self, mock_client_lib):
-        mock_response = {}
-        mock_client_lib.get_run_status.return_value = mock_response
-
-        wes_adapter = WESAdapter(wes_client=mock_client_lib)
-        test_args = {arg: '' for arg in 
-                     inspect.getargspec(WESClient.get_run_status)[0][1:]}
-        test_response = wes_adapter.GetRunStatus(run_id='')
-
-        mock_client_lib.get_run_status.assert_called_once_with(**test_args)
-        assert test_response == mock_response
-
-    def test_GetRunLog(self, mock_client_lib):
-        mock_response = {}
-        mock_client_lib.get_run_log.return_value = mock_response
-
-        wes_adapter = WESAdapter(wes_client=mock_client_lib)
-        test_args = {arg: '' for arg in 
-                     inspect.getargspec(WESClient.get_run_log)[0][1:]}
-        test_response = wes_adapter.GetRunLog(run_id='')
-
-        mock_client_lib.get_run_log.assert_called_once_with(**test_args)
-        assert test_response == mock_response
-
+        test_call = mock_session.post.call_args
+        assert test_call[0][0] == 'https://0.0.0.0:8080/ga4gh/wes/v1/runs'
+        assert (test_call[1]['headers']['Content-Type']
+                .startswith('multipart/form-data'))
+        assert test_response['run_id'] == 'mock_run'
+        assert 'upload' in test_response
+
+    @pytest.mark.parametrize('method,args,verb,path', [
+        ('GetServiceInfo', [], 'GET', '/service-info'),
+        ('CancelRun', ['mock_run'], 'POST', '/runs/mock_run/cancel'),
+        ('GetRunStatus', ['mock_run'], 'GET', '/runs/mock_run/status'),
+        ('GetRunLog', ['mock_run'], 'GET', '/runs/mock_run')
+    ])
+    def test_request(self, mock_session, mock_wes_config, 
+                     method, args, verb, path):
+        mock_opts = mock_wes_config['mock_wes']
+        wes_adapter = WESAdapter(mock_opts)
+
+        test_response = getattr(wes_adapter, method)(*args)
+
+        mock_session.request.assert_called_once_with(
+            verb, 'https://0.0.0.0:8080/ga4gh/wes/v1' + path,
+            headers=mock_opts['auth'])
+        assert test_response == {'foo': 1}
+
+    def test_ListRuns_page_token(self, mock_session, mock_wes_config):
+        mock_opts = mock_wes_config['mock_wes']
+        mock_session.request.return_value.json.return_value = {'runs': []}
+
+        wes_adapter = WESAdapter(mock_opts)
+        test_response = wes_adapter.ListRuns(page_token='mock_token')
+
+        mock_session.request.assert_called_once_with(
+            'GET', 'https://0.0.0.0:8080/ga4gh/wes/v1/runs',
+            headers=mock_opts['auth'],
+            params={'page_token': 'mock_token'})
+        assert test_response == {'runs': []}
 
 def test_load_wes_client_from_lib(mock_wes_config, monkeypatch):
     monkeypatch.setattr('wfinterop.wes.client._get_wes_opts', 
@@ -154,6 +164,97 @@ def test_load_wes_client_from_lib(mock_wes_config, monkeypatch):
     assert all([hasattr(test_wes_client, method) for method in spec_methods])
 
 
+def test_load_wes_client_direct(mock_wes_config, monkeypatch):
+    # GIVEN a WES endpoint configured to use the direct client
+    monkeypatch.setattr('wfinterop.wes.client._get_wes_opts', 
+                        lambda x: dict(mock_wes_config['mock_wes'],
+                                       client_library='direct'))
+
+    # WHEN its client is loaded with the default library
+    test_wes_client = load_wes_client(service_id='mock_wes',
+                                      client_library='workflow-service')
+
+    # THEN the configured library is used
+    assert isinstance(test_wes_client, DirectWESClient)
+    assert (test_wes_client.base_url == 
+            'https://0.0.0.0:8080/ga4gh/wes/v1')
+
+
+class TestDirectWESClient:
+    """
+    Tests methods for the :class:`DirectWESClient` class, checking that
+    each calls the correct path of the WES API and returns the decoded
+    JSON response.
+    """
+    @pytest.fixture()
+    def mock_session(self, monkeypatch):
+        mock_session = mock.Mock(name='mock Session')
+        mock_session.request.return_value.json.return_value = {}
+        monkeypatch.setattr('wfinterop.wes.client.get_session', 
+                            lambda opts: mock_session)
+        yield mock_session
+
+    @pytest.mark.parametrize('method,args,verb,path', [
+        ('GetServiceInfo', [], 'GET', '/service-info'),
+        ('CancelRun', ['mock_run'], 'POST', '/runs/mock_run/cancel'),
+        ('GetRunStatus', ['mock_run'], 'GET', '/runs/mock_run/status'),
+        ('GetRunLog', ['mock_run'], 'GET', '/runs/mock_run')
+    ])
+    def test_request(self, mock_session, mock_wes_config, 
+                     method, args, verb, path):
+        mock_opts = mock_wes_config['mock_wes']
+        mock_session.request.return_value.json.return_value = {'foo': 1}
+        wes_client = DirectWESClient(mock_opts)
+
+        test_response = getattr(wes_client, method)(*args)
+
+        mock_session.request.assert_called_once_with(
+            verb, 'https://0.0.0.0:8080/ga4gh/wes/v1' + path,
+            headers=mock_opts['auth'])
+        assert test_response == {'foo': 1}
+
+    def test_ListRuns(self, mock_session, mock_wes_config):
+        wes_client = DirectWESClient(mock_wes_config['mock_wes'])
+
+        wes_client.ListRuns(page_size=10)
+
+        assert (mock_session.request.call_args[1]['params'] == 
+                {'page_size': 10})
+
+    def test_RunWorkflow(self, mock_session, mock_wes_config):
+        mock_request = {
+            'workflow_url': 'file://tests/testdata/md5sum.cwl',
+            'workflow_params': 'file://tests/testdata/md5sum.cwl.json',
+            'attachment': ['file://tests/testdata/md5sum.input']
+        }
+        mock_session.post.return_value.json.return_value = {
+            'run_id': 'mock_run'}
+        test_bodies = []
+
+        def mock_post(url, data, headers):
+            test_bodies.append(b''.join(iter(lambda: data.read(8192), b'')))
+            return mock_session.post.return_value
+        mock_session.post.side_effect = mock_post
+        wes_client = DirectWESClient(mock_wes_config['mock_wes'])
+
+        test_response = wes_client.RunWorkflow(mock_request)
+
+        test_call = mock_session.post.call_args
+        assert test_call[0][0] == 'https://0.0.0.0:8080/ga4gh/wes/v1/runs'
+        assert b'name="workflow_url"\r\n\r\nmd5sum.cwl' in test_bodies[0]
+        assert b'filename="md5sum.input"' in test_bodies[0]
+        assert test_response['run_id'] == 'mock_run'
+        assert test_response['upload']['bytes'] == len(test_bodies[0])
+
+    def test_error(self, mock_session, mock_wes_config):
+        mock_session.request.return_value.raise_for_status.side_effect = (
+            HTTPError())
+        wes_client = DirectWESClient(mock_wes_config['mock_wes'])
+
+        with pytest.raises(HTTPError):
+            wes_client.GetRunStatus('mock_run')
+
+
 class TestWES:
     """
     Tests methods for the :class:`WES` class, which serve as the main
@@ -205,6 +306,24 @@ class TestWES:
         assert isinstance(test_runs, list) 
         assert test_runs == mock_runs
 
+    def test_iter_runs(self, mock_wes_client):
+        mock_pages = {None: {'runs': [{'run_id': 'foo'}],
+                             'next_page_token': 'mock_token'},
+                      'mock_token': {'runs': [{'run_id': 'bar'}],
+                                     'next_page_token': ''}}
+        def mock_list_runs(page_size=None, page_token=None):
+            return BravadoResponseMock(result=mock_pages[page_token])
+        mock_wes_client.ListRuns.side_effect = (
+            lambda **kwargs: mock.Mock(response=mock_list_runs(**kwargs)))
+
+        wes_instance = WES(wes_id='mock_wes', 
+                           api_client=mock_wes_client)
+        test_runs = list(wes_instance.iter_runs(page_size=1))
+
+        assert test_runs == [{'run_id': 'foo'}, {'run_id': 'bar'}]
+        mock_wes_client.ListRuns.assert_called_with(page_size=1,
+                                                    page_token='mock_token')
+
     def test_run_workflow(self, mock_wes_client):
         mock_run_id = {'run_id': 'foo'}
 
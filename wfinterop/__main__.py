@@ -1,18 +1,126 @@
 #!/usr/bin/env python
 
 import sys
+import time
+import datetime as dt
 import argparse
 import pkg_resources  # part of setuptools
 import logging
 from wfinterop.orchestrator import monitor
+from wfinterop.orchestrator import warm_up
+from wfinterop.queue import create_submissions
+from wfinterop.queue import archive_submissions
+from wfinterop.util import iter_workflow_params
+from wfinterop.config import add_from_manifest
+from wfinterop.trs import cache as trs_cache
 
 logging.basicConfig(level=logging.INFO)
 
 
+def submit(args):
+    """
+    Queue one submission per parameter document in a file.
+    """
+    start = time.time()
+    submission_ids = create_submissions(queue_id=args.queue_id,
+                                        submission_data=iter_workflow_params(
+                                            args.params_file),
+                                        wes_id=args.wes_id)
+    elapsed = time.time() - start
+    print(u"Queued %d submissions to '%s' in %.2fs (%.0f submissions/s)"
+          % (len(submission_ids), args.queue_id, elapsed,
+             len(submission_ids) / elapsed if elapsed else 0))
+
+
+def archive(args):
+    """
+    Move old terminal submissions into the submission archive.
+    """
+    archived = archive_submissions(max_age=dt.timedelta(days=args.days),
+                                   queue_ids=args.queue_ids or None)
+    for queue_id, count in sorted(archived.items()):
+        print(u"%s: archived %d submissions" % (queue_id, count))
+
+
+def register(args):
+    """
+    Register the services and queues listed in a manifest.
+    """
+    start = time.time()
+    counts = add_from_manifest(args.manifest)
+    print(u"Registered %d queues, %d tool registries and %d workflow "
+          u"services in %.2fs"
+          % (counts['queues'], counts['toolregistries'],
+             counts['workflowservices'], time.time() - start))
+
+
+def warmup(args):
+    """
+    Prepare queues for dispatching, reporting whether each is ready.
+    """
+    start = time.time()
+    statuses = warm_up(queue_ids=args.queue_ids or None,
+                       refresh=args.refresh)
+    for queue_id, status in sorted(statuses.items()):
+        if status['ready']:
+            print(u"%s: ready (%d attachments, %.2fs)"
+                  % (queue_id, status['attachments'], status['seconds']))
+        else:
+            print(u"%s: not ready: %s" % (queue_id, status['error']))
+    print(u"Warmed up %d of %d queues in %.2fs"
+          % (sum(status['ready'] for status in statuses.values()),
+             len(statuses), time.time() - start))
+
+
 def main(argv=sys.argv[1:]):
 
     parser = argparse.ArgumentParser(description='Synapse Workflow Orchestrator')
     parser.add_argument("--version", action="store_true", default=False)
+    parser.add_argument(
+        "--offline", action="store_true", default=False,
+        help='Only use cached TRS responses, without contacting registries')
+    subparsers = parser.add_subparsers(dest='command')
+
+    monitor_parser = subparsers.add_parser(
+        'monitor',
+        help='Monitor progress of workflow jobs (default)')
+    monitor_parser.add_argument(
+        '--bulk', action='store_true', default=None,
+        help='Refresh run states with one ListRuns request per WES '
+             'endpoint instead of one request per run')
+
+    submit_parser = subparsers.add_parser(
+        'submit',
+        help='Queue workflow jobs from a JSON Lines or YAML file of '
+             'parameter documents')
+    submit_parser.add_argument('queue_id')
+    submit_parser.add_argument('params_file')
+    submit_parser.add_argument('--wes-id', default=None)
+
+    archive_parser = subparsers.add_parser(
+        'archive',
+        help='Move terminal submissions older than --days out of the '
+             'live submission queue')
+    archive_parser.add_argument('queue_ids', nargs='*')
+    archive_parser.add_argument('--days', type=float, default=30)
+
+    register_parser = subparsers.add_parser(
+        'register',
+        help='Register the queues, tool registries and workflow services '
+             'listed in a YAML manifest')
+    register_parser.add_argument('manifest')
+
+    warmup_parser = subparsers.add_parser(
+        'warmup',
+        help='Fetch workflows, cache attachments and build WES clients '
+             'for queues (all by default) before dispatching')
+    warmup_parser.add_argument('queue_ids', nargs='*')
+    warmup_parser.add_argument(
+        '--refresh', action='store_true', default=False,
+        help='Fetch workflows from TRS even if they are already stored')
+
+    if not any(arg in subparsers.choices for arg in argv):
+        argv = list(argv) + ['monitor']
     args = parser.parse_args(argv)
 
     if args.version:
@@ -20,7 +128,19 @@ def main(argv=sys.argv[1:]):
         print(u"%s %s" % (sys.argv[0], pkg[0].version))
         exit(0)
 
-    monitor()
+    if args.offline:
+        trs_cache.offline = True
+
+    if args.command == 'submit':
+        submit(args)
+    elif args.command == 'archive':
+        archive(args)
+    elif args.command == 'register':
+        register(args)
+    elif args.command == 'warmup':
+        warmup(args)
+    else:
+        monitor(bulk=args.bulk)
 
 
 if __name__ == '__main__':
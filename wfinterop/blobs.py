@@ -0,0 +1,167 @@
+"""
+Content-addressed cache of workflow attachments.
+
+Attachment bytes are stored once per SHA-256 digest under ``blob_dir``,
+however many queues or submissions use them. An index maps local file
+paths (with their size and modification time) and remote URLs (e.g.,
+TRS descriptor URLs) to digests, so unchanged files aren't hashed
+again and remote attachments aren't downloaded again.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from requests.compat import urlparse
+
+from wfinterop.sessions import get_session
+
+logger = logging.getLogger(__name__)
+
+blob_dir = os.path.join(os.path.dirname(__file__), 'blobs')
+chunk_size = 64 * 1024
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+class BlobStore(object):
+    """
+    Directory of blobs named by the SHA-256 digest of their content,
+    with an index of the files and URLs they were resolved from.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, 'index.json')
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self.index_path) as f:
+                    self._index = json.load(f)
+            except (IOError, ValueError):
+                self._index = {}
+            self._index.setdefault('files', {})
+            self._index.setdefault('urls', {})
+        return self._index
+
+    def _save_index(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self._index, f)
+        os.rename(tmp_path, self.index_path)
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def has(self, digest):
+        return os.path.exists(self.blob_path(digest))
+
+    def put_chunks(self, chunks):
+        """
+        Store content given as an iterable of byte strings, hashing it
+        as it is written.
+
+        :return: the SHA-256 hex digest of the content
+        """
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+        sha = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+            digest = sha.hexdigest()
+            path = self.blob_path(digest)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def put_bytes(self, data):
+        return self.put_chunks([_to_bytes(data)])
+
+    def put_file(self, path):
+        """
+        Store a local file, unless it is unchanged since it was last
+        stored.
+        """
+        path = os.path.abspath(path)
+        file_stat = os.stat(path)
+        key = [file_stat.st_size, file_stat.st_mtime]
+        with self._lock:
+            entry = self._load_index()['files'].get(path)
+        if entry is not None and entry[:2] == key and self.has(entry[2]):
+            return entry[2]
+        with open(path, 'rb') as f:
+            digest = self.put_chunks(iter(lambda: f.read(chunk_size), b''))
+        with self._lock:
+            self._load_index()['files'][path] = key + [digest]
+            self._save_index()
+        return digest
+
+    def put_url(self, url, content=None):
+        """
+        Store the content of a remote file, downloading it unless it
+        has been stored before or ``content`` is given.
+        """
+        with self._lock:
+            digest = self._load_index()['urls'].get(url)
+        if content is None and digest is not None and self.has(digest):
+            return digest
+        if content is not None:
+            digest = self.put_bytes(content)
+        else:
+            logger.debug("Downloading attachment '{}'".format(url))
+            parsed = urlparse(url)
+            session = get_session({'proto': parsed.scheme,
+                                   'host': parsed.netloc})
+            response = session.get(url, stream=True)
+            response.raise_for_status()
+            digest = self.put_chunks(response.iter_content(chunk_size))
+        with self._lock:
+            self._load_index()['urls'][url] = digest
+            self._save_index()
+        return digest
+
+    def resolve(self, uri):
+        """
+        Store the file at a ``file://``, ``http(s)://`` or local path,
+        and return its digest.
+        """
+        if uri.startswith('http://') or uri.startswith('https://'):
+            return self.put_url(uri)
+        if uri.startswith('file://'):
+            uri = uri[7:]
+        return self.put_file(uri)
+
+
+def get_blob_store():
+    """
+    Return the shared blob store for ``blob_dir``.
+    """
+    with _stores_lock:
+        store = _stores.get(blob_dir)
+        if store is None:
+            store = BlobStore(blob_dir)
+            _stores[blob_dir] = store
+    return store
@@ -2,12 +2,31 @@
 The orchestrator config file has three sections: queues, trs, and wes.
 
 This provides functions to save and get values into these three sections
-in the file.
+in the file. Edits made inside a :class:`transaction` are saved together
+in a single write.
+
+For testbeds with thousands of queues, the config can instead be kept
+in a directory (see :func:`shard_config`) with one file per entry and
+a small index, so that looking up one entry only parses that entry.
 """
 import logging
 import os
-
-from wfinterop.util import get_yaml, save_yaml, heredoc
+import copy
+import shutil
+import tempfile
+import threading
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+from wfinterop.util import get_yaml, save_yaml, file_lock
+from wfinterop.util import file_signature
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -55,20 +74,124 @@ def _default_config():
 
 
 config_path = os.path.join(os.path.dirname(__file__), 'config.yaml')
-if not os.path.exists(config_path):
+config_dir = os.path.join(os.path.dirname(__file__), 'config.d')
+if not os.path.exists(config_path) and not os.path.exists(
+        os.path.join(config_dir, 'index.yaml')):
     _default_config()
 
+config_sections = ['queues', 'toolregistries', 'workflowservices']
+
+_yaml_cache = {}
+_local = threading.local()
+
+
+def _cached_yaml(path):
+    """
+    Return the parsed contents of a YAML file, cached per process and
+    only parsed again when the file changes on disk. Callers must not
+    modify it.
+    """
+    signature = file_signature(path)
+    cached = _yaml_cache.get(path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, get_yaml(path))
+        _yaml_cache[path] = cached
+    return cached[1]
+
+
+def _save_cached_yaml(path, data):
+    save_yaml(path, data)
+    _yaml_cache[path] = (file_signature(path), data)
+
+
+def _sharded():
+    # a directory without an index was never completely sharded
+    return os.path.exists(_index_path())
+
+
+def _index_path(root=None):
+    return os.path.join(root or config_dir, 'index.yaml')
+
+
+def _entry_path(section, service, root=None):
+    return os.path.join(root or config_dir, section,
+                        '{}.yaml'.format(quote(service, safe='')))
+
+
+def _lock_path():
+    return _index_path() if _sharded() else config_path
+
+
+def _load_config():
+    return _cached_yaml(config_path)
+
+
+def _load_index():
+    return _cached_yaml(_index_path()) or {}
+
+
+def _pending():
+    return getattr(_local, 'edits', None) or {}
+
+
+def _get_entry(section, service):
+    """
+    Return a copy of one config entry, including pending edits.
+    """
+    pending = _pending()
+    if (section, service) in pending:
+        return copy.deepcopy(pending[(section, service)])
+    if _sharded():
+        if service not in _load_index().get(section, []):
+            raise KeyError(service)
+        return copy.deepcopy(_cached_yaml(_entry_path(section, service)))
+    return copy.deepcopy((_load_config().get(section) or {})[service])
+
+
+def _entry_ids(section):
+    if _sharded():
+        ids = list(_load_index().get(section, []))
+    else:
+        ids = list(_load_config().get(section) or {})
+    ids += [service for (edit_section, service) in _pending()
+            if edit_section == section and service not in ids]
+    return ids
+
+
+class ConfigSection(Mapping):
+    """
+    Read-only view of one section of the config, which loads (and
+    copies) entries only as they are accessed.
+    """
+    def __init__(self, section):
+        self.section = section
+
+    def __getitem__(self, service):
+        return _get_entry(self.section, service)
+
+    def __iter__(self):
+        return iter(_entry_ids(self.section))
+
+    def __len__(self):
+        return len(_entry_ids(self.section))
+
+    def __contains__(self, service):
+        return service in _entry_ids(self.section)
+
+    def __repr__(self):
+        return 'ConfigSection({!r})'.format(self.section)
+
 
 def queue_config():
-    return get_yaml(config_path)['queues']
+    return ConfigSection('queues')
 
 
 def trs_config():
-    return get_yaml(config_path)['toolregistries']
+    return ConfigSection('toolregistries')
 
 
 def wes_config():
-    return get_yaml(config_path)['workflowservices']
+    return ConfigSection('workflowservices')
 
 
 def add_queue(queue_id,
@@ -102,35 +225,78 @@ def add_queue(queue_id,
     set_yaml('queues', queue_id, config)
 
 
+def _endpoint_opts(**opts):
+    return {k: v for k, v in opts.items() if v is not None}
+
+
 def add_toolregistry(service,
                      host,
                      auth={'Authorization': ''},
-                     proto='https'):
+                     proto='https',
+                     max_connections=None,
+                     timeout=None,
+                     rate_limit=None,
+                     burst=None,
+                     max_in_flight=None):
     """
     Register a Tool Registry Service endpoint to the orchestrator's
     search space for workflows.
 
     :param trs_id: string ID of TRS endpoint (e.g., 'dockstore')
+    :param max_connections: size of the keep-alive connection pool
+        for the endpoint's host
+    :param timeout: default request timeout, in seconds
+    :param rate_limit: maximum average number of requests per second
+    :param burst: number of requests allowed in a burst above the
+        rate limit
+    :param max_in_flight: maximum number of concurrent requests
     """
     config = {'auth': auth,
               'host': host,
               'proto': proto}
+    config.update(_endpoint_opts(max_connections=max_connections,
+                                 timeout=timeout,
+                                 rate_limit=rate_limit,
+                                 burst=burst,
+                                 max_in_flight=max_in_flight))
     set_yaml('toolregistries', service, config)
 
 
 def add_workflowservice(service,
                         host,
                         auth={'Authorization': ''},
-                        proto='https'):
+                        proto='https',
+                        max_connections=None,
+                        timeout=None,
+                        rate_limit=None,
+                        burst=None,
+                        max_in_flight=None,
+                        client_library=None):
     """
     Register a Workflow Execution Service endpoint to the
     orchestrator's available environment options.
 
     :param wes_id: string ID of WES endpoint (e.g., 'local')
+    :param max_connections: size of the keep-alive connection pool
+        for the endpoint's host
+    :param timeout: default request timeout, in seconds
+    :param rate_limit: maximum average number of requests per second
+    :param burst: number of requests allowed in a burst above the
+        rate limit
+    :param max_in_flight: maximum number of concurrent requests
+    :param client_library: WES client to use for the endpoint:
+        'workflow-service' (the default used by :class:`WES`), 'bravado'
+        or 'direct' (see :func:`wfinterop.wes.client.load_wes_client`)
     """
     config = {'auth': auth,
               'host': host,
               'proto': proto}
+    config.update(_endpoint_opts(max_connections=max_connections,
+                                 timeout=timeout,
+                                 rate_limit=rate_limit,
+                                 burst=burst,
+                                 max_in_flight=max_in_flight,
+                                 client_library=client_library))
     set_yaml('workflowservices', service, config)
 
 
@@ -141,88 +307,239 @@ def add_wes_opt(queue_ids, wes_id, make_default=False):
     """
     if not isinstance(queue_ids, list):
         queue_ids = [queue_ids]
-    for queue_id in queue_ids:
-        wf_config = queue_config()[queue_id]
+
+    def add_opt(wf_config):
         wf_config['wes_opts'].append(wes_id)
         if make_default:
             wf_config['wes_default'] = wes_id
-        set_yaml('queues', queue_id, wf_config)
+        return wf_config
+    with transaction():
+        for queue_id in queue_ids:
+            _get_entry('queues', queue_id)
+            modify_yaml('queues', queue_id, add_opt)
 
 
 def set_yaml(section, service, var2add):
-    orchestrator_config = get_yaml(config_path)
-    orchestrator_config.setdefault(section, {})[service] = var2add
-    save_yaml(config_path, orchestrator_config)
+    modify_yaml(section, service, lambda current: var2add)
 
 
-def show():
+def modify_yaml(section, service, change):
     """
-    Show current application configuration.
+    Replace the config of a service with ``change(current_config)``.
+
+    The config file is locked while it is read, changed and (atomically)
+    rewritten, so concurrent processes never overwrite each other's
+    edits, and ``change`` always sees the latest version of the entry.
     """
-    orchestrator_config = get_yaml(config_path)
-    queue_lines = []
-    for queue_id in orchestrator_config['queues']:
-        wf_config = orchestrator_config['queues'][queue_id]
-        wf_id = wf_config['workflow_id']
-        version_id = wf_config['version_id']
-        wf_url = wf_config['workflow_url']
-        queue_attach = wf_config['workflow_attachments']
-        if queue_attach:
-            wf_attachments = '\n    - {}'.format(
-                '\n    - '.join(queue_attach)
-            )
-        else:
-            wf_attachments = queue_attach
-        wf_type = wf_config['workflow_type']
-        wf_trs = wf_config['trs_id']
-        wf_wes_opts = wf_config['wes_opts']
-        queue_lines.append(
-            ('{}: {} ({})\n'
-             '  > workflow URL: {}\n'
-             '  > workflow attachments: {}\n'
-             '  > workflow type: {}\n'
-             '  > from TRS: {}\n'
-             '  > WES options: {}').format(
-                 queue_id,
-                 wf_id,
-                 version_id,
-                 wf_url,
-                 wf_attachments,
-                 wf_type,
-                 wf_trs,
-                 wf_wes_opts
-            )
-        )
+    with transaction():
+        try:
+            current = _get_entry(section, service)
+        except KeyError:
+            current = None
+        _local.edits[(section, service)] = change(current)
+
+
+def _commit(edits):
+    if _sharded():
+        index = copy.deepcopy(_load_index())
+        for (section, service), entry in edits.items():
+            path = _entry_path(section, service)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            _save_cached_yaml(path, entry)
+            ids = index.setdefault(section, [])
+            if service not in ids:
+                ids.append(service)
+        # new entries only become visible once the index is saved
+        _save_cached_yaml(_index_path(), index)
+    else:
+        orchestrator_config = copy.deepcopy(_load_config())
+        for (section, service), entry in edits.items():
+            orchestrator_config.setdefault(section, {})[service] = entry
+        _save_cached_yaml(config_path, orchestrator_config)
+
+
+class transaction(object):
+    """
+    Context manager that batches any number of config edits
+    (:func:`add_queue`, :func:`add_toolregistry`,
+    :func:`add_workflowservice`, :func:`add_wes_opt`, :func:`set_yaml`)
+    into one atomic write, made when the outermost block exits.
 
-    queues = '\n'.join(queue_lines)
-    trs = '\n'.join('{}: {}'.format(
-        k,
-        orchestrator_config['toolregistries'][k]['host'])
-        for k in orchestrator_config['toolregistries']
-    )
-    wes = '\n'.join('{}: {}'.format(
-        k,
-        orchestrator_config['workflowservices'][k]['host'])
-        for k in orchestrator_config['workflowservices']
+    The config file stays locked for the duration of the block, and
+    no edits are saved if the block raises an exception. Reads made
+    inside the block see the pending edits.
+
+    With a sharded config, each edited entry file is replaced
+    atomically and the index is saved last.
+
+    ::
+
+        with config.transaction():
+            for queue_id in queue_ids:
+                config.add_queue(queue_id, ...)
+    """
+    def __enter__(self):
+        if getattr(_local, 'depth', 0) == 0:
+            lock_path = _lock_path()
+            self.lock = file_lock(lock_path).__enter__()
+            # the config may have been sharded while waiting for the lock
+            while _lock_path() != lock_path:
+                self.lock.__exit__(None, None, None)
+                lock_path = _lock_path()
+                self.lock = file_lock(lock_path).__enter__()
+            _local.edits = {}
+            _local.depth = 0
+        _local.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.depth -= 1
+        if _local.depth > 0:
+            return
+        try:
+            if exc_type is None and _local.edits:
+                _commit(_local.edits)
+        finally:
+            _local.edits = None
+            self.lock.__exit__(exc_type, exc_value, traceback)
+
+
+def shard_config():
+    """
+    Convert the single config file into the sharded layout under
+    ``config_dir``, which is used from then on.
+
+    The layout is written to a temporary directory, with the config
+    file locked, and renamed into place once complete; until then, the
+    config file is still used.
+
+    :return: dict of the number of entries per section
+    """
+    with file_lock(config_path):
+        if _sharded():
+            raise ValueError("Config is already sharded in '{}'"
+                             .format(config_dir))
+        orchestrator_config = get_yaml(config_path)
+        parent = os.path.dirname(os.path.abspath(config_dir))
+        tmp_dir = tempfile.mkdtemp(
+            dir=parent, prefix='.{}.'.format(os.path.basename(config_dir)))
+        try:
+            index = {}
+            for section in config_sections:
+                entries = orchestrator_config.get(section) or {}
+                for service, entry in entries.items():
+                    path = _entry_path(section, service, root=tmp_dir)
+                    if not os.path.isdir(os.path.dirname(path)):
+                        os.makedirs(os.path.dirname(path))
+                    save_yaml(path, entry)
+                    index.setdefault(section, []).append(service)
+            save_yaml(_index_path(root=tmp_dir), index)
+            os.chmod(tmp_dir, 0o755)
+            if os.path.isdir(config_dir):
+                # left over from a conversion that was interrupted
+                shutil.rmtree(config_dir)
+            os.rename(tmp_dir, config_dir)
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+    return {section: len(index.get(section, []))
+            for section in config_sections}
+
+
+def add_from_manifest(manifest_path):
+    """
+    Register all tool registries, workflow services and queues listed
+    in a YAML manifest, in a single config write.
+
+    The manifest has the same three sections as the config file; each
+    entry holds the keyword arguments of :func:`add_toolregistry`,
+    :func:`add_workflowservice` or :func:`add_queue`, respectively::
+
+        toolregistries:
+          dockstore: {host: dockstore.org:8443}
+        workflowservices:
+          arvados-wes: {host: wes.qr1hi.arvadosapi.com}
+        queues:
+          demo_queue:
+            wf_type: CWL
+            wf_id: github.com/dockstore-testing/md5sum-checker
+            version_id: develop
+            wes_opts: [local, arvados-wes]
+
+    :return: dict of the number of entries registered per section
+    """
+    manifest = get_yaml(manifest_path) or {}
+    sections = [('toolregistries', add_toolregistry),
+                ('workflowservices', add_workflowservice),
+                ('queues', add_queue)]
+    with transaction():
+        for section, add in sections:
+            for service, kwargs in (manifest.get(section) or {}).items():
+                if section == 'queues':
+                    add(queue_id=service, **kwargs)
+                else:
+                    add(service=service, **kwargs)
+    return {section: len(manifest.get(section) or {})
+            for section, _ in sections}
+
+
+def _show_queue(queue_id, wf_config):
+    queue_attach = wf_config['workflow_attachments']
+    if queue_attach:
+        wf_attachments = '\n    - {}'.format(
+            '\n    - '.join(queue_attach)
+        )
+    else:
+        wf_attachments = queue_attach
+    return ('{}: {} ({})\n'
+            '  > workflow URL: {}\n'
+            '  > workflow attachments: {}\n'
+            '  > workflow type: {}\n'
+            '  > from TRS: {}\n'
+            '  > WES options: {}').format(
+                queue_id,
+                wf_config['workflow_id'],
+                wf_config['version_id'],
+                wf_config['workflow_url'],
+                wf_attachments,
+                wf_config['workflow_type'],
+                wf_config['trs_id'],
+                wf_config['wes_opts']
     )
-    display = heredoc('''
-        Orchestrator options:
-
-        Workflow Evaluation Queues
-        (queue ID: workflow ID [version])
-        ---------------------------------------------------------------------------
-        {queues}
-
-        Tool Registries
-        (TRS ID: host address)
-        ---------------------------------------------------------------------------
-        {trs}
-
-        Workflow Services
-        (WES ID: host address)
-        ---------------------------------------------------------------------------
-        {wes}
-        ''', {'queues': queues,
-              'trs': trs,
-              'wes': wes})
-    print(display)
+
+
+def _show_lines():
+    """
+    Yield the lines of :func:`show`, loading one entry at a time.
+    """
+    rule = '-' * 75
+    headers = [('queues', 'Workflow Evaluation Queues',
+                '(queue ID: workflow ID [version])'),
+               ('toolregistries', 'Tool Registries',
+                '(TRS ID: host address)'),
+               ('workflowservices', 'Workflow Services',
+                '(WES ID: host address)')]
+    yield 'Orchestrator options:'
+    for section, title, legend in headers:
+        yield ''
+        yield title
+        yield legend
+        yield rule
+        entries = ConfigSection(section)
+        if not entries:
+            yield ''
+        for service in entries:
+            if section == 'queues':
+                yield _show_queue(service, entries[service])
+            else:
+                yield '{}: {}'.format(service, entries[service]['host'])
+    yield ''
+
+
+def show():
+    """
+    Show current application configuration.
+    """
+    for line in _show_lines():
+        print(line)
@@ -10,11 +10,21 @@ import logging
 import sys
 import time
 import os
+import re
+import heapq
+import threading
+import collections
 import datetime as dt
+from multiprocessing.pool import ThreadPool
 
 from IPython.display import display, clear_output
+from wes_client.util import expand_globs
 
+from wfinterop.blobs import get_blob_store
 from wfinterop.config import queue_config
+from wfinterop.config import wes_config
+from wfinterop.sessions import default_max_connections
+from wfinterop.resilience import is_transient
 from wfinterop.util import ctime2datetime, convert_timedelta
 from wfinterop.wes import WES
 from wfinterop.trs2wes import fetch_queue_workflow
@@ -22,11 +32,29 @@ from wfinterop.trs2wes import store_verification
 from wfinterop.queue import get_submission_bundle
 from wfinterop.queue import get_submissions
 from wfinterop.queue import create_submission
-from wfinterop.queue import update_submission
+from wfinterop.queue import update_submissions
+from wfinterop.queue import claim_submissions
+from wfinterop.queue import renew_claim
+from wfinterop.queue import release_stale_claims
+from wfinterop.queue import update_claimed_submissions
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# number of threads used to poll run statuses in monitor_queue
+monitor_workers = 32
+# refresh run states from ListRuns rather than one GetRunStatus per run
+bulk_refresh = False
+# page size requested when listing runs for a bulk refresh
+list_page_size = 1000
+
+_poll_semaphores = {}
+_poll_semaphores_lock = threading.Lock()
+
+# readiness of each queue from its last warm-up: {queue ID: status}
+_queue_status = {}
+_queue_status_lock = threading.Lock()
+
 
 def run_job(queue_id,
             wes_id,
@@ -35,6 +63,10 @@ def run_job(queue_id,
             submission=False):
     """
     Put a workflow in the queue and immmediately run it.
+
+    The submission is claimed by this worker as it is created, so that
+    :func:`run_queue` doesn't run it too; if the run can't be created,
+    it is handed back to the queue.
     """
     wf_config = queue_config()[queue_id]
     if wf_config['workflow_url'] is None:
@@ -47,26 +79,45 @@ def run_job(queue_id,
     if not submission:
         submission_id = create_submission(queue_id=queue_id,
                                           submission_data=wf_jsonyaml,
-                                          wes_id=wes_id)
+                                          wes_id=wes_id,
+                                          claim=True)
     wes_instance = WES(wes_id)
     request = {'workflow_url': wf_config['workflow_url'],
                'workflow_params': wf_jsonyaml,
                'attachment': wf_attachments}
-    run_log = wes_instance.run_workflow(request)
+    try:
+        run_log = wes_instance.run_workflow(request)
+    except Exception:
+        if not submission:
+            update_claimed_submissions(
+                queue_id, {submission_id: {'status': 'RECEIVED'}})
+        raise
     run_log['start_time'] = dt.datetime.now().ctime()
-    run_status = wes_instance.get_run_status(run_log['run_id'])['state']
+    try:
+        run_status = wes_instance.get_run_status(run_log['run_id'])['state']
+    except Exception as e:
+        # the run has been created, so it mustn't be submitted again;
+        # the monitor fills in its state later
+        logger.warning("Couldn't get status of run '{}' on '{}': {}"
+                       .format(run_log['run_id'], wes_id, e))
+        run_status = 'UNKNOWN'
     run_log['status'] = run_status
 
     if not submission:
-        update_submission(queue_id, submission_id, 'run_log', run_log)
-        update_submission(queue_id, submission_id, 'status', 'SUBMITTED')
+        update_claimed_submissions(queue_id, {submission_id: {
+            'run_log': run_log,
+            'status': 'SUBMITTED'}})
     return run_log
 
 
-def run_submission(queue_id, submission_id, wes_id=None):
+def run_submission(queue_id, submission_id, wes_id=None, batch=None):
     """
     For a single submission to a single evaluation queue, run
     the workflow in a single environment.
+
+    :param batch: optional dict collecting submission updates by
+        submission ID; if given, the caller is responsible for
+        saving them with :func:`update_submissions`
     """
     submission = get_submission_bundle(queue_id, submission_id)
     if submission['wes_id'] is not None:
@@ -83,93 +134,494 @@ def run_submission(queue_id, submission_id, wes_id=None):
                       wf_jsonyaml=wf_jsonyaml,
                       submission=True)
 
-    update_submission(queue_id, submission_id, 'run_log', run_log)
-    update_submission(queue_id, submission_id, 'status', 'SUBMITTED')
+    fields = {'run_log': run_log, 'status': 'SUBMITTED'}
+    if batch is None:
+        update_submissions({queue_id: {submission_id: fields}})
+    else:
+        batch[submission_id] = fields
     return run_log
 
 
-def run_queue(queue_id, wes_id=None):
+def run_queue(queue_id, wes_id=None, claim_max_age=dt.timedelta(hours=1)):
     """
     Run all submissions in a queue in a single environment.
+
+    Submissions are claimed before they are run, so several
+    orchestrator processes can work through the same queue without
+    running any submission twice. Submissions that can't be sent to
+    an unavailable WES endpoint are left in the queue; once a run has
+    been created, its submission is recorded as submitted right away,
+    even if its status can't be read yet.
+
+    :param claim_max_age: age after which claims left behind by
+        workers that died are released (see
+        :func:`wfinterop.queue.release_stale_claims`); each claim is
+        renewed right before its submission is run
     """
     queue_log = {}
-    for submission_id in get_submissions(queue_id, status='RECEIVED'):
-        submission = get_submission_bundle(queue_id, submission_id)
-        if submission['wes_id'] is not None:
-            wes_id = submission['wes_id']
-        run_log = run_submission(queue_id, submission_id, wes_id)
-        run_log['wes_id'] = wes_id
-        queue_log[submission_id] = run_log
+    saved = set()
+    release_stale_claims(max_age=claim_max_age, queue_ids=[queue_id])
+    claimed = claim_submissions(queue_id,
+                                get_submissions(queue_id, status='RECEIVED'))
+    try:
+        for submission_id in claimed:
+            if not renew_claim(queue_id, submission_id):
+                # released as stale, and maybe run by another worker
+                saved.add(submission_id)
+                continue
+            submission = get_submission_bundle(queue_id, submission_id)
+            if submission['wes_id'] is not None:
+                wes_id = submission['wes_id']
+            batch = {}
+            try:
+                run_log = run_submission(queue_id, submission_id, wes_id,
+                                         batch=batch)
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                # leave it in the queue, and carry on with other endpoints
+                logger.warning("Couldn't submit '{}' to '{}': {}"
+                               .format(submission_id, wes_id, e))
+                continue
+            # record the run before moving on, so it's never run again
+            update_claimed_submissions(queue_id, batch)
+            saved.add(submission_id)
+            queue_log[submission_id] = dict(run_log, wes_id=wes_id)
+    finally:
+        # hand back anything not run (e.g., after an error) to the queue
+        update_claimed_submissions(
+            queue_id, {submission_id: {'status': 'RECEIVED'}
+                       for submission_id in claimed
+                       if submission_id not in saved})
 
     return queue_log
 
 
-def run_all():
+def run_all(warm=False):
     """
     Run all jobs with the status: RECEIVED across all evaluation queues.
     Check the status of each submission per queue for status: COMPLETE
     before running the next queued submission.
+
+    Queues that failed to warm up (see :func:`warm_up`) are skipped.
+
+    :param warm: warm up any queues that haven't been yet, and only run
+        those that are ready
     """
+    queue_ids = list(queue_config())
+    if warm:
+        warm_up([queue_id for queue_id in queue_ids
+                 if not queue_ready(queue_id)])
     orchestrator_log = {}
-    for queue_id in queue_config():
+    for queue_id in queue_ids:
+        with _queue_status_lock:
+            status = _queue_status.get(queue_id)
+        if status is not None and not status['ready']:
+            logger.warning("Not running queue '{}', which isn't ready"
+                           .format(queue_id))
+            continue
         orchestrator_log[queue_id] = run_queue(queue_id)
     return orchestrator_log
 
 
-def monitor_queue(queue_id):
+def _warm_up_queue(queue_id, refresh=False):
     """
-    Update the status of all submissions for a queue.
+    Resolve a queue's workflow, cache its attachments and build API
+    clients for its WES endpoints.
     """
-    current = dt.datetime.now()
-    queue_log = {}
-    for sub_id in get_submissions(queue_id=queue_id,
-                                  exclude_status='RECEIVED'):
-        submission = get_submission_bundle(queue_id, sub_id)
-        run_log = submission['run_log']
-        if run_log['status'] in ['COMPLETE', 'CANCELED', 'EXECUTOR_ERROR']:
-            queue_log[sub_id] = run_log
-            next
-        wes_instance = WES(submission['wes_id'])
-        run_status = wes_instance.get_run_status(run_log['run_id'])
-
-        if run_status['state'] in ['QUEUED', 'INITIALIZING', 'RUNNING']:
-            etime = convert_timedelta(
-                current - ctime2datetime(run_log['start_time'])
-            )
-        elif 'elapsed_time' not in run_log:
-            etime = 0
+    start = time.time()
+    status = {'ready': False, 'seconds': None, 'attachments': 0,
+              'error': None}
+    try:
+        wf_config = queue_config()[queue_id]
+        if refresh or wf_config['workflow_url'] is None:
+            wf_config = fetch_queue_workflow(queue_id)
+        store = get_blob_store()
+        attachments = expand_globs(wf_config['workflow_attachments'] or [])
+        for attachment in attachments:
+            store.resolve(attachment)
+        wes_ids = set(wf_config.get('wes_opts') or [])
+        if wf_config.get('wes_default'):
+            wes_ids.add(wf_config['wes_default'])
+        for wes_id in wes_ids:
+            WES(wes_id)
+        status.update(ready=True, attachments=len(attachments))
+    except Exception as e:
+        logger.warning("Couldn't warm up queue '{}'".format(queue_id),
+                       exc_info=True)
+        status['error'] = str(e) or e.__class__.__name__
+    status['seconds'] = round(time.time() - start, 3)
+    with _queue_status_lock:
+        _queue_status[queue_id] = status
+    return status
+
+
+def warm_up(queue_ids=None, refresh=False):
+    """
+    Prepare queues for dispatching: fetch each queue's workflow from TRS
+    (unless already stored, or ``refresh`` is set), cache its
+    attachments and build clients for its WES endpoints, for all queues
+    concurrently.
+
+    :return: readiness of each queue, as ``{'ready', 'seconds',
+        'attachments', 'error'}`` keyed by queue ID
+    """
+    if queue_ids is None:
+        queue_ids = list(queue_config())
+    statuses = _map_concurrently(
+        lambda queue_id: _warm_up_queue(queue_id, refresh=refresh),
+        list(queue_ids))
+    return dict(zip(queue_ids, statuses))
+
+
+def queue_ready(queue_id):
+    """
+    Return whether a queue's last warm-up succeeded.
+    """
+    with _queue_status_lock:
+        return (_queue_status.get(queue_id) or {}).get('ready', False)
+
+
+def _poll_semaphore(wes_id):
+    """
+    Return the semaphore capping concurrent status requests to a WES
+    endpoint, sized by its ``max_connections`` option.
+    """
+    opts = wes_config().get(wes_id) or {}
+    limit = opts.get('max_connections') or default_max_connections
+    with _poll_semaphores_lock:
+        key = (wes_id, limit)
+        if key not in _poll_semaphores:
+            _poll_semaphores[key] = threading.BoundedSemaphore(limit)
+        return _poll_semaphores[key]
+
+
+def _poll_run_status(request):
+    wes_id, run_id = request
+    try:
+        with _poll_semaphore(wes_id):
+            return WES(wes_id).get_run_status(run_id), None
+    except Exception as e:
+        return None, e
+
+
+def _map_concurrently(func, items):
+    """
+    Return ``[func(item) for item in items]``, calling ``func`` from
+    up to ``monitor_workers`` threads at once.
+    """
+    if len(items) < 2:
+        return [func(item) for item in items]
+    pool = ThreadPool(min(monitor_workers, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+
+
+def _poll_run_statuses(requests):
+    """
+    Get the status of many runs, as ``(status, error)`` tuples in the
+    order of ``requests``, with up to ``monitor_workers`` requests in
+    flight at once.
+    """
+    return _map_concurrently(_poll_run_status, requests)
+
+
+def _list_run_states(endpoint):
+    """
+    Look up the states of a set of runs by paging through the run
+    listing of their WES endpoint, stopping once all are found.
+    """
+    wes_id, run_ids = endpoint
+    states = {}
+    try:
+        with _poll_semaphore(wes_id):
+            for run in WES(wes_id).iter_runs(page_size=list_page_size):
+                if run.get('run_id') in run_ids:
+                    states[run['run_id']] = run['state']
+                    if len(states) == len(run_ids):
+                        break
+    except Exception:
+        logger.warning("Listing runs failed for '{}'".format(wes_id),
+                       exc_info=True)
+    return states
+
+
+def _list_run_statuses(requests):
+    """
+    Like :func:`_poll_run_statuses`, but with a single (paginated)
+    ListRuns request per endpoint, only polling runs individually that
+    are missing from the listing.
+    """
+    endpoints = {}
+    for wes_id, run_id in requests:
+        endpoints.setdefault(wes_id, set()).add(run_id)
+    endpoints = list(endpoints.items())
+    listed = {}
+    for (wes_id, _), states in zip(endpoints,
+                                   _map_concurrently(_list_run_states,
+                                                     endpoints)):
+        listed.update({(wes_id, run_id): state
+                       for run_id, state in states.items()})
+    missing = [request for request in requests if request not in listed]
+    if missing:
+        logger.debug("{} runs missing from listings; polling them"
+                     .format(len(missing)))
+    polled = dict(zip(missing, _poll_run_statuses(missing)))
+    return [({'run_id': request[1], 'state': listed[request]}, None)
+            if request in listed else polled[request]
+            for request in requests]
+
+
+class PollScheduler(object):
+    """
+    Decide when :func:`monitor` next polls the status of each active
+    run, so that runs are only polled when due.
+
+    A run is polled every ``min_interval`` seconds right after it is
+    submitted or changes state; while its state stays the same, the
+    interval grows by ``backoff`` up to ``max_interval``. Once runs of
+    the same queue and WES endpoint have completed, their median
+    runtime is used as the expected runtime, and polls are tightened
+    again as a run approaches it.
+
+    Due times are kept in one heap per queue, so finding the runs due
+    for polling doesn't require scanning every run. The last queue log
+    reported for each queue is kept in ``logs``, so that runs which
+    aren't due (or have finished) are reported without loading them.
+    """
+    def __init__(self, min_interval=1, max_interval=300, backoff=2,
+                 history=20):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.history = history
+        self._heaps = {}
+        self._runs = {}
+        self._runtimes = {}
+        self._recorded = set()
+        self.logs = {}
+
+    def pop_due(self, queue_id, now=None):
+        """
+        Return the IDs of submissions in a queue that are due for
+        polling, which stay unscheduled until :meth:`update` is called.
+        """
+        now = time.time() if now is None else now
+        heap = self._heaps.get(queue_id, [])
+        due = set()
+        while heap and heap[0][0] <= now:
+            due_time, sub_id = heapq.heappop(heap)
+            run = self._runs.get((queue_id, sub_id))
+            # skip entries superseded by a later update
+            if run is not None and run['due'] == due_time:
+                run['due'] = None
+                due.add(sub_id)
+        return due
+
+    def is_scheduled(self, queue_id, sub_id):
+        run = self._runs.get((queue_id, sub_id))
+        return run is not None and run['due'] is not None
+
+    def expected_runtime(self, queue_id, wes_id):
+        """
+        Return the median runtime, in seconds, of completed runs of a
+        queue on a WES endpoint, or ``None`` without any history.
+        """
+        runtimes = sorted(self._runtimes.get((queue_id, wes_id)) or [])
+        if not runtimes:
+            return None
+        return runtimes[len(runtimes) // 2]
+
+    def update(self, queue_id, sub_id, wes_id, run_log, now=None):
+        """
+        Schedule the next poll of a run after its status was refreshed,
+        or stop polling it (and record its runtime) once it finished.
+        """
+        now = time.time() if now is None else now
+        key = (queue_id, sub_id)
+        state = run_log['status']
+        if state in ['COMPLETE', 'CANCELED', 'EXECUTOR_ERROR']:
+            self._runs.pop(key, None)
+            if state == 'COMPLETE' and key not in self._recorded:
+                self._recorded.add(key)
+                runtime = _elapsed_seconds(run_log.get('elapsed_time'))
+                if runtime:
+                    self._runtimes.setdefault(
+                        (queue_id, wes_id),
+                        collections.deque(maxlen=self.history)
+                    ).append(runtime)
+            return
+
+        run = self._runs.get(key)
+        if run is None or run['state'] != state:
+            interval = self.min_interval
         else:
-            etime = run_log['elapsed_time']
+            interval = min(run['interval'] * self.backoff,
+                           self.max_interval)
+        expected = self.expected_runtime(queue_id, wes_id)
+        elapsed = _started_seconds_ago(run_log, now)
+        if expected is not None and elapsed is not None:
+            remaining = expected - elapsed
+            if remaining > 0:
+                interval = min(interval,
+                               max(self.min_interval, remaining / 2.0))
+
+        due_time = now + interval
+        self._runs[key] = {'state': state,
+                           'interval': interval,
+                           'due': due_time}
+        heapq.heappush(self._heaps.setdefault(queue_id, []),
+                       (due_time, sub_id))
+
+
+def _elapsed_seconds(elapsed_time):
+    """
+    Convert an elapsed time formatted by :func:`convert_timedelta`
+    to seconds.
+    """
+    match = re.match(r'(\d+)h:(\d+)m:(\d+)s$', str(elapsed_time))
+    if match is None:
+        return None
+    hours, minutes, seconds = [int(g) for g in match.groups()]
+    return hours * 3600 + minutes * 60 + seconds
 
-        run_log['status'] = run_status['state']
-        run_log['elapsed_time'] = etime
 
-        update_submission(queue_id, sub_id, 'run_log', run_log)
+def _started_seconds_ago(run_log, now):
+    try:
+        start = time.mktime(
+            ctime2datetime(run_log['start_time']).timetuple())
+    except (KeyError, TypeError, ValueError):
+        return None
+    return now - start
+
 
-        if run_log['status'] == 'COMPLETE':
-            wf_config = queue_config()[queue_id]
-            sub_status = run_log['status']
-            if wf_config['target_queue']:
-                store_verification(wf_config['target_queue'],
-                                   submission['wes_id'])
-                sub_status = 'VALIDATED'
-            update_submission(queue_id, sub_id, 'status', sub_status)
+def monitor_queue(queue_id, bulk=None, scheduler=None):
+    """
+    Update the status of all submissions for a queue.
 
-        run_log['wes_id'] = submission['wes_id']
-        queue_log[sub_id] = run_log
+    Status requests for all active runs are sent concurrently (see
+    :data:`monitor_workers`), at most ``max_connections`` at a time to
+    any one WES endpoint. With ``bulk`` (default: :data:`bulk_refresh`),
+    states are instead read from one paginated ListRuns per endpoint,
+    and only runs missing from the listing are polled individually.
 
+    With a :class:`PollScheduler`, only runs that are due (or not yet
+    scheduled) are loaded and polled; other runs are reported as in the
+    scheduler's previous log for the queue.
+    """
+    if bulk is None:
+        bulk = bulk_refresh
+    current = dt.datetime.now()
+    queue_log = {}
+    batch = {}
+    sub_ids = get_submissions(queue_id=queue_id, exclude_status='RECEIVED')
+    previous = {}
+    if scheduler is not None:
+        previous = scheduler.logs.get(queue_id, {})
+        due = scheduler.pop_due(queue_id)
+        # runs that are due, or weren't scheduled, are loaded again
+        previous = dict(
+            (sub_id, log) for sub_id, log in previous.items()
+            if sub_id not in due and any([
+                log['status'] in ['COMPLETE', 'CANCELED', 'EXECUTOR_ERROR'],
+                scheduler.is_scheduled(queue_id, sub_id)])
+        )
+    submissions = [(sub_id, get_submission_bundle(queue_id, sub_id))
+                   for sub_id in sub_ids if sub_id not in previous]
+    active = [(sub_id, submission) for sub_id, submission in submissions
+              if not _is_finished(submission)]
+    refresh = _list_run_statuses if bulk else _poll_run_statuses
+    statuses = dict(zip(
+        [sub_id for sub_id, _ in active],
+        refresh([(submission['wes_id'], submission['run_log']['run_id'])
+                 for _, submission in active])
+    ))
+    try:
+        for sub_id, submission in submissions:
+            queue_log[sub_id] = _monitor_submission(queue_id, sub_id,
+                                                    submission,
+                                                    statuses.get(sub_id),
+                                                    current, batch)
+    finally:
+        update_submissions({queue_id: batch})
+
+    if scheduler is not None:
+        for sub_id, submission in submissions:
+            scheduler.update(queue_id, sub_id, submission['wes_id'],
+                             queue_log[sub_id])
+        for sub_id in sub_ids:
+            if sub_id in previous:
+                queue_log[sub_id] = previous[sub_id]
+        scheduler.logs[queue_id] = queue_log
     return queue_log
 
 
-def monitor():
+def _is_finished(submission):
+    return submission['run_log']['status'] in ['COMPLETE',
+                                               'CANCELED',
+                                               'EXECUTOR_ERROR']
+
+
+def _monitor_submission(queue_id, sub_id, submission, polled, current,
+                        batch):
+    """
+    Refresh the run log of a single submission from its ``polled``
+    ``(status, error)`` (if it was polled), collecting any changes in
+    ``batch`` rather than saving them.
+    """
+    run_log = submission['run_log']
+    if _is_finished(submission) or polled is None:
+        return dict(run_log, wes_id=submission['wes_id'])
+    run_status, error = polled
+    if error is not None:
+        if not is_transient(error):
+            raise error
+        logger.warning("Couldn't refresh '{}' from '{}': {}"
+                       .format(sub_id, submission['wes_id'], error))
+        return dict(run_log, wes_id=submission['wes_id'])
+
+    if run_status['state'] in ['QUEUED', 'INITIALIZING', 'RUNNING']:
+        etime = convert_timedelta(
+            current - ctime2datetime(run_log['start_time'])
+        )
+    elif 'elapsed_time' not in run_log:
+        etime = 0
+    else:
+        etime = run_log['elapsed_time']
+
+    run_log['status'] = run_status['state']
+    run_log['elapsed_time'] = etime
+
+    fields = batch.setdefault(sub_id, {})
+    fields['run_log'] = run_log
+
+    if run_log['status'] == 'COMPLETE':
+        wf_config = queue_config()[queue_id]
+        sub_status = run_log['status']
+        if wf_config['target_queue']:
+            store_verification(wf_config['target_queue'],
+                               submission['wes_id'])
+            sub_status = 'VALIDATED'
+        fields['status'] = sub_status
+
+    return dict(run_log, wes_id=submission['wes_id'])
+
+
+def monitor(bulk=None):
     """
     Monitor progress of workflow jobs.
+
+    :param bulk: refresh run states from one ListRuns per endpoint
+        (see :func:`monitor_queue`)
     """
     import pandas as pd
     pd.set_option('display.width', 1000)
     pd.set_option('display.max_columns', 10)
     pd.set_option('display.expand_frame_repr', False)
 
+    scheduler = PollScheduler()
     try:
         while True:
             statuses = []
@@ -177,7 +629,8 @@ def monitor():
             clear_output(wait=True)
 
             for queue_id in queue_config():
-                statuses.append(monitor_queue(queue_id))
+                statuses.append(monitor_queue(queue_id, bulk=bulk,
+                                              scheduler=scheduler))
             terminal_statuses = ['COMPLETE', 'CANCELED', 'EXECUTOR_ERROR']
 
             status_tracker = pd.DataFrame.from_dict(
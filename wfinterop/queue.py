@@ -1,8 +1,30 @@
+"""
+The submission queue records job requests made to the orchestrator's
+evaluation queues, keyed by queue ID and submission ID.
+
+Submissions are stored in a JSON file by default. Once the JSON queue
+has been migrated with :func:`migrate_queue`, a SQLite database next to
+it is used instead, with indexes on queue, status and WES ID.
+
+Submissions that have reached a terminal state can be moved out of the
+live store with :func:`archive_submissions` into compressed, append-only
+segments under ``submission_archive/<queue_id>/<YYYY-MM>.jsonl.gz``.
+"""
 import logging
 import os
+import copy
+import contextlib
+import gzip
+import json
+import socket
+import sqlite3
+import threading
+import time
+import zlib
 import datetime as dt
 
-from wfinterop.util import get_json, save_json
+from wfinterop.util import get_json, save_json, file_signature, file_lock
+from wfinterop.util import ctime2datetime
 
 logger = logging.getLogger(__name__)
 
@@ -12,51 +34,755 @@ submission_queue = os.path.join(os.path.dirname(__file__),
 if not os.path.exists(submission_queue):
     save_json(submission_queue, {})
 
+submission_db = os.path.join(os.path.dirname(__file__),
+                             'submission_queue.db')
+
+archive_dir = os.path.join(os.path.dirname(__file__), 'submission_archive')
+
+terminal_states = ['COMPLETE', 'VALIDATED', 'CANCELED', 'EXECUTOR_ERROR']
+
+claim_time_format = '%Y-%m-%dT%H:%M:%SZ'
+
+_db_schema = """
+CREATE TABLE IF NOT EXISTS submissions (
+    queue_id TEXT NOT NULL,
+    submission_id TEXT NOT NULL,
+    status TEXT,
+    wes_id TEXT,
+    bundle TEXT NOT NULL,
+    PRIMARY KEY (queue_id, submission_id)
+);
+CREATE INDEX IF NOT EXISTS submissions_queue_status
+    ON submissions (queue_id, status);
+CREATE INDEX IF NOT EXISTS submissions_wes
+    ON submissions (wes_id);
+"""
+
+_json_cache = {}
+_db_connections = {}
+_db_lock = threading.RLock()
+
+
+class SubmissionIdGenerator(object):
+    """
+    Generate unique, time-sortable submission IDs.
+
+    IDs have the form ``<UTC timestamp>-<worker>-<sequence>``, e.g.
+    ``20181018093015123456-3fa2c1d0-0000``: the timestamp has microsecond
+    resolution, the worker ID is derived from the host name and process
+    ID, and the sequence distinguishes IDs allocated by the same worker
+    within one microsecond. Because every part is fixed-width, IDs sort
+    lexicographically in order of creation.
+    """
+    epoch = dt.datetime(1970, 1, 1)
+    max_sequence = 0xffff
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._worker = None
+        self._last = 0
+        self._sequence = 0
+
+    def _worker_id(self):
+        pid = os.getpid()
+        if pid != self._pid:
+            key = '{}:{}'.format(socket.gethostname(), pid)
+            self._pid = pid
+            self._worker = '{:08x}'.format(
+                zlib.crc32(key.encode('utf-8')) & 0xffffffff)
+        return self._worker
+
+    def allocate(self, count=1):
+        """
+        Reserve ``count`` consecutive IDs in one step.
+        """
+        ids = []
+        with self._lock:
+            worker = self._worker_id()
+            now = int(time.time() * 1e6)
+            if now > self._last:
+                self._last = now
+                self._sequence = -1
+            for _ in range(count):
+                self._sequence += 1
+                if self._sequence > self.max_sequence:
+                    # borrow the next microsecond rather than reuse an ID
+                    self._last += 1
+                    self._sequence = 0
+                stamp = self.epoch + dt.timedelta(microseconds=self._last)
+                ids.append('{}-{}-{:04x}'.format(
+                    stamp.strftime('%Y%m%d%H%M%S%f'), worker, self._sequence))
+        return ids
+
+
+_id_generator = SubmissionIdGenerator()
+
+
+def new_submission_ids(count=1):
+    """
+    Return ``count`` new submission IDs, in creation order.
+    """
+    return _id_generator.allocate(count)
+
+
+def submission_time(submission_id):
+    """
+    Return the (UTC) creation time encoded in a submission ID, or
+    None for IDs not made by :class:`SubmissionIdGenerator`.
+    """
+    parts = submission_id.split('-')
+    if len(parts) != 3:
+        return None
+    try:
+        return dt.datetime.strptime(parts[0], '%Y%m%d%H%M%S%f')
+    except ValueError:
+        return None
+
+
+def _connect(db_path):
+    """
+    Return the process-wide connection to a submission database,
+    creating the table and indexes on first use.
+    """
+    with _db_lock:
+        if db_path not in _db_connections:
+            conn = sqlite3.connect(db_path,
+                                   timeout=30,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.executescript(_db_schema)
+            _db_connections[db_path] = conn
+        return _db_connections[db_path]
+
+
+@contextlib.contextmanager
+def _transaction(conn):
+    """
+    Run a block of statements as one write transaction, taking the
+    database write lock up front so that reads made inside the block
+    cannot be invalidated by another process before it commits.
+    """
+    with _db_lock:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+
+def _matches(submission, fields):
+    return all(submission.get(param) == value
+               for param, value in fields.items())
+
+
+def _as_list(status):
+    if isinstance(status, (list, tuple, set)):
+        return list(status)
+    return [status]
+
+
+class SubmissionStore(object):
+    def create(self, queue_id, submission_id, submission):
+        pass
+
+    def ids(self, queue_id, status):
+        pass
+
+    def get(self, queue_id, submission_id):
+        pass
+
+    def queues(self):
+        pass
+
+    def items(self, queue_id, status):
+        pass
+
+    def delete_many(self, queue_id, submission_ids):
+        pass
+
+    def create_many(self, queue_id, submissions):
+        for submission_id, submission in submissions:
+            self.create(queue_id, submission_id, submission)
+
+    def update(self, queue_id, submission_id, param, value):
+        self.update_many({queue_id: {submission_id: {param: value}}})
+
+    def update_many(self, updates, expected=None):
+        pass
+
+
+class JSONSubmissionStore(SubmissionStore):
+    """
+    Submission store backed by a single JSON document.
+
+    The parsed document is cached per process and only read again
+    when the file's inode, size or mtime changes; writes made through
+    the store update the cached copy in place.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _load(self):
+        signature = file_signature(self.path)
+        cached = _json_cache.get(self.path)
+        if cached is None or cached[0] != signature:
+            cached = (signature, get_json(self.path))
+            _json_cache[self.path] = cached
+        return cached[1]
+
+    def _save(self, submissions):
+        try:
+            save_json(self.path, submissions)
+        except Exception:
+            _json_cache.pop(self.path, None)
+            raise
+        _json_cache[self.path] = (file_signature(self.path), submissions)
+
+    def _modify(self, change):
+        # The lock makes the read-modify-write atomic across processes;
+        # _load() re-reads the file if another process has replaced it
+        # since this process last saw it, so the change is applied to
+        # the latest version rather than to a stale cached copy.
+        with file_lock(self.path):
+            submissions = self._load()
+            try:
+                result = change(submissions)
+            except Exception:
+                _json_cache.pop(self.path, None)
+                raise
+            self._save(submissions)
+        return result
+
+    def create(self, queue_id, submission_id, submission):
+        self.create_many(queue_id, [(submission_id, submission)])
+
+    def create_many(self, queue_id, submissions):
+        def change(current):
+            queue = current.setdefault(queue_id, {})
+            for submission_id, submission in submissions:
+                if submission_id in queue:
+                    raise ValueError("Submission '{}' already exists in '{}'"
+                                     .format(submission_id, queue_id))
+                queue[submission_id] = copy.deepcopy(submission)
+        self._modify(change)
+
+    def ids(self, queue_id, status):
+        submissions = self._load()
+        return [id for id, bundle in submissions.get(queue_id, {}).items()
+                if bundle['status'] in status]
+
+    def get(self, queue_id, submission_id):
+        return copy.deepcopy(self._load()[queue_id][submission_id])
+
+    def queues(self):
+        return list(self._load())
+
+    def items(self, queue_id, status):
+        return [(id, bundle)
+                for id, bundle in self._load().get(queue_id, {}).items()
+                if bundle['status'] in status]
+
+    def delete_many(self, queue_id, submission_ids):
+        def change(submissions):
+            queue = submissions.get(queue_id, {})
+            for submission_id in submission_ids:
+                queue.pop(submission_id, None)
+        self._modify(change)
+
+    def update_many(self, updates, expected=None):
+        expected = expected or {}
+
+        def change(submissions):
+            conflicts = []
+            for queue_id, queue_updates in updates.items():
+                for submission_id, fields in queue_updates.items():
+                    submission = submissions[queue_id][submission_id]
+                    if not _matches(submission, expected.get(
+                            queue_id, {}).get(submission_id, {})):
+                        conflicts.append((queue_id, submission_id))
+                        continue
+                    submission.update(copy.deepcopy(fields))
+            return conflicts
+        return self._modify(change)
+
+
+class SQLiteSubmissionStore(SubmissionStore):
+    """
+    Submission store backed by a SQLite table with one row per
+    submission; status and WES ID are kept in indexed columns next
+    to the JSON-encoded submission bundle.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = _connect(path)
+
+    def create(self, queue_id, submission_id, submission):
+        self.create_many(queue_id, [(submission_id, submission)])
+
+    def create_many(self, queue_id, submissions):
+        rows = ((queue_id, submission_id, submission['status'],
+                 submission['wes_id'], json.dumps(submission))
+                for submission_id, submission in submissions)
+        try:
+            with _transaction(self.conn):
+                self.conn.executemany(
+                    'INSERT INTO submissions '
+                    '(queue_id, submission_id, status, wes_id, bundle) '
+                    'VALUES (?, ?, ?, ?, ?)', rows)
+        except sqlite3.IntegrityError as e:
+            raise ValueError("Duplicate submission in '{}': {}"
+                             .format(queue_id, e))
+
+    def ids(self, queue_id, status):
+        query = ('SELECT submission_id FROM submissions '
+                 'WHERE queue_id = ? AND status IN ({}) '
+                 'ORDER BY submission_id'
+                 .format(', '.join('?' * len(status))))
+        with _db_lock:
+            rows = self.conn.execute(query, [queue_id] + status).fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, queue_id, submission_id):
+        with _db_lock:
+            row = self.conn.execute(
+                'SELECT bundle FROM submissions '
+                'WHERE queue_id = ? AND submission_id = ?',
+                (queue_id, submission_id)).fetchone()
+        if row is None:
+            raise KeyError(submission_id)
+        return json.loads(row[0])
+
+    def queues(self):
+        with _db_lock:
+            rows = self.conn.execute(
+                'SELECT DISTINCT queue_id FROM submissions').fetchall()
+        return [row[0] for row in rows]
+
+    def items(self, queue_id, status):
+        query = ('SELECT submission_id, bundle FROM submissions '
+                 'WHERE queue_id = ? AND status IN ({}) '
+                 'ORDER BY submission_id'
+                 .format(', '.join('?' * len(status))))
+        with _db_lock:
+            rows = self.conn.execute(query, [queue_id] + status).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def delete_many(self, queue_id, submission_ids):
+        with _transaction(self.conn):
+            self.conn.executemany(
+                'DELETE FROM submissions '
+                'WHERE queue_id = ? AND submission_id = ?',
+                [(queue_id, submission_id)
+                 for submission_id in submission_ids])
+
+    def update_many(self, updates, expected=None):
+        expected = expected or {}
+        conflicts = []
+        with _transaction(self.conn):
+            for queue_id, queue_updates in updates.items():
+                for submission_id, fields in queue_updates.items():
+                    submission = self.get(queue_id, submission_id)
+                    if not _matches(submission, expected.get(
+                            queue_id, {}).get(submission_id, {})):
+                        conflicts.append((queue_id, submission_id))
+                        continue
+                    submission.update(fields)
+                    self.conn.execute(
+                        'UPDATE submissions '
+                        'SET status = ?, wes_id = ?, bundle = ? '
+                        'WHERE queue_id = ? AND submission_id = ?',
+                        (submission['status'], submission['wes_id'],
+                         json.dumps(submission), queue_id, submission_id))
+        return conflicts
+
+
+def _get_store():
+    """
+    Return the active submission store: the SQLite database if the
+    queue has been migrated, otherwise the JSON file.
+    """
+    if os.path.exists(submission_db):
+        return SQLiteSubmissionStore(submission_db)
+    return JSONSubmissionStore(submission_queue)
+
 
 def create_queue():
     pass
 
 
-def create_submission(queue_id, submission_data, wes_id=None):
+def create_submission(queue_id, submission_data, wes_id=None,
+                      claim=False):
     """
     Submit a new job request to an evaluation queue.
 
     Both type and wf_name are optional but could be used with TRS.
+
+    :param claim: create the submission already claimed by this worker
+        (see :func:`claim_submissions`), e.g., to run it right away
     """
-    submissions = get_json(submission_queue)
-    submission_id = dt.datetime.now().strftime('%d%m%d%H%M%S%f')
+    submission_id = new_submission_ids()[0]
 
     submission = {'status': 'RECEIVED',
                   'data': submission_data,
                   'wes_id': wes_id}
-    submissions.setdefault(queue_id, {})[submission_id] = submission
-    save_json(submission_queue, submissions)
+    if claim:
+        submission.update(_claim())
+    _get_store().create(queue_id, submission_id, submission)
     logger.info(" Queueing job for '{}' endpoint:"
                 "\n - submission ID: {}".format(wes_id, submission_id))
     return submission_id
 
 
+def create_submissions(queue_id, submission_data, wes_id=None,
+                       chunk_size=1000):
+    """
+    Submit many job requests to an evaluation queue in a single write
+    (or, for the SQLite store, a single transaction).
+
+    :param submission_data: iterable of workflow parameter documents
+        (or URLs), one per submission; consumed lazily, so it may be
+        a generator streaming from a file
+    :param chunk_size: number of submission IDs reserved at a time
+    :return: list of the new submission IDs, in input order
+    """
+    submission_ids = []
+
+    def submissions():
+        pending = []
+        for data in submission_data:
+            if not pending:
+                pending = new_submission_ids(chunk_size)
+                pending.reverse()
+            submission_id = pending.pop()
+            submission_ids.append(submission_id)
+            yield submission_id, {'status': 'RECEIVED',
+                                  'data': data,
+                                  'wes_id': wes_id}
+
+    start = time.time()
+    _get_store().create_many(queue_id, submissions())
+    elapsed = time.time() - start
+    logger.info(" Queued {} jobs for '{}' endpoint in {:.2f}s ({:.0f}/s)"
+                .format(len(submission_ids), wes_id, elapsed,
+                        len(submission_ids) / elapsed if elapsed else 0))
+    return submission_ids
+
+
 def get_submissions(queue_id,
                     status=['RECEIVED', 'SUBMITTED', 'VALIDATED', 'COMPLETE'],
                     exclude_status=[]):
     """Return all ids with the requested status."""
-    submissions = get_json(submission_queue)
+    status = _as_list(status)
     if len(exclude_status):
+        exclude_status = _as_list(exclude_status)
         status = [s for s in status if s not in exclude_status]
+    return _get_store().ids(queue_id, status)
+
+
+def get_submission_bundle(wes_id, submission_id, include_archive=False):
+    """
+    Return the submission's info.
+
+    :param include_archive: if True, fall back to the archive for
+        submissions no longer in the live store
+    """
     try:
-        return [id for id, bundle in submissions[queue_id].items()
-                if bundle['status'] in status]
+        return _get_store().get(wes_id, submission_id)
     except KeyError:
+        if not include_archive:
+            raise
+        return get_archived_submission(wes_id, submission_id)
+
+
+def update_submission(wes_id, submission_id, param, status):
+    """Update the status of a submission."""
+    _get_store().update(wes_id, submission_id, param, status)
+
+
+def update_submissions(updates, expected=None):
+    """
+    Apply any number of field updates across submissions in a
+    single write (or, for the SQLite store, a single transaction).
+
+    :param updates: dict of the form
+        ``{queue_id: {submission_id: {param: value, ...}, ...}, ...}``
+    :param expected: optional dict of the same form giving the values
+        each submission must still hold for its update to be applied;
+        this lets concurrent workers detect each other's changes
+    :return: list of ``(queue_id, submission_id)`` pairs whose update
+        was skipped because they no longer matched ``expected``
+    """
+    updates = {queue_id: queue_updates
+               for queue_id, queue_updates in updates.items()
+               if queue_updates}
+    if not updates:
         return []
+    return _get_store().update_many(updates, expected)
 
 
-def get_submission_bundle(wes_id, submission_id):
-    """Return the submission's info."""
-    return get_json(submission_queue)[wes_id][submission_id]
+def _worker_name():
+    return '{}:{}:{}'.format(socket.gethostname(), os.getpid(),
+                             threading.current_thread().name)
 
 
-def update_submission(wes_id, submission_id, param, status):
-    """Update the status of a submission."""
-    submissions = get_json(submission_queue)
-    submissions[wes_id][submission_id][param] = status
-    save_json(submission_queue, submissions)
+def _claim():
+    return {'status': 'CLAIMED',
+            'claimed_by': _worker_name(),
+            'claimed_at': dt.datetime.utcnow().strftime(claim_time_format)}
+
+
+def claim_submissions(queue_id, submission_ids):
+    """
+    Atomically move submissions from RECEIVED to CLAIMED, so that only
+    one worker process runs each of them. Claims record the worker
+    (host, process ID and thread) and the (UTC) time they were made, so
+    that claims left behind by a worker that died can be released with
+    :func:`release_stale_claims`.
+
+    :return: list of the submission IDs claimed by this call
+    """
+    claim = _claim()
+    claims = {submission_id: dict(claim)
+              for submission_id in submission_ids}
+    conflicts = update_submissions(
+        {queue_id: claims},
+        expected={queue_id: {submission_id: {'status': 'RECEIVED'}
+                             for submission_id in submission_ids}})
+    lost = set(submission_id for _, submission_id in conflicts)
+    return [submission_id for submission_id in submission_ids
+            if submission_id not in lost]
+
+
+def renew_claim(queue_id, submission_id):
+    """
+    Reset the claim time of a submission claimed by this worker, e.g.,
+    right before running it, so that the claim isn't released as
+    stale while it is in use.
+
+    :return: whether the submission is still claimed by this worker
+    """
+    return not update_claimed_submissions(
+        queue_id, {submission_id: _claim()})
+
+
+def update_claimed_submissions(queue_id, updates):
+    """
+    Apply field updates (as for :func:`update_submissions`) to
+    submissions of a queue only while they are still claimed by this
+    worker, so that a submission whose claim was released (and maybe
+    claimed again by another worker) isn't overwritten.
+
+    :param updates: dict of the form
+        ``{submission_id: {param: value, ...}, ...}``
+    :return: list of the submission IDs that were no longer claimed by
+        this worker, and were left alone
+    """
+    held = {'status': 'CLAIMED', 'claimed_by': _worker_name()}
+    conflicts = update_submissions(
+        {queue_id: updates},
+        expected={queue_id: {submission_id: held
+                             for submission_id in updates}})
+    lost = [submission_id for _, submission_id in conflicts]
+    for submission_id in lost:
+        logger.warning(" Claim on '{}' in '{}' was lost; not saving {}"
+                       .format(submission_id, queue_id,
+                               sorted(updates[submission_id])))
+    return lost
+
+
+def _claimed_time(submission):
+    try:
+        return dt.datetime.strptime(submission['claimed_at'],
+                                    claim_time_format)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def release_stale_claims(max_age=dt.timedelta(hours=1), queue_ids=None):
+    """
+    Hand submissions claimed more than ``max_age`` ago (e.g., by a
+    worker that died before running them) back to the queue, moving
+    them from CLAIMED to RECEIVED. Claims without a claim time, made
+    before claims were timestamped, are released too.
+
+    A claim is only released if it hasn't been renewed in the
+    meantime, so a submission just claimed again by another worker
+    is left alone.
+
+    :param max_age: minimum age of released claims
+    :param queue_ids: queues to release claims in (default: all)
+    :return: list of ``(queue_id, submission_id)`` pairs released
+    """
+    store = _get_store()
+    cutoff = dt.datetime.utcnow() - max_age
+    released = []
+    for queue_id in (store.queues() if queue_ids is None else queue_ids):
+        stale = {}
+        for submission_id, submission in store.items(queue_id, ['CLAIMED']):
+            claimed = _claimed_time(submission)
+            if claimed is not None and claimed > cutoff:
+                continue
+            stale[submission_id] = submission
+        if not stale:
+            continue
+        conflicts = update_submissions(
+            {queue_id: {submission_id: {'status': 'RECEIVED'}
+                        for submission_id in stale}},
+            expected={queue_id: {
+                submission_id: {'status': 'CLAIMED',
+                                'claimed_at': submission.get('claimed_at')}
+                for submission_id, submission in stale.items()}})
+        lost = set(submission_id for _, submission_id in conflicts)
+        for submission_id, submission in sorted(stale.items()):
+            if submission_id in lost:
+                continue
+            logger.warning(" Released stale claim on '{}' in '{}' by {} "
+                           "at {}".format(submission_id, queue_id,
+                                          submission.get('claimed_by'),
+                                          submission.get('claimed_at')))
+            released.append((queue_id, submission_id))
+    return released
+
+
+def migrate_queue(json_path=None, db_path=None):
+    """
+    Copy all submissions from a JSON queue file into the SQLite
+    submission database, which is used from then on.
+
+    Submissions already present in the database are left untouched,
+    so migrating the same file twice is harmless.
+
+    :param json_path: path to the JSON queue (default: ``submission_queue``)
+    :param db_path: path to the database (default: ``submission_db``)
+    :return: number of submissions copied into the database
+    """
+    json_path = submission_queue if json_path is None else json_path
+    db_path = submission_db if db_path is None else db_path
+    submissions = get_json(json_path) or {}
+    rows = [(queue_id, submission_id, bundle.get('status'),
+             bundle.get('wes_id'), json.dumps(bundle))
+            for queue_id, queue in submissions.items()
+            for submission_id, bundle in queue.items()]
+    conn = _connect(db_path)
+    with _transaction(conn):
+        before = conn.total_changes
+        conn.executemany(
+            'INSERT OR IGNORE INTO submissions '
+            '(queue_id, submission_id, status, wes_id, bundle) '
+            'VALUES (?, ?, ?, ?, ?)', rows)
+        copied = conn.total_changes - before
+    logger.info(" Migrated {} of {} submissions from '{}' to '{}'"
+                .format(copied, len(rows), json_path, db_path))
+    return copied
+
+
+def _created_time(submission_id, submission):
+    """
+    Return the (UTC) creation time of a submission, falling back to
+    the start time of its run for IDs that don't encode one.
+    """
+    created = submission_time(submission_id)
+    if created is None:
+        start_time = (submission.get('run_log') or {}).get('start_time')
+        if start_time:
+            utc_offset = dt.datetime.utcnow() - dt.datetime.now()
+            created = ctime2datetime(start_time) + utc_offset
+    return created
+
+
+def _is_terminal(submission):
+    run_state = (submission.get('run_log') or {}).get('status')
+    return any(state in terminal_states
+               for state in [submission['status'], run_state])
+
+
+def _archive_path(queue_id, month):
+    return os.path.join(archive_dir, queue_id, '{}.jsonl.gz'.format(month))
+
+
+def _append_archive(queue_id, month, submissions):
+    path = _archive_path(queue_id, month)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with gzip.open(path, 'ab') as f:
+        for submission_id, submission in submissions:
+            record = {'submission_id': submission_id,
+                      'submission': submission}
+            f.write((json.dumps(record) + '\n').encode('utf-8'))
+
+
+def archive_submissions(max_age=dt.timedelta(days=30), queue_ids=None):
+    """
+    Move terminal submissions older than ``max_age`` out of the live
+    store and into the archive.
+
+    Submissions are appended to the archive before being removed from
+    the live store, so an interrupted run can leave a submission in
+    both places but never in neither.
+
+    :param max_age: minimum age (from creation) of archived submissions
+    :param queue_ids: queues to archive (default: all)
+    :return: dict of the number of submissions archived per queue
+    """
+    store = _get_store()
+    cutoff = dt.datetime.utcnow() - max_age
+    status = ['SUBMITTED'] + terminal_states
+    archived = {}
+    for queue_id in (store.queues() if queue_ids is None else queue_ids):
+        by_month = {}
+        for submission_id, submission in store.items(queue_id, status):
+            created = _created_time(submission_id, submission)
+            if created is None or created > cutoff:
+                continue
+            if not _is_terminal(submission):
+                continue
+            by_month.setdefault(created.strftime('%Y-%m'), []).append(
+                (submission_id, submission))
+        for month, submissions in sorted(by_month.items()):
+            _append_archive(queue_id, month, submissions)
+            store.delete_many(queue_id, [submission_id for submission_id, _
+                                         in submissions])
+        archived[queue_id] = sum(len(v) for v in by_month.values())
+        logger.info(" Archived {} submissions from '{}'"
+                    .format(archived[queue_id], queue_id))
+    return archived
+
+
+def iter_archived_submissions(queue_id, months=None):
+    """
+    Stream ``(submission_id, submission)`` pairs from the archive of
+    a queue, oldest segment first.
+
+    :param months: optional list of ``'YYYY-MM'`` segments to read
+    """
+    queue_dir = os.path.join(archive_dir, queue_id)
+    if not os.path.isdir(queue_dir):
+        return
+    segments = sorted(f[:-len('.jsonl.gz')] for f in os.listdir(queue_dir)
+                      if f.endswith('.jsonl.gz'))
+    for month in segments:
+        if months is not None and month not in months:
+            continue
+        with gzip.open(_archive_path(queue_id, month), 'rb') as f:
+            for line in f:
+                record = json.loads(line.decode('utf-8'))
+                yield record['submission_id'], record['submission']
+
+
+def get_archived_submission(queue_id, submission_id):
+    """
+    Return an archived submission's info.
+    """
+    created = submission_time(submission_id)
+    months = None if created is None else [created.strftime('%Y-%m')]
+    found = None
+    for archived_id, submission in iter_archived_submissions(queue_id,
+                                                             months):
+        if archived_id == submission_id:
+            found = submission
+    if found is None:
+        raise KeyError(submission_id)
+    return found
@@ -0,0 +1,177 @@
+"""
+Retries and circuit breakers for calls to WES and TRS endpoints.
+
+Idempotent calls that fail with a transient error (connection errors,
+timeouts, HTTP 429 or 5xx responses) are retried with jittered
+exponential backoff. After ``failure_threshold`` consecutive transient
+failures, the endpoint's circuit opens and calls to it fail fast with
+:class:`CircuitOpenError` until ``reset_timeout`` seconds have passed,
+when a single trial call is let through to test the endpoint again.
+"""
+import logging
+import random
+import threading
+import time
+
+from requests.exceptions import ConnectionError, Timeout
+from requests.exceptions import HTTPError as RequestsHTTPError
+from bravado.exception import HTTPError
+
+logger = logging.getLogger(__name__)
+
+default_max_retries = 3
+default_failure_threshold = 5
+default_reset_timeout = 30
+backoff_base = 0.5
+backoff_max = 10
+
+_retry_status_codes = [429, 500, 502, 503, 504]
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of calling an endpoint whose circuit is open.
+    """
+    pass
+
+
+def is_transient(error):
+    """
+    Return whether an error from an endpoint is worth retrying.
+    """
+    if isinstance(error, (ConnectionError, Timeout)):
+        return True
+    if isinstance(error, HTTPError):
+        return error.status_code in _retry_status_codes
+    if isinstance(error, RequestsHTTPError):
+        response = error.response
+        if response is None:
+            return False
+        return response.status_code in _retry_status_codes
+    return False
+
+
+def backoff_delay(attempt):
+    """
+    Return a random delay ("full jitter") before retry number
+    ``attempt`` (starting at 0).
+    """
+    return random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+
+
+class CircuitBreaker(object):
+    """
+    Track consecutive transient failures of calls to an endpoint, and
+    stop calling it while it appears to be down.
+    """
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or default_failure_threshold
+        self.reset_timeout = reset_timeout or default_reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        Return whether a call may be made now.
+        """
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            retry_at = self.opened_at + self.reset_timeout
+            if self.state == 'open' and time.time() >= retry_at:
+                # let a single trial call through
+                self.state = 'half-open'
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("Circuit for '{}' closed".format(self.name))
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            tripped = self.failures >= self.failure_threshold
+            if self.state == 'half-open' or tripped:
+                if self.state != 'open':
+                    logger.warning("Circuit for '{}' opened after {} "
+                                   "failures".format(self.name,
+                                                     self.failures))
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def call(self, func, retries=0):
+        """
+        Return ``func()``, retrying up to ``retries`` times after
+        transient errors while the circuit stays closed.
+        """
+        attempt = 0
+        while True:
+            if not self.allow():
+                raise CircuitOpenError(
+                    "Circuit for '{}' is open".format(self.name))
+            try:
+                result = func()
+            except Exception as e:
+                if not is_transient(e):
+                    # the endpoint did respond
+                    self.record_success()
+                    raise
+                self.record_failure()
+                if attempt >= retries or self.state == 'open':
+                    raise
+                delay = backoff_delay(attempt)
+                logger.debug("Retrying call to '{}' in {:.2f}s after: {}"
+                             .format(self.name, delay, e))
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.record_success()
+            return result
+
+    def status(self):
+        with self._lock:
+            return {'state': self.state,
+                    'failures': self.failures,
+                    'opened_at': self.opened_at}
+
+
+def get_breaker(kind, service_id):
+    """
+    Return the shared circuit breaker for a WES (``kind='wes'``) or
+    TRS (``kind='trs'``) endpoint.
+    """
+    key = (kind, service_id)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker('{}:{}'.format(kind, service_id))
+            _breakers[key] = breaker
+    return breaker
+
+
+def circuit_states():
+    """
+    Return the circuit state of every endpoint called so far, keyed by
+    ``'<kind>:<service ID>'``.
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.status() for breaker in breakers}
+
+
+def reset_circuits():
+    """
+    Forget all failures, closing every circuit.
+    """
+    with _breakers_lock:
+        _breakers.clear()
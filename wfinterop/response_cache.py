@@ -0,0 +1,92 @@
+"""
+In-process cache for rarely changing service responses (WES service
+info, TRS metadata).
+
+Entries are fresh for ``ttl`` seconds. After that, for up to
+``stale_ttl`` more seconds, the stale response is still returned
+immediately while a background thread fetches a new one
+(stale-while-revalidate); older entries are fetched again before
+returning.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+default_ttl = 300
+default_stale_ttl = 3600
+
+
+class TTLCache(object):
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._entries = {}
+        self._refreshing = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch, ttl=None, stale_ttl=None):
+        """
+        Return the cached response for ``key``, calling ``fetch()`` to
+        get (or revalidate) it when needed.
+        """
+        ttl = default_ttl if ttl is None else ttl
+        stale_ttl = default_stale_ttl if stale_ttl is None else stale_ttl
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            age = now - entry[0]
+            if age < ttl:
+                return entry[1]
+            if age < ttl + stale_ttl:
+                self._refresh_in_background(key, fetch)
+                return entry[1]
+        return self._fetch(key, fetch)
+
+    def _fetch(self, key, fetch):
+        value = fetch()
+        with self._lock:
+            self._entries[key] = (self.clock(), value)
+        return value
+
+    def _refresh_in_background(self, key, fetch):
+        def refresh():
+            try:
+                self._fetch(key, fetch)
+            except Exception:
+                logger.warning("Couldn't revalidate cached response for "
+                               "{}".format(key), exc_info=True)
+            finally:
+                with self._lock:
+                    self._refreshing.pop(key, None)
+
+        with self._lock:
+            if key in self._refreshing:
+                return
+            thread = threading.Thread(target=refresh)
+            thread.daemon = True
+            self._refreshing[key] = thread
+        thread.start()
+
+    def join(self):
+        """
+        Wait for any background refreshes to finish.
+        """
+        with self._lock:
+            threads = list(self._refreshing.values())
+        for thread in threads:
+            thread.join()
+
+    def invalidate(self, key=None):
+        """
+        Drop the cached response for ``key`` (or all responses).
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+service_cache = TTLCache()
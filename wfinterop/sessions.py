@@ -0,0 +1,122 @@
+"""
+Shared HTTP sessions for talking to WES and TRS endpoints.
+
+Each host gets one :class:`requests.Session` whose connection pool keeps
+connections alive between calls, so repeated requests to the same
+endpoint (e.g., polling run status) skip the TCP/TLS handshake. The pool
+size and default timeout can be set per service with the optional
+``max_connections`` and ``timeout`` keys of its config entry.
+"""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+default_max_connections = 10
+default_timeout = 60
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class PooledSession(requests.Session):
+    """
+    Session with a bounded keep-alive connection pool, which applies
+    a default timeout to requests made without one.
+    """
+    def __init__(self, max_connections, timeout):
+        super(PooledSession, self).__init__()
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.request_count = 0
+        adapter = HTTPAdapter(pool_connections=1,
+                              pool_maxsize=max_connections,
+                              pool_block=True)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        self.request_count += 1
+        return super(PooledSession, self).send(request, **kwargs)
+
+    def stats(self):
+        """
+        Return usage statistics for the session's connection pools.
+        """
+        connections = 0
+        idle = 0
+        for adapter in set(self.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for pool in [pools.get(key) for key in pools.keys()]:
+                if pool is None:
+                    continue
+                connections += pool.num_connections
+                idle += sum(1 for conn in list(pool.pool.queue)
+                            if conn is not None)
+        return {'max_connections': self.max_connections,
+                'timeout': self.timeout,
+                'requests': self.request_count,
+                'connections_opened': connections,
+                'idle_connections': idle}
+
+
+def _reconfigured(session, opts):
+    """
+    Return whether a session's pool options differ from those set in a
+    config entry; options that aren't set don't count.
+    """
+    return any(opts.get(option) not in (None, getattr(session, option))
+               for option in ['max_connections', 'timeout'])
+
+
+def get_session(opts):
+    """
+    Return the shared session for the host of a WES or TRS config entry,
+    creating it on first use.
+
+    If the entry sets pool options that differ from those of the open
+    session, a new session replaces it, keeping any options the entry
+    doesn't set. The old session isn't closed, as other threads may
+    still be using it; its connections are closed once it is no longer
+    referenced.
+    """
+    key = (opts['proto'], opts['host'])
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None or _reconfigured(session, opts):
+            # options that aren't set are kept from the open session
+            max_connections = getattr(session, 'max_connections',
+                                      default_max_connections)
+            timeout = getattr(session, 'timeout', default_timeout)
+            logger.debug("Opening HTTP session for {}://{}".format(*key))
+            session = PooledSession(
+                opts.get('max_connections') or max_connections,
+                opts.get('timeout') or timeout)
+            _sessions[key] = session
+    return session
+
+
+def pool_stats():
+    """
+    Return connection pool statistics for every open session, keyed by
+    ``'<proto>://<host>'``.
+    """
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    return {'{}://{}'.format(*key): session.stats()
+            for key, session in sessions}
+
+
+def close_sessions():
+    """
+    Close all shared sessions and their pooled connections.
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -5,14 +5,13 @@ import logging
 import urllib
 import re
 
-from requests.exceptions import ConnectionError
-
 from wfinterop.config import add_queue
 from wfinterop.config import queue_config
 from wfinterop.trs import TRS
 from wfinterop.wes import WES
 from wfinterop.queue import create_submission
 from wfinterop.orchestrator import run_queue
+from wfinterop.resilience import is_transient
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -34,7 +33,12 @@ def poll_services():
         trs_status[trs_id] = True
         try:
             trs_instance.get_metadata()
-        except ConnectionError:
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            trs_status[trs_id] = False
+        # a cached response may hide that the endpoint is now failing
+        if trs_instance.breaker.state == 'open':
             trs_status[trs_id] = False
 
     wes_status = {}
@@ -43,7 +47,11 @@ def poll_services():
         wes_status[wes_id] = True
         try:
             wes_instance.get_service_info()
-        except ConnectionError:
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            wes_status[wes_id] = False
+        if wes_instance.breaker.state == 'open':
             wes_status[wes_id] = False
 
     return {'toolregistries': trs_status, 'workflowservices': wes_status}
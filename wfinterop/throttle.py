@@ -0,0 +1,132 @@
+"""
+Per-endpoint rate limits and concurrency caps for WES and TRS calls.
+
+Limits are set with the optional ``rate_limit`` (requests per second),
+``burst`` and ``max_in_flight`` keys of a ``workflowservices`` or
+``toolregistries`` config entry, and are shared by every :class:`WES`
+or :class:`TRS` instance (and thread) calling the same endpoint.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_throttles = {}
+_throttles_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing ``rate`` requests per second on average,
+    with bursts of up to ``burst`` requests.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1, rate))
+        self._tokens = self.burst
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available.
+
+        :return: seconds waited
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # a negative balance reserves tokens for callers already waiting
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class Throttle(object):
+    """
+    Context manager wrapping each call to an endpoint, which enforces
+    its rate limit and cap on calls in flight, and keeps track of the
+    time calls spend waiting for either.
+    """
+    def __init__(self, name, rate_limit=None, burst=None,
+                 max_in_flight=None):
+        self.name = name
+        self.limits = (rate_limit, burst, max_in_flight)
+        self.bucket = (TokenBucket(rate_limit, burst)
+                       if rate_limit else None)
+        self.slots = (threading.BoundedSemaphore(max_in_flight)
+                      if max_in_flight else None)
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0,
+                       'in_flight': 0,
+                       'peak_in_flight': 0,
+                       'rate_delayed_calls': 0,
+                       'rate_delay': 0.0,
+                       'in_flight_delayed_calls': 0,
+                       'in_flight_delay': 0.0}
+
+    def __enter__(self):
+        slot_wait = 0
+        if self.slots is not None:
+            start = time.time()
+            self.slots.acquire()
+            slot_wait = time.time() - start
+        rate_wait = self.bucket.acquire() if self.bucket else 0
+        if rate_wait or slot_wait > 0.001:
+            logger.debug("Throttled call to '{}' for {:.3f}s"
+                         .format(self.name, rate_wait + slot_wait))
+        with self._lock:
+            stats = self._stats
+            stats['calls'] += 1
+            stats['in_flight'] += 1
+            stats['peak_in_flight'] = max(stats['peak_in_flight'],
+                                          stats['in_flight'])
+            if rate_wait:
+                stats['rate_delayed_calls'] += 1
+                stats['rate_delay'] += rate_wait
+            if slot_wait > 0.001:
+                stats['in_flight_delayed_calls'] += 1
+                stats['in_flight_delay'] += slot_wait
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self._lock:
+            self._stats['in_flight'] -= 1
+        if self.slots is not None:
+            self.slots.release()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def get_throttle(kind, service_id, opts=None):
+    """
+    Return the shared throttle for a WES (``kind='wes'``) or TRS
+    (``kind='trs'``) endpoint, configured from its config entry.
+    """
+    opts = opts or {}
+    limits = (opts.get('rate_limit'), opts.get('burst'),
+              opts.get('max_in_flight'))
+    key = (kind, service_id)
+    with _throttles_lock:
+        throttle = _throttles.get(key)
+        if throttle is None or throttle.limits != limits:
+            throttle = Throttle('{}:{}'.format(kind, service_id), *limits)
+            _throttles[key] = throttle
+    return throttle
+
+
+def throttle_stats():
+    """
+    Return call and throttling statistics for every endpoint, keyed by
+    ``'<kind>:<service ID>'``; delays are total seconds waited.
+    """
+    with _throttles_lock:
+        throttles = list(_throttles.values())
+    return {throttle.name: throttle.stats() for throttle in throttles}
@@ -0,0 +1,96 @@
+"""
+Persistent cache of TRS responses.
+
+Workflow, descriptor, file listing and test responses are stored on
+disk under ``cache_dir``, keyed by TRS ID, operation, workflow ID,
+version, descriptor type and relative path. A cached response is served
+without contacting the registry for the endpoint's ``cache_max_age``
+seconds (default 0); after that it is revalidated with a conditional
+request (``If-None-Match``/``If-Modified-Since``), so an unchanged
+response isn't sent again.
+
+With ``offline`` set, responses are only ever served from the cache,
+and :class:`TRSOfflineError` is raised for anything not cached.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+
+from wfinterop.util import save_json
+
+logger = logging.getLogger(__name__)
+
+cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                         'trs_cache')
+offline = False
+default_max_age = 0
+
+
+class TRSOfflineError(LookupError):
+    """
+    Raised in offline mode for a TRS response that isn't cached.
+    """
+    pass
+
+
+def _entry_path(key):
+    digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, '{}.json'.format(digest))
+
+
+def load(key):
+    """
+    Return the cached entry for ``key``, or ``None``.
+    """
+    try:
+        with open(_entry_path(key)) as f:
+            entry = json.load(f)
+    except (IOError, ValueError):
+        return None
+    # guard against digest collisions
+    return entry if entry.get('key') == key else None
+
+
+def store(key, result, headers=None):
+    """
+    Cache a response with the validators from its headers.
+    """
+    headers = headers or {}
+    last_modified = headers.get('Last-Modified') or headers.get(
+        'last-modified')
+    entry = {'key': key,
+             'result': result,
+             'etag': headers.get('ETag') or headers.get('etag'),
+             'last_modified': last_modified,
+             'stored_at': time.time()}
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    save_json(_entry_path(key), entry)
+    return entry
+
+
+def touch(entry):
+    """
+    Mark a cached entry as just revalidated.
+    """
+    entry['stored_at'] = time.time()
+    save_json(_entry_path(entry['key']), entry)
+
+
+def is_fresh(entry, max_age=None):
+    max_age = default_max_age if max_age is None else max_age
+    return time.time() - entry['stored_at'] < max_age
+
+
+def conditional_headers(entry):
+    """
+    Return the headers for revalidating a cached entry.
+    """
+    headers = {}
+    if entry is not None and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry is not None and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
@@ -1,14 +1,22 @@
 import logging
 import os
+import threading
 
 from bravado.requests_client import RequestsClient
 from bravado.swagger_model import Loader
 from bravado.client import SwaggerClient
 
 from wfinterop.config import trs_config
+from wfinterop.util import config_hash
+from wfinterop.sessions import get_session
 
 logger = logging.getLogger(__name__)
 
+# clients built with the default HTTP client, reused for the lifetime of
+# the process: {cache key: (config hash, client)}
+_clients = {}
+_clients_lock = threading.Lock()
+
 
 def _get_trs_opts(service_id):
     """
@@ -19,7 +27,8 @@ def _get_trs_opts(service_id):
 
 def _init_http_client(service_id=None, opts=None):
     """
-    Initialize and configure HTTP requests client for selected service.
+    Initialize and configure HTTP requests client for selected service,
+    sharing the pooled keep-alive session for its host.
     """
     auth_header = {'token': 'Authorization',
                    'api_key': 'X-API-KEY',
@@ -28,6 +37,7 @@ def _init_http_client(service_id=None, opts=None):
         opts = _get_trs_opts(service_id)
 
     http_client = RequestsClient()
+    http_client.session = get_session(opts)
 
     http_client.set_api_key(host=opts['host'],
                             api_key=opts['auth'],
@@ -58,18 +68,11 @@ class TRSInterface:
         pass
 
 
-def load_trs_client(service_id, http_client=None):
-    """
-    Return an API client for the selected workflow execution service.
-    """
-    if http_client is None:
-        http_client = _init_http_client(service_id=service_id)
-
+def _build_trs_client(service_id, opts, http_client):
     spec_path = os.path.join(os.path.dirname(os.path.dirname(__file__)),
                              'ga4gh-tool-discovery.yaml')
     spec_path = os.path.abspath(spec_path)
 
-    opts = _get_trs_opts(service_id)
     api_url = '{}://{}'.format(opts['proto'], opts['host'])
 
     loader = Loader(http_client, request_headers=None)
@@ -80,3 +83,39 @@ def load_trs_client(service_id, http_client=None):
                                           http_client=http_client,
                                           config={'use_models': False})
     return spec_client.GA4GH
+
+
+def load_trs_client(service_id, http_client=None):
+    """
+    Return an API client for the selected tool registry service.
+
+    Unless a custom ``http_client`` is given, the client is built once
+    per process and reused until the service's config changes (or
+    :func:`invalidate_trs_client` is called).
+    """
+    opts = _get_trs_opts(service_id)
+    if http_client is not None:
+        return _build_trs_client(service_id, opts, http_client)
+
+    opts_hash = config_hash(opts)
+    with _clients_lock:
+        cached = _clients.get(service_id)
+        if cached is None or cached[0] != opts_hash:
+            logger.debug("Building TRS client for '{}'".format(service_id))
+            http_client = _init_http_client(opts=opts)
+            cached = (opts_hash, _build_trs_client(service_id, opts,
+                                                   http_client))
+            _clients[service_id] = cached
+    return cached[1]
+
+
+def invalidate_trs_client(service_id=None):
+    """
+    Drop cached clients for a tool registry service (or for all
+    services, if none is given), so they are built again on next use.
+    """
+    with _clients_lock:
+        if service_id is None:
+            _clients.clear()
+        else:
+            _clients.pop(service_id, None)
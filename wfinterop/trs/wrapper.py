@@ -1,8 +1,22 @@
 import logging
-import urllib
+import os
 import re
+import shutil
+import tempfile
+import urllib
+import zipfile
 
+from bravado.exception import HTTPNotModified
+
+from wfinterop.config import trs_config
+from wfinterop.trs import cache
 from wfinterop.trs.client import load_trs_client
+from wfinterop.sessions import get_session
+from wfinterop.throttle import get_throttle
+from wfinterop.resilience import get_breaker
+from wfinterop.resilience import default_max_retries
+from wfinterop.resilience import is_transient
+from wfinterop.response_cache import service_cache
 from wfinterop.util import response_handler
 
 logger = logging.getLogger(__name__)
@@ -19,22 +33,144 @@ def _format_workflow_id(id):
         return urllib.quote_plus(id)
 
 
+def _response_with_headers(response):
+    """
+    Return the result of a bravado response future with the response
+    headers, or ``None`` if the response was "304 Not Modified".
+    """
+    try:
+        get_response = response.response
+    except AttributeError:
+        return response, {}
+    try:
+        response = get_response()
+    except HTTPNotModified:
+        return None
+    return response.result, response.metadata.incoming_response.headers
+
+
+def _unpack_bundle(archive_path, dest):
+    """
+    Unpack a zip archive of workflow files into ``dest``, replacing any
+    files unpacked there before.
+
+    :return: the paths of the unpacked files, relative to ``dest``
+    """
+    parent = os.path.dirname(dest)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    tmp_dest = tempfile.mkdtemp(dir=parent)
+    names = []
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if info.filename.endswith('/'):
+                    continue
+                name = os.path.normpath(info.filename)
+                if os.path.isabs(name) or name.startswith('..'):
+                    raise ValueError("Unsafe path '{}' in workflow bundle"
+                                     .format(info.filename))
+                path = os.path.join(tmp_dest, name)
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with archive.open(info) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                names.append(name)
+        if os.path.isdir(dest):
+            shutil.rmtree(dest)
+        os.rename(tmp_dest, dest)
+    except Exception:
+        shutil.rmtree(tmp_dest, ignore_errors=True)
+        raise
+    return names
+
+
 class TRS(object):
     """
     Build a :class:`TRS` instance for interacting with a server via
     the GA4GH Tool Registry Service RESTful API.
+
+    Calls are subject to the endpoint's ``rate_limit`` and
+    ``max_in_flight`` options (see :mod:`wfinterop.throttle`), and
+    are retried or skipped while the endpoint is failing (see
+    :mod:`wfinterop.resilience`). Responses about workflows are cached
+    on disk and revalidated with conditional requests (see
+    :mod:`wfinterop.trs.cache`).
     """
     def __init__(self, trs_id, api_client=None):
         if api_client is None:
             api_client = load_trs_client(service_id=trs_id)
         self.api_client = api_client
+        self.trs_id = trs_id
+        self.opts = trs_config().get(trs_id) or {}
+        self.throttle = get_throttle('trs', trs_id, self.opts)
+        self.breaker = get_breaker('trs', trs_id)
 
-    def get_metadata(self):
+    def _call(self, request, idempotent=True, handler=response_handler):
+        """
+        Make a request to the endpoint through its throttle and circuit
+        breaker, retrying idempotent requests after transient errors.
+        """
+        def attempt():
+            with self.throttle:
+                return handler(request())
+        return self.breaker.call(
+            attempt, retries=default_max_retries if idempotent else 0)
+
+    def _cached_call(self, operation, **params):
+        """
+        Return the result of a read-only API operation from the disk
+        cache, calling the endpoint (with a conditional request, if
+        the response was cached before) once it needs revalidating.
+        """
+        key = [self.trs_id, operation] + [
+            params.get(param)
+            for param in ['id', 'version_id', 'type', 'relative_path']]
+        entry = cache.load(key)
+        if entry is not None:
+            max_age = self.opts.get('cache_max_age')
+            if cache.offline or cache.is_fresh(entry, max_age):
+                return entry['result']
+        if cache.offline:
+            raise cache.TRSOfflineError(
+                "No cached response from '{}' for {}".format(self.trs_id,
+                                                             key[1:]))
+
+        def request():
+            return getattr(self.api_client, operation)(
+                _request_options={
+                    'headers': cache.conditional_headers(entry)},
+                **params)
+        try:
+            response = self._call(request, handler=_response_with_headers)
+        except Exception as e:
+            if entry is None or not is_transient(e):
+                raise
+            logger.warning("Serving cached response from '{}' after: {}"
+                           .format(self.trs_id, e))
+            return entry['result']
+        if response is None:
+            cache.touch(entry)
+            return entry['result']
+        result, headers = response
+        cache.store(key, result, headers)
+        return result
+
+    def get_metadata(self, refresh=False):
         """
         Return some metadata that is useful for describing the service.
+
+        The response is cached for the endpoint's ``cache_ttl`` seconds
+        (see :mod:`wfinterop.response_cache`), unless ``refresh`` is set.
         """
-        res = self.api_client.metadataGet()
-        return res.response().result
+        key = ('trs', self.trs_id, 'metadata')
+        if refresh:
+            service_cache.invalidate(key)
+        return service_cache.get(
+            key,
+            lambda: self._call(lambda: self.api_client.metadataGet()),
+            ttl=self.opts.get('cache_ttl'),
+            stale_ttl=self.opts.get('cache_stale_ttl'))
 
     def get_workflow(self, id):
         """
@@ -42,16 +178,14 @@ class TRS(object):
         ToolVersions nested inside it).
         """
         id = _format_workflow_id(id)
-        res = self.api_client.toolsIdGet(id=id)
-        return response_handler(res)
+        return self._cached_call('toolsIdGet', id=id)
 
     def get_workflow_versions(self, id):
         """
         Return all versions of the specified workflow.
         """
         id = _format_workflow_id(id=id)
-        res = self.api_client.toolsIdVersionsGet(id=id)
-        return response_handler(res)
+        return self._cached_call('toolsIdVersionsGet', id=id)
 
     def get_workflow_descriptor(self, id, version_id, type):
         """
@@ -59,12 +193,12 @@ class TRS(object):
         include CWL, WDL, or Nextflow documents).
         """
         id = _format_workflow_id(id)
-        res = self.api_client.toolsIdVersionsVersionIdTypeDescriptorGet(
+        return self._cached_call(
+            'toolsIdVersionsVersionIdTypeDescriptorGet',
             id=id,
             version_id=version_id,
             type=type
         )
-        return response_handler(res)
 
     def get_workflow_descriptor_relative(self,
                                          id,
@@ -75,13 +209,13 @@ class TRS(object):
         Return an additional tool descriptor file relative to the main file.
         """
         id = _format_workflow_id(id)
-        res = self.api_client.toolsIdVersionsVersionIdTypeDescriptorRelativePathGet(
+        return self._cached_call(
+            'toolsIdVersionsVersionIdTypeDescriptorRelativePathGet',
             id=id,
             version_id=version_id,
             type=type,
             relative_path=relative_path
         )
-        return response_handler(res)
 
     def get_workflow_tests(self, id, version_id, type):
         """
@@ -89,12 +223,12 @@ class TRS(object):
         workflow successfully) suitable for use with this descriptor type.
         """
         id = _format_workflow_id(id)
-        res = self.api_client.toolsIdVersionsVersionIdTypeTestsGet(
+        return self._cached_call(
+            'toolsIdVersionsVersionIdTypeTestsGet',
             id=id,
             version_id=version_id,
             type=type
         )
-        return response_handler(res)
 
     def get_workflow_files(self, id, version_id, type):
         """
@@ -102,9 +236,42 @@ class TRS(object):
         on file type.
         """
         id = _format_workflow_id(id)
-        res = self.api_client.toolsIdVersionsVersionIdTypeFilesGet(
+        return self._cached_call(
+            'toolsIdVersionsVersionIdTypeFilesGet',
             id=id,
             version_id=version_id,
             type=type
         )
-        return response_handler(res)
+
+    def get_workflow_bundle(self, id, version_id, type, dest):
+        """
+        Download all files of a workflow version as a single zip archive
+        and unpack them into the directory ``dest``.
+
+        :return: the paths of the unpacked files, relative to ``dest``
+        """
+        if cache.offline:
+            raise cache.TRSOfflineError(
+                "Can't download workflow bundle from '{}' offline"
+                .format(self.trs_id))
+        id = _format_workflow_id(id)
+        url = '{}://{}/api/ga4gh/v2/tools/{}/versions/{}/{}/files'.format(
+            self.opts['proto'], self.opts['host'], id,
+            urllib.quote(version_id, safe=''), type)
+        session = get_session(self.opts)
+        fd, archive_path = tempfile.mkstemp(suffix='.zip')
+
+        def download():
+            # stream the archive to disk rather than holding it in memory
+            response = session.get(url, headers=self.opts['auth'],
+                                   params={'format': 'zip'}, stream=True)
+            response.raise_for_status()
+            with open(archive_path, 'wb') as f:
+                for chunk in response.iter_content(64 * 1024):
+                    f.write(chunk)
+        try:
+            os.close(fd)
+            self._call(download)
+            return _unpack_bundle(archive_path, dest)
+        finally:
+            os.remove(archive_path)
@@ -1,35 +1,118 @@
+import logging
+import os
+import time
+import urllib
+from multiprocessing.pool import ThreadPool
+
+from wfinterop.blobs import get_blob_store
 from wfinterop.config import queue_config
 from wfinterop.config import set_yaml
+from wfinterop.config import modify_yaml
 from wfinterop.trs import TRS
 
+logger = logging.getLogger(__name__)
+
+workflow_dir = os.path.join(os.path.dirname(__file__), 'workflows')
+use_bundles = True
+fetch_workers = 8
+
+
+def _bundle_dir(wf_config):
+    return os.path.join(workflow_dir,
+                        *[urllib.quote(wf_config[key], safe='')
+                          for key in ['trs_id', 'workflow_id', 'version_id',
+                                      'workflow_type']])
+
+
+def _fetch_bundle(trs_instance, wf_config, workflow):
+    """
+    Download a workflow's files as one bundle into the local workflow
+    cache, and return local URLs for its primary and secondary
+    descriptors.
+    """
+    wf_files = trs_instance.get_workflow_files(**workflow)
+    dest = _bundle_dir(wf_config)
+    unpacked = set(trs_instance.get_workflow_bundle(dest=dest, **workflow))
+
+    def local_urls(file_type):
+        paths = [os.path.normpath(wf_file['path']) for wf_file in wf_files
+                 if wf_file['file_type'] == file_type]
+        missing = [path for path in paths if path not in unpacked]
+        if missing:
+            raise ValueError("Files {} missing from workflow bundle"
+                             .format(missing))
+        return ['file://' + os.path.join(dest, path) for path in paths]
+
+    primary = local_urls('PRIMARY_DESCRIPTOR')
+    if not primary:
+        raise ValueError("No primary descriptor in workflow file listing")
+    return primary[0], local_urls('SECONDARY_DESCRIPTOR')
+
+
+def _fetch_files(trs_instance, workflow):
+    """
+    Fetch a workflow's primary and secondary descriptors one by one, and
+    return their URLs.
+    """
+    def get_attachment(path):
+        return trs_instance.get_workflow_descriptor_relative(
+            relative_path=path, **workflow)
+
+    pool = ThreadPool(fetch_workers)
+    try:
+        wf_descriptor = pool.apply_async(
+            trs_instance.get_workflow_descriptor, kwds=workflow)
+        wf_files = trs_instance.get_workflow_files(**workflow)
+        attachment_paths = [wf_file['path'] for wf_file in wf_files
+                            if wf_file['file_type'] == 'SECONDARY_DESCRIPTOR']
+        # map keeps the attachments in the order they are listed
+        attachment_files = pool.map(get_attachment, attachment_paths)
+        workflow_url = wf_descriptor.get()['url']
+    finally:
+        pool.close()
+
+    wf_attachments = []
+    for attachment_file in attachment_files:
+        if attachment_file.get('descriptor') is not None:
+            # keep the content, so submissions needn't download it again
+            get_blob_store().put_url(attachment_file['url'],
+                                     content=attachment_file['descriptor'])
+        wf_attachments.append(attachment_file['url'])
+    return workflow_url, wf_attachments
+
 
 def fetch_queue_workflow(queue_id):
+    """
+    Look up the workflow for a queue in its TRS, storing the URL of its
+    descriptor and of any secondary descriptors to attach to runs.
+
+    With ``use_bundles`` set, all of the workflow's files are downloaded
+    in one zip archive and unpacked under ``workflow_dir``. If that
+    fails, the descriptor, file listing and secondary descriptors are
+    fetched concurrently instead, with up to ``fetch_workers`` requests
+    in flight.
+    """
+    start = time.time()
     wf_config = queue_config()[queue_id]
     trs_instance = TRS(wf_config['trs_id'])
-    wf_descriptor = trs_instance.get_workflow_descriptor(
-        id=wf_config['workflow_id'],
-        version_id=wf_config['version_id'],
-        type=wf_config['workflow_type']
-    )
-    wf_files = trs_instance.get_workflow_files(
-        id=wf_config['workflow_id'],
-        version_id=wf_config['version_id'],
-        type=wf_config['workflow_type']
-    )
-    wf_config['workflow_url'] = wf_descriptor['url']
-    attachment_paths = [wf_file['path'] for wf_file in wf_files
-                        if wf_file['file_type'] == 'SECONDARY_DESCRIPTOR']
-    wf_attachments = []
-    for attachment in attachment_paths:
-        attachment_file = trs_instance.get_workflow_descriptor_relative(
-            id=wf_config['workflow_id'],
-            version_id=wf_config['version_id'],
-            type=wf_config['workflow_type'],
-            relative_path=attachment
-        )
-        wf_attachments.append(attachment_file['url'])
-    wf_config['workflow_attachments'] = wf_attachments
+    workflow = {'id': wf_config['workflow_id'],
+                'version_id': wf_config['version_id'],
+                'type': wf_config['workflow_type']}
+    fetched = None
+    if use_bundles:
+        try:
+            fetched = _fetch_bundle(trs_instance, wf_config, workflow)
+        except Exception:
+            logger.warning("Couldn't fetch workflow bundle for '{}'; "
+                           "fetching files one by one".format(queue_id),
+                           exc_info=True)
+    if fetched is None:
+        fetched = _fetch_files(trs_instance, workflow)
+    wf_config['workflow_url'], wf_config['workflow_attachments'] = fetched
     set_yaml('queues', queue_id, wf_config)
+    logger.info("Fetched workflow for '{}' with {} attachments in {:.2f}s"
+                .format(queue_id, len(wf_config['workflow_attachments']),
+                        time.time() - start))
     return wf_config
 
 
@@ -37,9 +120,10 @@ def store_verification(queue_id, wes_id):
     """
     Record checker status for selected workflow and environment.
     """
-    wf_config = queue_config()[queue_id]
-    wf_config.setdefault('wes_verified', []).append(wes_id)
-    set_yaml('queues', queue_id, wf_config)
+    def add_verified(wf_config):
+        wf_config.setdefault('wes_verified', []).append(wes_id)
+        return wf_config
+    modify_yaml('queues', queue_id, add_verified)
 
 
 # def post_verification(self, id, version_id, type, relative_path, requests):
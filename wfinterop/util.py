@@ -1,8 +1,21 @@
+import os
 import json
+import hashlib
 import yaml
 import logging
+import tempfile
+import threading
 import datetime as dt
 
+# use the libyaml bindings when PyYAML was built with them
+_YamlLoader = getattr(yaml, 'CLoader', yaml.Loader)
+_YamlDumper = getattr(yaml, 'CDumper', yaml.Dumper)
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -16,14 +29,15 @@ def heredoc(s, inputs_dict):
 def get_yaml(filepath):
     try:
         with open(filepath, 'r') as f:
-            return yaml.load(f)
+            return yaml.load(f, Loader=_YamlLoader)
     except IOError:
         logger.exception("No file found.  Please create: %s." % filepath)
 
 
 def save_yaml(filepath, app_config):
-    with open(filepath, 'w') as f:
-        yaml.dump(app_config, f, default_flow_style=False)
+    with _atomic_write(filepath) as f:
+        yaml.dump(app_config, f, default_flow_style=False,
+                  Dumper=_YamlDumper)
 
 
 def get_json(filepath):
@@ -35,15 +49,157 @@ def get_json(filepath):
 
 
 def save_json(filepath, app_config):
-    with open(filepath, 'w') as f:
+    with _atomic_write(filepath) as f:
         json.dump(app_config, f, indent=4)
 
 
+class _atomic_write(object):
+    """
+    Write a file by way of a temporary file in the same directory,
+    renamed over the target on success, so readers never see a
+    partially written file.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+    def __enter__(self):
+        dirname = os.path.dirname(os.path.abspath(self.filepath))
+        fd, self.tmp_path = tempfile.mkstemp(
+            dir=dirname, prefix='.{}.'.format(os.path.basename(self.filepath)))
+        self.f = os.fdopen(fd, 'w')
+        return self.f
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.f.flush()
+                os.fsync(self.f.fileno())
+            self.f.close()
+            if exc_type is None:
+                if os.path.exists(self.filepath):
+                    os.chmod(self.tmp_path,
+                             os.stat(self.filepath).st_mode & 0o777)
+                else:
+                    os.chmod(self.tmp_path, 0o644)
+                os.rename(self.tmp_path, self.filepath)
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+class _FileLock(object):
+    """
+    Advisory lock on ``<filepath>.lock``, shared by all threads of a
+    process and re-entrant within a thread.
+    """
+    def __init__(self, filepath):
+        self.lock_path = '{}.lock'.format(filepath)
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.lock_file = None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0 and fcntl is not None:
+            try:
+                self.lock_file = open(self.lock_path, 'a')
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+            except Exception:
+                if self.lock_file is not None:
+                    self.lock_file.close()
+                    self.lock_file = None
+                self.thread_lock.release()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth == 0 and self.lock_file is not None:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+        self.thread_lock.release()
+
+
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+
+def file_lock(filepath):
+    """
+    Return a context manager holding an exclusive advisory lock for
+    ``filepath`` across processes (and threads of this process).
+    """
+    filepath = os.path.abspath(filepath)
+    with _file_locks_guard:
+        if filepath not in _file_locks:
+            _file_locks[filepath] = _FileLock(filepath)
+        return _file_locks[filepath]
+
+
+def iter_documents(filepath):
+    """
+    Stream the documents in a JSON Lines (one JSON document per line)
+    or YAML file; a YAML file may hold several documents separated by
+    ``---``, or a single list of documents.
+    """
+    with open(filepath, 'r') as f:
+        if filepath.endswith(('.yaml', '.yml')):
+            for doc in yaml.safe_load_all(f):
+                if isinstance(doc, list):
+                    for item in doc:
+                        yield item
+                elif doc is not None:
+                    yield doc
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def iter_workflow_params(filepath):
+    """
+    Stream the documents in a file (see :func:`iter_documents`) as
+    ``workflow_params`` for WES requests: a JSON string, unless the
+    document is already a string (e.g., the URL of a params file).
+    """
+    for doc in iter_documents(filepath):
+        if isinstance(doc, (str, type(u''))):
+            yield doc
+        else:
+            yield json.dumps(doc)
+
+
+def file_signature(filepath):
+    """
+    Return a tuple identifying the current version of a file on disk,
+    which changes whenever the file is rewritten or replaced.
+    """
+    stat = os.stat(filepath)
+    return (stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+def config_hash(opts):
+    """
+    Return a string that changes whenever a (JSON-serializable) config
+    entry changes, e.g. to tell whether a cached client is still valid.
+    """
+    return hashlib.sha1(
+        json.dumps(opts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
 def response_handler(response):
+    """
+    Return the result of a bravado response future, or ``response``
+    itself if it is already a result. Errors from the request are
+    raised.
+    """
     try:
-        return response.response().result
-    except:
+        get_response = response.response
+    except AttributeError:
         return response
+    return get_response().result
 
 
 def ctime2datetime(time_str):
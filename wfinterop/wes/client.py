@@ -1,14 +1,23 @@
 import logging
 import os
+import threading
 
 from bravado.requests_client import RequestsClient
 from bravado.swagger_model import Loader
 from bravado.client import SwaggerClient
 
 from wfinterop.config import wes_config
+from wfinterop.util import config_hash
+from wfinterop.sessions import get_session
+from wfinterop.wes.upload import post_run
 
 logger = logging.getLogger(__name__)
 
+# clients built with the default HTTP client, reused for the lifetime of
+# the process: {cache key: (config hash, client)}
+_clients = {}
+_clients_lock = threading.Lock()
+
 
 def _get_wes_opts(service_id):
     """
@@ -19,7 +28,8 @@ def _get_wes_opts(service_id):
 
 def _init_http_client(service_id=None, opts=None):
     """
-    Initialize and configure HTTP requests client for selected service.
+    Initialize and configure HTTP requests client for selected service,
+    sharing the pooled keep-alive session for its host.
     """
     auth_header = {'token': 'Authorization',
                    'api_key': 'X-API-KEY',
@@ -28,6 +38,7 @@ def _init_http_client(service_id=None, opts=None):
         opts = _get_wes_opts(service_id)
 
     http_client = RequestsClient()
+    http_client.session = get_session(opts)
     http_client.set_api_key(host=opts['host'],
                             api_key=opts['auth'],
                             # param_name=auth_header[opts['auth_type']],
@@ -55,54 +66,81 @@ class WESInterface:
         pass
 
 
-class WESAdapter(WESInterface):
+class DirectWESClient(WESInterface):
     """
-    Adapter class for the WES client functionality from the
-    workflow-service library.
+    Lightweight WES client that calls the API directly over the shared
+    keep-alive session of the service's host, decoding responses as
+    plain JSON without validating them against the API spec.
     """
-    _wes_client = None
-
-    def __init__(self, wes_client):
-        self._wes_client = wes_client
+    def __init__(self, opts):
+        self.base_url = '{}://{}/ga4gh/wes/v1'.format(opts['proto'],
+                                                      opts['host'])
+        self.headers = opts['auth']
+        self.session = get_session(opts)
+        self.chunk_size = opts.get('upload_chunk_size')
+        self.use_mmap = opts.get('upload_mmap', False)
+
+    def _request(self, method, path, **kwargs):
+        response = self.session.request(method, self.base_url + path,
+                                        headers=self.headers, **kwargs)
+        response.raise_for_status()
+        return response.json()
 
     def GetServiceInfo(self):
-        return self._wes_client.get_service_info()
+        return self._request('GET', '/service-info')
 
-    def ListRuns(self):
-        return self._wes_client.list_runs()
+    def ListRuns(self, page_size=None, page_token=None):
+        params = {'page_size': page_size, 'page_token': page_token}
+        return self._request('GET', '/runs',
+                             params={k: v for k, v in params.items()
+                                     if v is not None})
 
     def RunWorkflow(self, request):
-        return self._wes_client.run(wf=request['workflow_url'],
-                                    jsonyaml=request['workflow_params'],
-                                    attachments=request['attachment'])
+        response, upload = post_run(self.session, self.base_url + '/runs',
+                                    request,
+                                    headers=self.headers,
+                                    chunk_size=self.chunk_size,
+                                    use_mmap=self.use_mmap)
+        response.raise_for_status()
+        run_log = response.json()
+        run_log['upload'] = upload
+        return run_log
 
     def CancelRun(self, run_id):
-        return self._wes_client.cancel(run_id=run_id)
+        return self._request('POST', '/runs/{}/cancel'.format(run_id))
 
     def GetRunStatus(self, run_id):
-        return self._wes_client.get_run_status(run_id=run_id)
+        return self._request('GET', '/runs/{}/status'.format(run_id))
 
     def GetRunLog(self, run_id):
-        return self._wes_client.get_run_log(run_id=run_id)
+        return self._request('GET', '/runs/{}'.format(run_id))
 
 
-def load_wes_client(service_id, http_client=None, client_library=None):
+class WESAdapter(DirectWESClient):
     """
-    Return an API client for the selected workflow execution service.
+    Client for the ``'workflow-service'`` client library.
+
+    It sends the same requests as the workflow-service library's
+    ``WESClient`` (the same URLs, auth headers and form fields, built
+    with ``wes_client.util.build_wes_request``), but through
+    :class:`DirectWESClient`. That way calls reuse the host's pooled
+    session, with the service's pool options, and attachments are
+    streamed rather than read into memory first.
     """
-    if http_client is None:
-        http_client = _init_http_client(service_id=service_id)
+    pass
 
-    if client_library is not None:
-        from wes_client.util import WESClient
-        wes_client = WESClient(service=_get_wes_opts(service_id))
-        return WESAdapter(wes_client)
+
+def _build_wes_client(service_id, opts, http_client, client_library):
+    if client_library == 'direct':
+        return DirectWESClient(opts)
+
+    if client_library not in (None, 'bravado'):
+        return WESAdapter(opts)
 
     spec_path = os.path.join(os.path.dirname(os.path.dirname(__file__)),
                              'workflow_execution_service.swagger.yaml')
     spec_path = os.path.abspath(spec_path)
 
-    opts = _get_wes_opts(service_id)
     api_url = '{}://{}'.format(opts['proto'], opts['host'])
 
     loader = Loader(http_client, request_headers=None)
@@ -114,3 +152,48 @@ def load_wes_client(service_id, http_client=None, client_library=None):
                                           config={'use_models': False})
 
     return spec_client.WorkflowExecutionService
+
+
+def load_wes_client(service_id, http_client=None, client_library=None):
+    """
+    Return an API client for the selected workflow execution service.
+
+    The client library is the ``client_library`` option of the service,
+    if set, or else ``client_library``: ``'direct'`` for
+    :class:`DirectWESClient`, ``None`` or ``'bravado'`` for a client
+    generated from the API spec, or ``'workflow-service'`` for
+    :class:`WESAdapter`.
+
+    Unless a custom ``http_client`` is given, the client is built once
+    per process and reused until the service's config changes (or
+    :func:`invalidate_wes_client` is called).
+    """
+    opts = _get_wes_opts(service_id)
+    client_library = opts.get('client_library') or client_library
+    if http_client is not None:
+        return _build_wes_client(service_id, opts, http_client,
+                                 client_library)
+
+    key = (service_id, client_library)
+    opts_hash = config_hash(opts)
+    with _clients_lock:
+        cached = _clients.get(key)
+        if cached is None or cached[0] != opts_hash:
+            logger.debug("Building WES client for '{}'".format(service_id))
+            http_client = _init_http_client(opts=opts)
+            cached = (opts_hash, _build_wes_client(service_id, opts,
+                                                   http_client,
+                                                   client_library))
+            _clients[key] = cached
+    return cached[1]
+
+
+def invalidate_wes_client(service_id=None):
+    """
+    Drop cached clients for a workflow execution service (or for all
+    services, if none is given), so they are built again on next use.
+    """
+    with _clients_lock:
+        for key in list(_clients):
+            if service_id is None or key[0] == service_id:
+                del _clients[key]
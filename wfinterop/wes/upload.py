@@ -0,0 +1,232 @@
+"""
+Streaming multipart bodies for uploading workflow attachments.
+
+Rather than encoding the whole ``multipart/form-data`` body in memory
+(as ``requests`` does for ``files=``), :class:`MultipartStream` reads
+each attachment in chunks as the request is sent, so memory use stays
+bounded however large the attachments are. Attachments on disk can
+optionally be memory-mapped instead of read through a file buffer.
+"""
+import logging
+import mmap
+import os
+import stat
+import time
+import uuid
+
+from requests.compat import urlparse
+
+from wfinterop.blobs import get_blob_store
+
+logger = logging.getLogger(__name__)
+
+default_chunk_size = 64 * 1024
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+class _Segment(object):
+    """
+    A piece of the body: either bytes held in memory or an open file
+    (or memory map) read from its current position.
+    """
+    def __init__(self, data=None, fileobj=None, size=None, mapped=None,
+                 start=0):
+        self.data = data
+        self.fileobj = fileobj
+        self.mapped = mapped
+        self.size = len(data) if data is not None else size
+        self.start = start
+        self.offset = 0
+
+    def read(self, size):
+        size = min(size, self.size - self.offset)
+        if self.data is not None:
+            chunk = self.data[self.offset:self.offset + size]
+        elif self.mapped is not None:
+            start = self.start + self.offset
+            chunk = self.mapped[start:start + size]
+        else:
+            chunk = self.fileobj.read(size)
+        self.offset += len(chunk)
+        return chunk
+
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+
+
+class MultipartStream(object):
+    """
+    File-like ``multipart/form-data`` body for a list of form parts, as
+    returned by :func:`wes_client.util.build_wes_request`: each part is
+    ``(name, value)`` for a form field or ``(name, (filename, file))``
+    for an attachment, where ``file`` is an open binary file or bytes.
+
+    The length of the body is known up front (``len``), so it is sent
+    with a ``Content-Length`` header rather than chunked encoding.
+    After the body has been read, :meth:`stats` reports the upload
+    throughput.
+    """
+    def __init__(self, parts, chunk_size=None, use_mmap=False):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary={}'.format(
+            self.boundary)
+        self.chunk_size = chunk_size or default_chunk_size
+        self.use_mmap = use_mmap
+        self._files = []
+        self._segments = []
+        for name, value in parts:
+            if isinstance(value, tuple):
+                filename, content = value
+                self._add(self._header(name, filename))
+                self._add_file(content)
+            else:
+                self._add(self._header(name))
+                self._add(_to_bytes(value))
+            self._add(b'\r\n')
+        self._add(_to_bytes('--{}--\r\n'.format(self.boundary)))
+        self.len = sum(segment.size for segment in self._segments)
+        self._index = 0
+        self._sent = 0
+        self._started = None
+        self._finished = None
+
+    def _header(self, name, filename=None):
+        disposition = 'form-data; name="{}"'.format(name)
+        if filename is not None:
+            disposition += '; filename="{}"'.format(filename)
+        return _to_bytes('--{}\r\nContent-Disposition: {}\r\n\r\n'
+                         .format(self.boundary, disposition))
+
+    def _add(self, data):
+        self._segments.append(_Segment(data=data))
+
+    def _add_file(self, content):
+        if not hasattr(content, 'read'):
+            self._add(_to_bytes(content))
+            return
+        self._files.append(content)
+        try:
+            file_stat = os.fstat(content.fileno())
+        except (AttributeError, IOError, OSError, ValueError):
+            file_stat = None
+        if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+            # size unknown (e.g., a remote attachment), so read it now
+            self._add(content.read())
+            return
+        position = content.tell()
+        size = file_stat.st_size - position
+        mapped = None
+        if self.use_mmap and size:
+            mapped = mmap.mmap(content.fileno(), 0,
+                               access=mmap.ACCESS_READ)
+        self._segments.append(_Segment(fileobj=content, size=size,
+                                       mapped=mapped, start=position))
+
+    def __len__(self):
+        return self.len
+
+    def read(self, size=-1):
+        """
+        Return the next chunk of the body, at most ``size`` and
+        ``chunk_size`` bytes; an empty string once it is exhausted.
+        """
+        if self._started is None:
+            self._started = time.time()
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+        while self._index < len(self._segments):
+            chunk = self._segments[self._index].read(size)
+            if chunk:
+                self._sent += len(chunk)
+                return chunk
+            self._index += 1
+        if self._finished is None:
+            self._finished = time.time()
+        return b''
+
+    def stats(self):
+        """
+        Return the number of bytes sent, the seconds spent sending them
+        and the resulting throughput (bytes per second).
+        """
+        end = self._finished or time.time()
+        seconds = end - self._started if self._started else 0.0
+        return {'bytes': self._sent,
+                'seconds': round(seconds, 3),
+                'bytes_per_second': (int(self._sent / seconds)
+                                     if seconds else None)}
+
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+        for fileobj in self._files:
+            fileobj.close()
+
+
+def _attachment_parts(request):
+    """
+    Return the form parts for a request's attachments, read from the
+    blob cache (see :mod:`wfinterop.blobs`) so that files are only
+    downloaded or hashed again when they change.
+    """
+    from wes_client.util import expand_globs
+    params = request['workflow_params']
+    workflow_url = request['workflow_url']
+    # attachments of a local workflow (e.g., unpacked from a TRS bundle)
+    # are named relative to it, so its imports resolve on the server;
+    # otherwise use the same base directory as the workflow-service
+    # client
+    if ':' not in workflow_url or workflow_url.startswith('file://'):
+        base = os.path.dirname(workflow_url.replace('file://', '', 1))
+    elif params.startswith('file://'):
+        base = os.path.dirname(params[7:])
+    else:
+        base = os.getcwd()
+    store = get_blob_store()
+    parts = []
+    for attachment in sorted(expand_globs(request['attachment'] or [])):
+        digest = store.resolve(attachment)
+        if attachment.startswith('file://'):
+            name = os.path.relpath(attachment[7:], base)
+        else:
+            name = os.path.basename(urlparse(attachment).path)
+        parts.append(('workflow_attachment',
+                      (name, open(store.blob_path(digest), 'rb'))))
+    return parts
+
+
+def post_run(session, url, request, headers=None, chunk_size=None,
+             use_mmap=False):
+    """
+    Send a ``RunWorkflow`` request to ``url`` over ``session`` with a
+    streaming body, using the same form fields as the workflow-service
+    client.
+
+    :return: the response, and the upload stats for the request body
+    """
+    from wes_client.util import build_wes_request
+    parts = build_wes_request(request['workflow_url'],
+                              request['workflow_params'])
+    try:
+        parts += _attachment_parts(request)
+    except Exception:
+        for _, value in parts:
+            if isinstance(value, tuple):
+                value[1].close()
+        raise
+    body = MultipartStream(parts, chunk_size=chunk_size, use_mmap=use_mmap)
+    headers = dict(headers or {}, **{'Content-Type': body.content_type})
+    try:
+        response = session.post(url, data=body, headers=headers)
+    finally:
+        body.close()
+    stats = body.stats()
+    logger.info("Uploaded {} bytes to {} in {}s"
+                .format(stats['bytes'], url, stats['seconds']))
+    return response, stats
@@ -1,6 +1,11 @@
 import logging
 
+from wfinterop.config import wes_config
 from wfinterop.wes.client import load_wes_client
+from wfinterop.throttle import get_throttle
+from wfinterop.resilience import get_breaker
+from wfinterop.resilience import default_max_retries
+from wfinterop.response_cache import service_cache
 from wfinterop.util import response_handler
 
 logger = logging.getLogger(__name__)
@@ -12,52 +17,95 @@ class WES(object):
     """
     Build a :class:`WES` instance for interacting with a server via
     the GA4GH Worflow Execution Service RESTful API.
+
+    Calls are subject to the endpoint's ``rate_limit`` and
+    ``max_in_flight`` options (see :mod:`wfinterop.throttle`), and
+    are retried or skipped while the endpoint is failing (see
+    :mod:`wfinterop.resilience`).
     """
     def __init__(self, wes_id, api_client=None):
         if api_client is None:
             api_client = load_wes_client(service_id=wes_id,
                                          client_library=wes_client)
         self.api_client = api_client
+        self.wes_id = wes_id
+        self.opts = wes_config().get(wes_id) or {}
+        self.throttle = get_throttle('wes', wes_id, self.opts)
+        self.breaker = get_breaker('wes', wes_id)
+
+    def _call(self, request, idempotent=True):
+        """
+        Make a request to the endpoint through its throttle and circuit
+        breaker, retrying idempotent requests after transient errors.
+        """
+        def attempt():
+            with self.throttle:
+                return response_handler(request())
+        return self.breaker.call(
+            attempt, retries=default_max_retries if idempotent else 0)
 
-    def get_service_info(self):
+    def get_service_info(self, refresh=False):
         """
         Get information about Workflow Execution Service.
+
+        The response is cached for the endpoint's ``cache_ttl`` seconds
+        (see :mod:`wfinterop.response_cache`), unless ``refresh`` is set.
+        """
+        key = ('wes', self.wes_id, 'service_info')
+        if refresh:
+            service_cache.invalidate(key)
+        return service_cache.get(
+            key,
+            lambda: self._call(lambda: self.api_client.GetServiceInfo()),
+            ttl=self.opts.get('cache_ttl'),
+            stale_ttl=self.opts.get('cache_stale_ttl'))
+
+    def list_runs(self, page_size=None, page_token=None):
+        """
+        List the workflow runs in order of oldest to newest, one page
+        at a time (starting at ``page_token``, if given).
         """
-        res = self.api_client.GetServiceInfo()
-        return response_handler(res)
+        params = {'page_size': page_size, 'page_token': page_token}
+        return self._call(lambda: self.api_client.ListRuns(
+            **{k: v for k, v in params.items() if v is not None}))
 
-    def list_runs(self):
+    def iter_runs(self, page_size=None):
         """
-        List all the workflow runs in order of oldest to newest.
+        Yield all workflow runs, following ``next_page_token`` across
+        pages of :meth:`list_runs`.
         """
-        res = self.api_client.ListRuns()
-        return response_handler(res)
+        page_token = None
+        while True:
+            page = self.list_runs(page_size=page_size,
+                                  page_token=page_token)
+            for run in page.get('runs') or []:
+                yield run
+            page_token = page.get('next_page_token')
+            if not page_token:
+                return
 
     def run_workflow(self, request):
         """
         Create a new workflow run and retrieve its tracking ID
         to monitor its progress.
         """
-        res = self.api_client.RunWorkflow(request)
-        return response_handler(res)
+        return self._call(lambda: self.api_client.RunWorkflow(request),
+                          idempotent=False)
 
     def cancel_run(self, id):
         """
         Cancel a running workflow.
         """
-        res = self.api_client.CancelRun(id)
-        return response_handler(res)
+        return self._call(lambda: self.api_client.CancelRun(run_id=id))
 
     def get_run(self, id):
         """
         Get detailed info about a workflow run.
         """
-        res = self.api_client.GetRunLog(id)
-        return response_handler(res)
+        return self._call(lambda: self.api_client.GetRunLog(run_id=id))
 
     def get_run_status(self, id):
         """
         Get quick status info about a workflow run.
         """
-        res = self.api_client.GetRunStatus(id)
-        return response_handler(res)
+        return self._call(lambda: self.api_client.GetRunStatus(run_id=id))